@@ -1 +1,199 @@
 """The configuration for py.test."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from os import environ
+from subprocess import PIPE, run  # nosec
+from threading import Thread
+from typing import Final, Generator, Mapping
+
+import pytest
+from pycommons.io.path import Path
+from pycommons.io.temp import temp_dir
+from pycommons.processes.shell import Command
+
+from texgit.repository.git import git
+
+
+class LocalGitServer:
+    """A local stand-in for a git hosting service, speaking smart http."""
+
+    def __init__(self, root: Path, url: str) -> None:
+        """
+        Create the server information record.
+
+        :param root: the directory with the repositories
+        :param url: the base url of the server
+        """
+        #: the directory with the repositories
+        self.root: Final[Path] = root
+        #: the base url of the server
+        self.url: Final[str] = url
+
+    def make_repo(self, name: str, files: Mapping[str, str]) -> str:
+        """
+        Create a repository with a single commit containing some files.
+
+        :param name: the relative path of the repository on the server
+        :param files: a mapping of relative file paths to file contents
+        :return: the url of the repository
+        """
+        path: Final[Path] = self.root.resolve_inside(name)
+        path.ensure_dir_exists()
+        gt: Final[Path] = git()
+        Command([gt, "init", "-q", path], working_dir=path).execute(False)
+        for file, content in files.items():
+            dest = path.resolve_inside(file)
+            dest.ensure_parent_dir_exists()
+            dest.write_all_str(content)
+        Command([gt, "-C", path, "add", "-A"], working_dir=path).execute(
+            False)
+        Command([gt, "-C", path, "-c", "user.name=t", "-c",
+                 "user.email=t@t", "commit", "-q", "-m", "init"],
+                working_dir=path).execute(False)
+        return f"{self.url}/{name}"
+
+
+class _GitHandler(BaseHTTPRequestHandler):
+    """A request handler forwarding to `git http-backend`."""
+
+    #: the root directory of the repositories
+    root: str
+
+    def __backend(self) -> None:
+        """Run `git http-backend` for the current request."""
+        path, _, query = self.path.partition("?")
+        env: dict[str, str] = dict(environ)
+        env.update({
+            "GIT_PROJECT_ROOT": self.root, "GIT_HTTP_EXPORT_ALL": "1",
+            "REQUEST_METHOD": self.command, "PATH_INFO": path,
+            "QUERY_STRING": query, "REMOTE_ADDR": "127.0.0.1",
+            "CONTENT_TYPE": self.headers.get("Content-Type", ""),
+            "GIT_PROTOCOL": self.headers.get("Git-Protocol", ""),
+            "HTTP_CONTENT_ENCODING": self.headers.get(
+                "Content-Encoding", "")})
+        length: int = int(self.headers.get("Content-Length", "0"))
+        if length > 0:
+            env["CONTENT_LENGTH"] = str(length)
+        body: bytes = self.rfile.read(length) if length > 0 else b""
+        result = run([str(git()), "http-backend"],  # nosec # noqa: S603
+                     input=body, stdout=PIPE, env=env, check=False)
+        head, _, content = result.stdout.partition(b"\r\n\r\n")
+        headers: list[tuple[str, str]] = []
+        status: int = 200
+        for line in head.decode().split("\r\n"):
+            key, _, value = line.partition(":")
+            if key.lower() == "status":
+                status = int(value.strip().split(" ")[0])
+            elif key:
+                headers.append((key, value.strip()))
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def __archive(self, repo: str, ref: str) -> None:
+        """
+        Serve a `tar.gz` archive of a repository, like GitHub does.
+
+        :param repo: the repository path
+        :param ref: the reference to archive
+        """
+        name: str = repo.rsplit("/", maxsplit=1)[-1]
+        result = run([str(git()), "-C", f"{self.root}/{repo}",  # nosec
+                      "archive", "--format=tar.gz",  # noqa: S603
+                      f"--prefix={name}-{ref}/", ref],
+                     stdout=PIPE, check=False)
+        self.send_response(200 if result.returncode == 0 else 404)
+        self.send_header("Content-Length", str(len(result.stdout)))
+        self.end_headers()
+        self.wfile.write(result.stdout)
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Handle a GET request."""
+        repo, sep, ref = self.path.partition("/archive/")
+        if sep and ref.endswith(".tar.gz"):
+            self.__archive(repo.strip("/"), ref[:-7])
+        else:
+            self.__backend()
+
+    def do_POST(self) -> None:  # noqa: N802
+        """Handle a POST request."""
+        self.__backend()
+
+    def log_message(self, *_) -> None:
+        """Do not log anything."""
+
+
+class _FileHandler(BaseHTTPRequestHandler):
+    """A request handler serving and storing plain files."""
+
+    #: the root directory of the files
+    root: Path
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Handle a GET request."""
+        path: Path = self.root.resolve_inside(self.path.strip("/"))
+        if not path.is_file():
+            self.send_error(404)
+            return
+        with open(path, "rb") as stream:
+            content: bytes = stream.read()
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_PUT(self) -> None:  # noqa: N802
+        """Handle a PUT request."""
+        path: Path = self.root.resolve_inside(self.path.strip("/"))
+        path.ensure_parent_dir_exists()
+        with open(path, "wb") as stream:
+            stream.write(self.rfile.read(int(self.headers.get(
+                "Content-Length", "0"))))
+        self.send_response(201)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *_) -> None:
+        """Do not log anything."""
+
+
+@pytest.fixture
+def file_server() -> Generator[tuple[Path, str], None, None]:
+    """
+    Provide a local server storing files via PUT and serving them via GET.
+
+    :return: the directory with the files and the url of the server
+    """
+    with temp_dir() as td:
+        handler = type("Handler", (_FileHandler, ), {"root": td})
+        with ThreadingHTTPServer(("127.0.0.1", 0), handler) as server:
+            thread = Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                yield td, f"http://127.0.0.1:{server.server_address[1]}"
+            finally:
+                server.shutdown()
+                thread.join()
+
+
+@pytest.fixture
+def git_server() -> Generator[LocalGitServer, None, None]:
+    """
+    Provide a local git server for the duration of a test.
+
+    :return: the local git server
+    """
+    with temp_dir() as td:
+        handler = type("Handler", (_GitHandler, ), {"root": str(td)})
+        with ThreadingHTTPServer(("127.0.0.1", 0), handler) as server:
+            thread = Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            try:
+                yield LocalGitServer(
+                    td, f"http://127.0.0.1:{server.server_address[1]}")
+            finally:
+                server.shutdown()
+                thread.join()
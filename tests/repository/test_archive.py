@@ -0,0 +1,77 @@
+"""Test fetching repositories as archives."""
+
+import pytest
+from pycommons.io.temp import temp_dir
+
+from conftest import LocalGitServer
+from texgit.repository.archive import (
+    ARCHIVE_FILE,
+    download_archive,
+    extract_from_archive,
+)
+from texgit.repository.git import GitRepository
+from texgit.repository.git_manager import GitManager
+
+
+def test_git_manager_archives(git_server: LocalGitServer) -> None:
+    """Test the git manager with archives instead of clones."""
+    url: str = git_server.make_repo("u/r", {
+        "README.md": "# R\n", "a/b.txt": "b\n", "a/c/d.txt": "d\n",
+        "e.txt": "e\n"})
+    mirror = git_server.root.resolve_inside("u/r")
+    commit: str = GitRepository.from_local(mirror, url).commit
+    with temp_dir() as td:
+        with GitManager(td, fetch_archives=True,
+                        mirrors={url: [mirror]}) as gm:
+            gp = gm.get_git_file(url, "a/b.txt")
+            assert gp.path.read_all_str() == "b\n"
+            assert gp.repo.commit == commit
+            assert gp.url == f"{url}/a/b.txt"
+            assert not gp.repo.path.resolve_inside("a/c").exists()
+            assert not gp.repo.path.resolve_inside("e.txt").exists()
+            assert not gp.repo.path.resolve_inside(".git").exists()
+            gd = gm.get_git_dir(url, "a")
+            assert gd.path.resolve_inside("c/d.txt").read_all_str() == "d\n"
+            assert not gp.repo.path.resolve_inside("e.txt").exists()
+
+        with GitManager(td) as gm:
+            gp2 = gm.get_git_file(f"{url}.git", "e.txt")
+            assert gp2.repo == gp.repo
+            assert gp2.path.read_all_str() == "e\n"
+            assert len(gm.list_realm("git")) == 1
+
+
+def test_download_archive_remote(git_server: LocalGitServer) -> None:
+    """Test fetching an archive via `git archive --remote`."""
+    url: str = git_server.make_repo("v/w", {"x/y.txt": "y\n"})
+    mirror = git_server.root.resolve_inside("v/w")
+    with temp_dir() as td:
+        repo = download_archive(url, td, mirror)
+        assert repo.commit == GitRepository.from_local(mirror, url).commit
+        assert extract_from_archive(repo, "x")
+        assert not extract_from_archive(repo, "x/y.txt")
+        assert td.resolve_inside("x/y.txt").read_all_str() == "y\n"
+
+
+def test_download_archive_http(git_server: LocalGitServer) -> None:
+    """Test fetching an archive from an explicit `http` archive url."""
+    url: str = git_server.make_repo("p/q", {"a/b.txt": "b\n", "c.txt": "c"})
+    with temp_dir() as td:
+        repo = download_archive(url, td, f"{url}/archive/HEAD.tar.gz")
+        assert extract_from_archive(repo, "a/b.txt")
+        assert td.resolve_inside("a/b.txt").read_all_str() == "b\n"
+        assert not td.resolve_inside("c.txt").exists()
+
+
+def test_git_manager_archives_clone(git_server: LocalGitServer) -> None:
+    """Test cloning repositories that offer no archives."""
+    url: str = git_server.make_repo("s/t", {"a.txt": "a\n"})
+    with temp_dir() as td:
+        with pytest.raises(ValueError, match="No archive url"):
+            download_archive(url, td)
+        assert not list(td.list_dir())
+        with GitManager(td, fetch_archives=True) as gm:
+            gp = gm.get_git_file(url, "a.txt")
+            assert gp.path.read_all_str() == "a\n"
+            assert gp.repo.path.resolve_inside(".git").is_dir()
+            assert not gp.repo.path.resolve_inside(ARCHIVE_FILE).exists()
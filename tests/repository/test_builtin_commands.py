@@ -0,0 +1,48 @@
+"""Test the builtin commands."""
+
+from subprocess import PIPE, run  # nosec
+
+import pytest
+from pycommons.io.path import Path
+from pycommons.processes.python import PYTHON_ENV, PYTHON_INTERPRETER
+
+import texgit
+from texgit.repository.builtin_commands import find_builtin, run_builtin
+
+#: the code to format
+_CODE: str = '''from typing import Final
+
+def f( x : int ) -> int:
+    """The function."""
+    # start
+    y : Final[int] = x*2 # double
+    return y
+    # end
+'''
+
+
+def test_builtin_formatter_matches_process() -> None:
+    """Test that the builtin formatter produces the same output."""
+    for args in ([], ["--args", "doc,comments"], ["--args", "hints"],
+                 ["--args", "format"], ["--version"], ["--help"]):
+        cmd: list[str] = ["python3", "-m", "texgit.formatters.python", *args]
+        builtin = find_builtin(cmd)
+        assert builtin is not None
+        expected: str = run(  # nosec
+            [PYTHON_INTERPRETER, *cmd[1:]], input=_CODE, stdout=PIPE,
+            cwd=Path(texgit.__file__).up(2), env=PYTHON_ENV, text=True,
+            check=True).stdout
+        assert run_builtin(builtin, cmd, _CODE) == expected
+
+
+def test_builtin_errors() -> None:
+    """Test that errors of builtin commands are reported as ValueError."""
+    cmd: list[str] = ["python3", "-m", "texgit.formatters.python"]
+    builtin = find_builtin([*cmd, "--unknown"])
+    assert builtin is not None
+    with pytest.raises(ValueError, match="exit code 2"):
+        run_builtin(builtin, [*cmd, "--unknown"], _CODE)
+    builtin = find_builtin([*cmd, "--labels", "start"])
+    assert builtin is not None
+    with pytest.raises(ValueError, match="failed"):
+        run_builtin(builtin, [*cmd, "--labels", "start"], _CODE)
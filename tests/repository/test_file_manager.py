@@ -1,5 +1,7 @@
 """Test the file manager."""
 
+from os import remove
+
 from pycommons.io.path import Path
 from pycommons.io.temp import temp_dir
 
@@ -91,3 +93,130 @@ def test_file_manager() -> None:
             assert py.is_file()
             assert py.basename() != ".gitignore"
             assert t
+
+
+def test_file_manager_shared() -> None:
+    """Test that file managers sharing a directory merge their indices."""
+    with temp_dir() as td:
+        fm1 = FileManager(td)
+        fm2 = FileManager(td)
+        p1, t1 = fm1.get_file("A", "one")
+        p2, t2 = fm2.get_file("A", "one")
+        assert t1
+        assert t2
+        assert p1 != p2
+        p3, _ = fm2.get_dir("B", "two")
+        fm2.close()
+        p4, _ = fm1.get_file("A", "three")
+        fm1.close()
+
+        with FileManager(td) as fm:
+            assert set(fm.list_realm("A")) == {p1, p4}
+            assert set(fm.list_realm("B")) == {p3}
+            fm3 = FileManager(td)
+            assert set(fm3.list_realm("A")) == {p1, p4}
+            assert fm.delete("A", "three")
+        fm3.close()  # must not resurrect the deleted entry
+
+        with FileManager(td) as fm:
+            assert set(fm.list_realm("A")) == {p1}
+            assert set(fm.list_realm("B")) == {p3}
+
+
+def test_file_manager_migrate() -> None:
+    """Test that an old index file is migrated to the database."""
+    with temp_dir() as td:
+        td.resolve_inside("realms/A").ensure_dir_exists()
+        td.resolve_inside("realms/A/x").write_all_str("x")
+        old = td.resolve_inside(".cache.json")
+        old.write_all_str('{"A": {"x": "x", "y": "y"}}')
+        with FileManager(td) as fm:
+            assert not old.exists()
+            p, t = fm.get_file("A", "x")
+            assert not t
+            assert p == td.resolve_inside("realms/A/x")
+            entry = fm.get_entry("A", "x")
+            assert entry is not None
+            assert entry.path == p
+            assert fm.get_entry("A", "y") is None
+
+
+def test_file_manager_verify() -> None:
+    """Test that verifying removes the entries with missing paths."""
+    with temp_dir() as td:
+        with FileManager(td) as fm:
+            p1, _ = fm.get_file("A", "one")
+            p2, _ = fm.get_file("A", "two")
+            p3, _ = fm.get_dir("B", "three")
+        remove(p2)
+        with FileManager(td) as fm:
+            assert fm.verify() == 1
+            assert set(fm.list_realm("A")) == {p1}
+            assert fm.list_realm("B") == (p3, )
+            assert fm.verify("A") == 0
+
+
+def test_file_manager_shard() -> None:
+    """Test switching a realm to the sharded layout."""
+    with temp_dir() as td:
+        with FileManager(td) as fm:
+            p1, _ = fm.get_file("A", "one")
+            p1.write_all_str("1")
+            p2, _ = fm.get_dir("A", "two")
+            p3, _ = fm.get_file("B", "three")
+        with FileManager(td) as fm:
+            assert fm.shard("A") == 2
+            q1, t = fm.get_file("A", "one")
+            assert not t
+            assert q1 != p1
+            assert q1.read_all_str() == "1\n"
+            assert not p1.exists()
+            q2, t = fm.get_dir("A", "two")
+            assert not t
+            assert q2.is_dir()
+            assert not p2.exists()
+            q4, t = fm.get_file("A", "four")
+            assert t
+            assert q4.relative_to(td.resolve_inside("realms/A")).count(
+                "/") == 2
+            assert fm.get_file("B", "three") == (p3, False)
+        with FileManager(td) as fm:
+            assert set(fm.list_realm("A")) == {q1, q2, q4}
+            assert fm.shard("A") == 0
+            assert not fm.gc()
+            assert q4.is_file()
+
+
+def test_file_manager_rebuild() -> None:
+    """Test rebuilding the index from the sidecar files."""
+    with temp_dir() as td:
+        with FileManager(td) as fm:
+            p1, _ = fm.get_file("A", "one")
+            p1.write_all_str("1")
+            p2, _ = fm.get_dir("A", "two")
+            p2.resolve_inside("f.txt").write_all_str("2")
+            fm.shard("B")
+            p3, _ = fm.get_file("B", "three")
+            fm.get_file("B", "gone")
+            fm.delete("B", "gone")
+            entry = fm.get_entry("A", "one")
+        db = td.resolve_inside(".cache.db")
+        remove(db)
+        with FileManager(td) as fm:
+            assert fm.get_file("A", "one") == (p1, False)
+            assert fm.get_dir("A", "two") == (p2, False)
+            assert set(fm.list_realm("B")) == {p3}
+            assert entry is not None
+            rebuilt = fm.get_entry("A", "one")
+            assert rebuilt is not None
+            assert rebuilt.created == entry.created
+            assert rebuilt.size == 2
+            assert fm.rebuild_index() == 0
+            p4, _ = fm.get_file("B", "four")
+            assert p4.relative_to(td.resolve_inside("realms/B")).count(
+                "/") == 2
+        db.write_all_str("garbage")
+        with FileManager(td) as fm:
+            assert set(fm.list_realm("A")) == {p1, p2}
+            assert set(fm.list_realm("B")) == {p3, p4}
+            assert not fm.gc()
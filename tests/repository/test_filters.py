@@ -0,0 +1,79 @@
+"""Cross-check the in-process filters with the real programs."""
+
+from shutil import which
+
+import pytest
+
+from texgit.repository.filters import CROSS_CHECK_ENV, find_filter, run_real
+
+#: the inputs to test
+_INPUTS: tuple[str, ...] = (
+    "", "a", "a\n", "\n\n", "x,y,z\nb\n\nc,d\n", "one\ttwo\tthree\nfour\n",
+    "b\na\nc\na\nB\nä\nA", "line\r\nwith\r\ncrlf\r\n",
+    "".join(f"{i},{i * i},{'abc' * (i % 5)}\n" for i in range(100)),
+    "über,größe\nnaïve\n")
+
+#: the commands to test
+_COMMANDS: tuple[tuple[str, ...], ...] = (
+    ("cat",), ("cat", "-"),
+    ("head",), ("head", "-n", "3"), ("head", "-n1"), ("head", "-2"),
+    ("head", "--lines=0"), ("head", "-n", "-2"), ("head", "-n", "-0"),
+    ("tail",), ("tail", "-n", "3"), ("tail", "-n1"), ("tail", "-2"),
+    ("tail", "--lines=0"), ("tail", "-n", "+2"), ("tail", "-n", "+0"),
+    ("tail", "-n", "-1"),
+    ("sort",), ("sort", "-r"), ("sort", "-u"), ("sort", "-ru"),
+    ("sort", "-r", "-u"),
+    ("grep", "a"), ("grep", "-v", "a"), ("grep", "-c", "a"),
+    ("grep", "-n", "a"), ("grep", "-vn", "1"), ("grep", "-F", "a.c"),
+    ("grep", "-e", "b"), ("grep", "-cv", "zzz"), ("grep", ""),
+    ("grep", "ö"),
+    ("sed", "-n", "2p"), ("sed", "-n", "2,3p"), ("sed", "-n", "3,1p"),
+    ("sed", "-n", "2,$p"), ("sed", "-n", "$p"), ("sed", "-n", "-e", "1p"),
+    ("sed", "-n", "50,60p"),
+    ("cut", "-d", ",", "-f", "2"), ("cut", "-d,", "-f3,1"),
+    ("cut", "-s", "-d", ",", "-f", "2-"), ("cut", "-f", "2"),
+    ("cut", "-f", "-2"), ("cut", "--delimiter=,", "--fields=1"),
+    ("cut", "-c", "2-3"), ("cut", "-b", "1,3"), ("cut", "-c", "3-"))
+
+
+@pytest.mark.parametrize("command", _COMMANDS)
+def test_filters_match_programs(command: tuple[str, ...]) -> None:
+    """Test that the filters produce the same output as the programs."""
+    if which(command[0]) is None:
+        pytest.skip(f"{command[0]!r} is not installed")
+    function = find_filter(list(command))
+    assert function is not None
+    for text in _INPUTS:
+        try:
+            expected: str | None = run_real(list(command), text)
+        except ValueError:
+            expected = None
+        try:
+            result: str | None = function(text)
+        except ValueError:
+            result = None
+        assert result == expected, f"{command} on {text!r}"
+
+
+def test_filters_unsupported() -> None:
+    """Test that unsupported commands are left to the programs."""
+    for command in (("head", "-c", "5"), ("head", "-n", "5", "file.txt"),
+                    ("tail", "-f"), ("sort", "-n"), ("grep", "a.c"),
+                    ("grep", "-i", "a"), ("grep", "a", "file.txt"),
+                    ("sed", "-n", "0p"), ("sed", "s/a/b/"),
+                    ("sed", "2p"), ("cut", "-d", ",,", "-f", "1"),
+                    ("cut", "-f", "0"), ("cut", "-c", "1", "-f", "2"),
+                    ("cat", "-n"), ("cat", "file.txt"), ("ls",), ()):
+        assert find_filter(list(command)) is None, command
+
+
+def test_filters_cross_check(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Test the cross-check mode."""
+    monkeypatch.setenv(CROSS_CHECK_ENV, "1")
+    function = find_filter(["head", "-n", "1"])
+    assert function is not None
+    assert function("a\nb\n") == "a\n"
+    function = find_filter(["grep", "x"])
+    assert function is not None
+    with pytest.raises(ValueError, match="failed"):
+        function("a\nb\n")
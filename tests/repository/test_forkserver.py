@@ -0,0 +1,70 @@
+"""Test the fork server."""
+
+from subprocess import PIPE, run  # nosec
+from tempfile import TemporaryDirectory
+from time import monotonic
+
+import pytest
+from pycommons.io.path import Path
+from pycommons.processes.python import PYTHON_ENV, PYTHON_INTERPRETER
+
+from texgit.repository.forkserver import ForkServer
+
+#: the script to execute
+_SCRIPT: str = """import sys
+from helper import twice
+
+print(sys.argv[1:])
+for line in sys.stdin:
+    print(twice(line.strip()))
+"""
+
+
+def test_forkserver_matches_process() -> None:
+    """Test that forked scripts and modules produce the same output."""
+    with TemporaryDirectory() as td, ForkServer(["json"]) as fs:
+        wd: Path = Path(td)
+        out: Path = wd.resolve_inside("out.txt")
+        inp: Path = wd.resolve_inside("in.txt")
+        wd.resolve_inside("helper.py").write_all_str(
+            "def twice(s):\n    return s + s\n\n"
+            "if __name__ == '__main__':\n    print(twice('ab'))\n")
+        wd.resolve_inside("script.py").write_all_str(_SCRIPT)
+        for args, stdin in ((["script.py", "a", "b"], "x\ny\n"),
+                            (["-m", "helper"], None),
+                            (["-m", "json.tool", "--indent", "1"],
+                             '{"a": [1, 2]}')):
+            expected: str = run(  # nosec
+                [PYTHON_INTERPRETER, *args], input=stdin or "", stdout=PIPE,
+                cwd=wd, env=PYTHON_ENV, text=True, check=True).stdout
+            if stdin is not None:
+                inp.write_all_str(stdin)
+            for _ in range(2):
+                assert fs.execute(args, out, wd,
+                                  None if stdin is None else inp)
+                assert out.read_all_str() == expected
+        assert not fs.execute(["-c", "print(1)"], out, wd)
+        wd.resolve_inside("fail.py").write_all_str("raise ValueError\n")
+        with pytest.raises(ValueError):
+            fs.execute(["fail.py"], out, wd)
+        with pytest.raises(ValueError):
+            fs.execute(["-m", "does_not_exist_at_all"], out, wd)
+        inp.write_all_str("z")
+        assert fs.execute(["script.py"], out, wd, inp)
+        assert out.read_all_str() == "[]\nzz\n"
+
+
+def test_forkserver_timeout() -> None:
+    """Test that forked processes are killed after their timeout."""
+    with TemporaryDirectory() as td, ForkServer() as fs:
+        wd: Path = Path(td)
+        out: Path = wd.resolve_inside("out.txt")
+        wd.resolve_inside("hang.py").write_all_str(
+            "import time\ntime.sleep(100)\n")
+        wd.resolve_inside("ok.py").write_all_str("print('ok')\n")
+        start: float = monotonic()
+        with pytest.raises(ValueError, match="timed out after 1s"):
+            fs.execute(["hang.py"], out, wd, timeout=1)
+        assert monotonic() - start < 30
+        assert fs.execute(["ok.py"], out, wd)
+        assert out.read_all_str() == "ok\n"
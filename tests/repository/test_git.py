@@ -0,0 +1,46 @@
+"""Test the git repository tools."""
+
+import socket
+from time import monotonic
+
+from pycommons.io.temp import temp_dir
+
+from conftest import LocalGitServer
+from texgit.repository.git import GitRepository
+
+
+def test_download_hedges_to_mirror(git_server: LocalGitServer) -> None:
+    """Test that a stalled clone is hedged with a mirror."""
+    git_server.make_repo("a/b", {"README.md": "# Test\n"})
+    src = git_server.root.resolve_inside("a/b")
+    with (temp_dir() as td,
+          socket.socket(socket.AF_INET, socket.SOCK_STREAM) as srv):
+        # a server that accepts connections but never answers
+        srv.bind(("127.0.0.1", 0))
+        srv.listen(8)
+        url: str = f"http://127.0.0.1:{srv.getsockname()[1]}/a/b"
+
+        dest = td.resolve_inside("realm/dest")
+        dest.ensure_dir_exists()
+
+        start: float = monotonic()
+        repo = GitRepository.download(
+            url, dest, mirrors=(f"file://{src}", ), hedge_delay=1)
+        assert (monotonic() - start) < 60
+        assert repo.path == dest
+        assert repo.url == url
+        assert repo.commit == GitRepository.from_local(src, url).commit
+        assert dest.resolve_inside("README.md").is_file()
+        assert GitRepository.from_local(dest).url == url
+        assert list(dest.up(1).list_dir()) == [dest]
+
+
+def test_download_local_server(git_server: LocalGitServer) -> None:
+    """Test cloning from the local git server."""
+    url: str = git_server.make_repo("x/y", {"a.txt": "a\n"})
+    with temp_dir() as td:
+        repo = GitRepository.download(url, td.resolve_inside("y"))
+        assert repo.url == url
+        assert repo.path.resolve_inside("a.txt").read_all_str() == "a\n"
+        assert repo.make_url(repo.path.resolve_inside("a.txt")) == \
+            f"{url}/a.txt"
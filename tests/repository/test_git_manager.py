@@ -1,7 +1,12 @@
 """Test the git manager."""
 
+import socket
+from threading import Thread
+
+import pytest
 from pycommons.io.temp import temp_dir
 
+from conftest import LocalGitServer
 from texgit.repository.git_manager import GitManager, GitPath
 
 
@@ -59,3 +64,99 @@ def test_git_manager() -> None:
             assert isinstance(gp5b, GitPath)
             assert gp5b.repo == gp5.repo
             assert gp5.path == gp5b.path
+
+
+def test_git_manager_aliases(git_server: LocalGitServer) -> None:
+    """Test that different spellings of a url map to the same clone."""
+    url_1: str = git_server.make_repo("a/b_c", {"f.txt": "1"})
+    url_2: str = git_server.make_repo("a_b/c", {"f.txt": "2"})
+    with temp_dir() as td:
+        with GitManager(td) as gm:
+            r1 = gm.get_repository(url_1)
+            assert gm.get_repository(f"{url_1}.git") is r1
+            assert gm.get_repository(f" {url_1}/ ") is r1
+            r2 = gm.get_repository(url_2)
+            assert r2.path != r1.path
+            assert gm.get_git_file(url_2, "f.txt").path.read_all_str() == "2\n"
+            assert gm.get_git_file(url_1, "f.txt").path.read_all_str() == "1\n"
+            assert len(gm.list_realm("git")) == 2
+
+        with GitManager(td) as gm:
+            assert gm.get_repository(f"{url_1}.git/") == r1
+            assert gm.get_repository(url_2) == r2
+            assert len(gm.list_realm("git")) == 2
+
+
+def test_git_manager_failed_clone(git_server: LocalGitServer) -> None:
+    """Test that failed clones are remembered."""
+    url: str = f"{git_server.url}/does/not_exist"
+    with temp_dir() as td:
+        with GitManager(td) as gm:
+            with pytest.raises(ValueError, match="Could not clone"):
+                gm.get_repository(url)
+            with pytest.raises(ValueError, match="not retrying"):
+                gm.get_repository(f"{url}.git")
+            assert len(gm.list_realm("git")) == 0
+        with GitManager(td) as gm, pytest.raises(
+                ValueError, match="not retrying"):
+            gm.get_repository(url)
+        with GitManager(td, failure_ttl=0) as gm, pytest.raises(
+                ValueError, match="Could not clone"):
+            gm.get_repository(url)
+
+
+def test_git_manager_shared(git_server: LocalGitServer) -> None:
+    """Test that concurrent git managers clone a repository only once."""
+    url: str = git_server.make_repo("p/q", {"f.txt": "f\n"})
+    with temp_dir() as td:
+        results: list[GitPath] = []
+
+        def __load() -> None:
+            with GitManager(td) as gm:
+                results.append(gm.get_git_file(url, "f.txt"))
+
+        threads = [Thread(target=__load) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert list.__len__(results) == 4
+        assert {r.path for r in results} == {results[0].path}
+        with GitManager(td) as gm:
+            assert gm.list_realm("git") == (results[0].repo.path, )
+
+
+def test_git_manager_store(git_server: LocalGitServer) -> None:
+    """Test that changing a clone taken from the store keeps the store."""
+    url: str = git_server.make_repo("s/t", {"f.txt": "f\n"})
+    with temp_dir() as td:
+        store = td.resolve_inside("store")
+        with GitManager(td.resolve_inside("a"), store_dir=store) as gm:
+            pa = gm.get_git_file(url, "f.txt").path
+        with GitManager(td.resolve_inside("b"), store_dir=store) as gm:
+            pb = gm.get_git_file(url, "f.txt").path
+        assert pa != pb
+        with open(pb, "a", encoding="utf-8") as stream:
+            stream.write("b\n")
+        assert pb.read_all_str() == "f\nb\n"
+        assert pa.read_all_str() == "f\n"
+        with GitManager(store) as gm:
+            (entry, ) = gm.list_entries("git")
+            assert entry.path.resolve_inside("f.txt").read_all_str() == "f\n"
+
+
+def test_git_manager_mirrors(git_server: LocalGitServer) -> None:
+    """Test that the mirrors given to a git manager are used."""
+    git_server.make_repo("m/n", {"g.txt": "g\n"})
+    src = git_server.root.resolve_inside("m/n")
+    with (temp_dir() as td,
+          socket.socket(socket.AF_INET, socket.SOCK_STREAM) as srv):
+        # a server that accepts connections but never answers
+        srv.bind(("127.0.0.1", 0))
+        srv.listen(8)
+        url: str = f"http://127.0.0.1:{srv.getsockname()[1]}/m/n"
+        with GitManager(td, hedge_delay=1, mirrors={
+                f"{url}.git": (f"file://{src}", )}) as gm:
+            gp = gm.get_git_file(url, "g.txt")
+            assert gp.path.read_all_str() == "g\n"
+            assert gp.repo.url == url
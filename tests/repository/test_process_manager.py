@@ -1,10 +1,14 @@
 """Test the file manager."""
 
+from os import stat
 from os.path import getsize
 
+import pytest
 from pycommons.io.path import Path
 from pycommons.io.temp import temp_dir
+from pycommons.processes.shell import STREAM_CAPTURE, Command
 
+from conftest import LocalGitServer
 from texgit.repository.git_manager import GitPath
 from texgit.repository.process_manager import ProcessManager
 
@@ -84,10 +88,13 @@ def test_process_manager_output() -> None:
             assert file_1 is file_2
 
             file_a = proc.get_output("w", ("python3", "--version"))
-            assert isinstance(file_a, Path)
-            td.enforce_contains(file_a)
-            file_a.enforce_file()
-            assert file_1 is not file_a
+            assert file_a is file_1  # same command, same output
+
+            file_b = proc.get_output("v", ("python3", "-c", "print(1)"))
+            assert isinstance(file_b, Path)
+            td.enforce_contains(file_b)
+            assert file_b.read_all_str() == "1\n"
+            assert file_b != file_1
 
         with ProcessManager(td) as proc:
             file_3 = proc.get_output("v", ("python3", "--version"))
@@ -99,6 +106,18 @@ def test_process_manager_output() -> None:
             assert isinstance(file_4, Path)
             assert file_3 is file_4
 
+            key = proc.get_alias("output", "v")
+            assert key is not None
+            assert proc.get_alias("output", "w") == key
+            entry = proc.get_entry("output", key)
+            assert entry is not None
+            assert entry.path == file_1
+            assert entry.size == getsize(file_1)
+            assert entry.request == key
+            assert entry.meta["name"] == "v"
+            assert proc.get_entry("output", "v") is None
+            assert proc.get_alias("output", "x") is None
+
 
 def test_process_manager_git() -> None:
     """Test the processed files repository."""
@@ -228,3 +247,248 @@ def test_processmanager_resolution() -> None:
         proc.get_output("R14", ("python3", "make_pdf.py", "(?R13?)"),
                         repo, "examples")
         assert getsize(p) > 100
+
+
+def test_process_manager_argument_files() -> None:
+    """Test that outputs are only reused with their argument files."""
+    with temp_dir() as td:
+        counter: Path = td.resolve_inside("counter.txt")
+        cmd: tuple[str, ...] = ("python3", "-c", (
+            f"import sys; open({str(counter)!r}, 'a').write('1'); "
+            "open(sys.argv[1], 'w').write('x' * 200); print('ok')"), "(?f?)")
+        with ProcessManager(td) as proc:
+            proc.get_output("a", cmd)
+            assert getsize(proc.get_argument_file("f")[0]) == 200
+            proc.get_output("a", cmd)
+            assert counter.read_all_str() == "1"
+            assert proc.delete("args", "f")
+            proc.get_output("a", cmd)
+            assert counter.read_all_str() == "11"
+            assert getsize(proc.get_argument_file("f")[0]) == 200
+        with ProcessManager(td) as proc:
+            proc.get_output("a", cmd)
+            assert counter.read_all_str() == "11"
+            proc.get_argument_file("f")[0].write_all_str("y")
+            proc.get_output("a", cmd)
+            assert counter.read_all_str() == "111"
+            assert getsize(proc.get_argument_file("f")[0]) == 200
+
+
+def test_process_manager_negative_cache() -> None:
+    """Test that failed commands are not repeated within the TTL."""
+    with temp_dir() as td:
+        counter: Path = td.resolve_inside("counter.txt")
+        cmd: tuple[str, ...] = (
+            "python3", "-c",
+            f"open({str(counter)!r}, 'a').write('1'); raise SystemExit(1)")
+        with ProcessManager(td) as proc:
+            with pytest.raises(ValueError, match="return code 1"):
+                proc.get_output("f", cmd)
+            assert counter.read_all_str() == "1"
+            with pytest.raises(ValueError, match="not retrying"):
+                proc.get_output("f", cmd)
+            assert counter.read_all_str() == "1"
+            assert tuple.__len__(proc.list_realm("output")) == 0
+
+        with ProcessManager(td) as proc:
+            with pytest.raises(ValueError, match="not retrying"):
+                proc.get_output("g", cmd)
+            assert counter.read_all_str() == "1"
+
+        with ProcessManager(td, failure_ttl=0) as proc:
+            with pytest.raises(ValueError, match="return code 1"):
+                proc.get_output("g", cmd)
+            assert counter.read_all_str() == "11"
+
+
+def test_process_manager_store() -> None:
+    """Test sharing outputs between projects via a store."""
+    with temp_dir() as td:
+        store = td.resolve_inside("store")
+        counter: Path = td.resolve_inside("counter.txt")
+        cmd: tuple[str, ...] = (
+            "python3", "-c",
+            f"open({str(counter)!r}, 'a').write('1'); print('hello')")
+        with ProcessManager(td.resolve_inside("a"), store_dir=store) as proc:
+            pa = proc.get_output("x", cmd)
+        with ProcessManager(td.resolve_inside("b"), store_dir=store) as proc:
+            pb = proc.get_output("y", cmd)
+            assert proc.get_alias("output", "y") is not None
+            assert proc.get_alias("output", "x") is None
+        assert counter.read_all_str() == "1"
+        assert pb.read_all_str() == pa.read_all_str() == "hello\n"
+        assert pb != pa
+        assert stat(pb).st_ino == stat(pa).st_ino
+        with ProcessManager(store) as proc:
+            entries = proc.list_entries("output")
+            assert len(entries) == 1
+            assert entries[0].meta["name"] == "x"
+
+
+def test_process_manager_store_arguments() -> None:
+    """Test sharing the argument files of outputs via a store."""
+    with temp_dir() as td:
+        store = td.resolve_inside("store")
+        counter: Path = td.resolve_inside("counter.txt")
+        cmd: tuple[str, ...] = ("python3", "-c", (
+            f"import sys; open({str(counter)!r}, 'a').write('1'); "
+            "open(sys.argv[1], 'w').write('x' * 200); print('ok')"), "(?f?)")
+        with ProcessManager(td.resolve_inside("a"), store_dir=store) as proc:
+            proc.get_output("x", cmd)
+            fa = proc.get_argument_file("f")[0]
+        with ProcessManager(td.resolve_inside("b"), store_dir=store) as proc:
+            proc.get_output("y", cmd)
+            fb = proc.get_argument_file("f")[0]
+        assert counter.read_all_str() == "1"
+        assert fb.read_all_str() == fa.read_all_str() == "x" * 200
+        assert stat(fb).st_ino != stat(fa).st_ino
+        fb.write_all_str("changed")  # in place, as commands do
+        with ProcessManager(td.resolve_inside("c"), store_dir=store) as proc:
+            proc.get_output("z", cmd)
+            assert proc.get_argument_file("f")[0].read_all_str() == "x" * 200
+        assert counter.read_all_str() == "1"
+
+
+def test_process_manager_streaming() -> None:
+    """Test streaming large outputs and limiting their size."""
+    with temp_dir() as td:
+        td.resolve_inside("x").write_all_str("x")
+        script: Path = td.resolve_inside("script.py")
+        script.write_all_str(
+            "import sys\n"
+            "for i in range(int(sys.argv[1])):\n"
+            f"    print(f'{{i}}  {td}/x' if i % 100 == 0 else i)\n"
+            "print('  ')\nprint()")
+        expected: str = "".join(
+            f"{i}  {{...}}/x\n" if i % 100 == 0 else f"{i}\n"
+            for i in range(100000))
+        with ProcessManager(td, max_output=1_000_000) as proc:
+            assert proc.get_output("a", ("python3", script, "100000")) \
+                .read_all_str() == expected
+            with pytest.raises(ValueError, match="more than 1000000"):
+                proc.get_output("b", ("python3", script, "200000"))
+            assert tuple.__len__(proc.list_realm("output")) == 1
+        with ProcessManager(td, max_output=1_000_000, preload=()) as proc:
+            assert proc.get_output("c", ("python3", script, "100001")) \
+                .read_all_str() == f"{expected}100000  {{...}}/x\n"
+            with pytest.raises(ValueError, match="more than 1000000"):
+                proc.get_output("d", ("python3", script, "200001"))
+
+
+def test_process_manager_pipeline() -> None:
+    """Test pipelines of processes and builtin commands."""
+    with temp_dir() as td:
+        counter: Path = td.resolve_inside("counter.txt")
+        script: str = (f"open({str(counter)!r}, 'a').write('1'); "
+                       "print('\\n'.join(map(str, range(10, 0, -1))))")
+        gen: tuple[str, ...] = ("python3", "-c", script)
+        with ProcessManager(td) as proc:
+            assert proc.get_output("a", (
+                *gen, "(|)", "sort", "(|)", "head", "-n", "3")) \
+                .read_all_str() == "1\n10\n2\n"
+            assert proc.get_output("b", (
+                *gen, "(|)", "tail", "-n", "2", "(|)", "cat")) \
+                .read_all_str() == "2\n1\n"
+            assert counter.read_all_str() == "11"
+            assert proc.get_output("g", (
+                "python3", "-c", "import sys; print(sys.argv[1:])", "|",
+                "x")).read_all_str() == "['|', 'x']\n"
+            assert proc.get_output("h", (
+                *gen, "(|)", "cut", "-d", "|", "-f", "1", "(|)", "head", "-n",
+                "1")).read_all_str() == "10\n"
+            with pytest.raises(ValueError, match="Empty stage"):
+                proc.get_output("c", (*gen, "(|)", "(|)", "cat"))
+            with pytest.raises(ValueError, match="return code 3"):
+                proc.get_output("d", (*gen, "(|)", "python3", "-c",
+                                      "raise SystemExit(3)"))
+        with ProcessManager(td, cache_stages=True) as proc:
+            assert proc.get_output("e", (*gen, "(|)", "head", "-n", "1")) \
+                .read_all_str() == "10\n"
+            assert proc.get_output("f", (*gen, "(|)", "tail", "-n", "1")) \
+                .read_all_str() == "1\n"
+            assert counter.read_all_str() == "11111"
+            assert tuple.__len__(proc.list_realm("stages")) == 1
+
+
+def test_process_manager_usage() -> None:
+    """Test recording the resources used by the executed commands."""
+    with temp_dir() as td:
+        cmd: tuple[str, ...] = ("python3", "-c", "print(sum(range(10 ** 6)))")
+        with ProcessManager(td) as proc:
+            proc.get_output("a", cmd)
+            proc.get_output("b", cmd)
+            with pytest.raises(ValueError, match="return code 2"):
+                proc.get_output("c", ("python3", "-c", "raise SystemExit(2)"))
+            usage = proc.get_usage()
+            assert [u["command"] for u in usage] == [
+                " ".join(cmd), "python3 -c raise SystemExit(2)"]
+            assert usage[0]["size"] == 13
+            assert usage[0]["maxrss"] > 0
+            assert "return code 2" in usage[1]["error"]
+            meta = proc.list_entries("output")[0].meta
+            assert meta["user"] + meta["system"] > 0
+            assert meta["maxrss"] == usage[0]["maxrss"]
+
+
+def test_process_manager_isolate(git_server: LocalGitServer) -> None:
+    """Test executing commands in isolated views of the repository."""
+    url: str = git_server.make_repo("i/j", {"a.txt": "a\n", "d/b.txt": "b"})
+    script: str = (
+        "import os; print(os.getcwd()); "
+        "open('scratch.txt', 'w').write('x'); "
+        "print(sorted(os.listdir('.')), open('b.txt').read())")
+    with temp_dir() as td:
+        with ProcessManager(td) as proc:
+            plain = proc.get_output("p", ("python3", "-c", script), url, "d")
+            clone = proc.get_git_dir(url, ".").path
+            assert clone.resolve_inside("d/scratch.txt").is_file()
+        with ProcessManager(td.resolve_inside("x"), isolate="copy") as proc:
+            isolated = proc.get_output(
+                "q", ("python3", "-c", script), url, "d")
+            proc.get_output("r", ("python3", "-c", (
+                "import subprocess; open('b.txt', 'a').write('c'); "
+                "subprocess.run(['git', 'add', 'b.txt'], check=True)")),
+                url, "d")
+            clone = proc.get_git_dir(url, ".").path
+            assert not clone.resolve_inside("d/scratch.txt").exists()
+            assert clone.resolve_inside("d/b.txt").read_all_str() == "b\n"
+            assert not list(td.resolve_inside("x/.views").list_dir())
+            assert not Command(["git", "status", "--porcelain"],
+                               working_dir=clone,
+                               stdout=STREAM_CAPTURE).execute(True)[0]
+        assert isolated.read_all_str() == plain.read_all_str()
+        assert plain.read_all_str().startswith("{...}/")
+        with ProcessManager(td.resolve_inside("y"), isolate="link") as proc:
+            log = proc.get_git_dir(url, ".").path.resolve_inside(
+                ".git/logs/HEAD")
+            before = log.read_all_str()
+            proc.get_output("s", ("python3", "-c", (
+                "import subprocess; subprocess.run(['git', 'update-ref', "
+                "'-m', 'view', 'HEAD', 'HEAD~0'], check=True)")), url, "d")
+            assert log.read_all_str() == before
+        with pytest.raises(ValueError, match="Invalid isolation"):
+            ProcessManager(td, isolate="overlay")
+
+
+def test_process_manager_venvs(git_server: LocalGitServer) -> None:
+    """Test executing python3 commands in per-requirements environments."""
+    reqs: dict[str, str] = {"requirements.txt": "# no packages\n"}
+    url_1: str = git_server.make_repo("v/1", reqs)
+    url_2: str = git_server.make_repo("v/2", reqs)
+    url_3: str = git_server.make_repo("v/3", {"a.txt": "a"})
+    cmd: tuple[str, ...] = ("python3", "-c", "import sys; print(sys.prefix)")
+    with temp_dir() as td:
+        wheels: Path = td.resolve_inside("wheels")
+        wheels.ensure_dir_exists()
+        with ProcessManager(td.resolve_inside("c"), venvs=True,
+                            venv_source=wheels) as proc:
+            assert proc.get_output("r", ("cat", "requirements.txt", "(|)",
+                                         "head", "-n", "1"), url_1, ".") \
+                .read_all_str() == "# no packages\n"
+            assert tuple.__len__(proc.list_realm("venvs", False)) == 0
+            prefix_1 = proc.get_output("a", cmd, url_1, ".").read_all_str()
+            prefix_2 = proc.get_output("b", cmd, url_2, ".").read_all_str()
+            prefix_3 = proc.get_output("c", cmd, url_3, ".").read_all_str()
+            assert prefix_1 == prefix_2 != prefix_3
+            assert prefix_1.startswith("{...}")
+            assert tuple.__len__(proc.list_realm("venvs", False)) == 1
@@ -0,0 +1,95 @@
+"""Test the remote cache."""
+
+from pycommons.io.path import Path
+from pycommons.io.temp import temp_dir
+
+from texgit.repository.process_manager import ProcessManager
+from texgit.repository.remote_cache import HttpCacheBackend
+
+
+def test_remote_cache(file_server: tuple[Path, str]) -> None:
+    """Test sharing outputs between machines via a remote cache."""
+    root, url = file_server
+    with temp_dir() as td:
+        counter: Path = td.resolve_inside("counter.txt")
+        cmd: tuple[str, ...] = (
+            "python3", "-c",
+            f"open({str(counter)!r}, 'a').write('1'); print('hello')")
+
+        # without upload, nothing is stored remotely
+        with ProcessManager(td.resolve_inside("a"),
+                            backend=HttpCacheBackend(url)) as pm:
+            pm.get_output("x", cmd)
+        assert counter.read_all_str() == "1"
+        assert not list(root.list_dir())
+
+        with ProcessManager(td.resolve_inside("b"), backend=HttpCacheBackend(
+                url, upload=True)) as pm:
+            pm.get_output("x", cmd)
+        assert counter.read_all_str() == "11"
+
+        with ProcessManager(td.resolve_inside("c"),
+                            backend=HttpCacheBackend(url)) as pm:
+            out = pm.get_output("y", cmd)
+            assert out.read_all_str() == "hello\n"
+            key = pm.get_alias("output", "y")
+            assert key is not None
+            entry = pm.get_entry("output", key)
+            assert entry is not None
+            assert entry.meta["name"] == "y"
+            assert entry.meta["seconds"] > 0
+        assert counter.read_all_str() == "11"
+
+        # corrupted content is not used
+        for shard in root.resolve_inside("blobs").list_dir(files=False):
+            for blob in shard.list_dir(directories=False):
+                blob.write_all_str("bad")
+        with ProcessManager(td.resolve_inside("d"),
+                            backend=HttpCacheBackend(url)) as pm:
+            assert pm.get_output("x", cmd).read_all_str() == "hello\n"
+        assert counter.read_all_str() == "111"
+
+
+def test_remote_cache_invalid(file_server: tuple[Path, str]) -> None:
+    """Test that invalid descriptions in a remote cache are ignored."""
+    root, url = file_server
+    backend = HttpCacheBackend(url)
+    with temp_dir() as td:
+        dest: Path = td.resolve_inside("out.txt")
+        realm = root.resolve_inside("output")
+        realm.ensure_dir_exists()
+        for i, text in enumerate((
+                "[1, 2]", "null", '"x"', '{"meta": {}}', '{"sha256": 5}',
+                '{"sha256": "../../x"}')):
+            realm.resolve_inside(f"r{i}.json").write_all_str(text)
+            assert backend.get("output", f"r{i}", dest) is None
+            assert not dest.exists()
+
+
+def test_remote_cache_arguments(file_server: tuple[Path, str]) -> None:
+    """Test sharing the argument files of outputs via a remote cache."""
+    root, url = file_server
+    with temp_dir() as td:
+        counter: Path = td.resolve_inside("counter.txt")
+        cmd: tuple[str, ...] = ("python3", "-c", (
+            f"import sys; open({str(counter)!r}, 'a').write('1'); "
+            "open(sys.argv[1], 'w').write('x' * 200); print('ok')"), "(?f?)")
+        with ProcessManager(td.resolve_inside("a"), backend=HttpCacheBackend(
+                url, upload=True)) as pm:
+            pm.get_output("x", cmd)
+        assert counter.read_all_str() == "1"
+
+        with ProcessManager(td.resolve_inside("b"),
+                            backend=HttpCacheBackend(url)) as pm:
+            assert pm.get_output("x", cmd).read_all_str() == "ok\n"
+            assert pm.get_argument_file("f")[0].read_all_str() == "x" * 200
+        assert counter.read_all_str() == "1"
+
+        # without its argument files, an output is not used
+        for desc in root.resolve_inside("args").list_dir(directories=False):
+            desc.write_all_str("{}")
+        with ProcessManager(td.resolve_inside("c"),
+                            backend=HttpCacheBackend(url)) as pm:
+            assert pm.get_output("x", cmd).read_all_str() == "ok\n"
+            assert pm.get_argument_file("f")[0].read_all_str() == "x" * 200
+        assert counter.read_all_str() == "11"
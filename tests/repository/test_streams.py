@@ -0,0 +1,45 @@
+"""Test streaming the output of commands."""
+
+import pytest
+from pycommons.io.temp import temp_dir
+from pycommons.processes.shell import Command
+
+from texgit.repository.streams import (
+    limit_chunks,
+    stream_command,
+    stream_pipeline,
+)
+
+
+def test_stream_command_stdin_file() -> None:
+    """Test attaching a file to the stdin of a command."""
+    with temp_dir() as td:
+        text: str = "".join(f"line {i}\n" for i in range(50_000))
+        inp = td.resolve_inside("in.txt")
+        inp.write_all_str(text)
+        assert "".join(stream_command(Command("cat"), inp)) == text
+        assert "".join(stream_command(
+            Command(("head", "-n", "2")), inp)) == "line 0\nline 1\n"
+        assert "".join(stream_command(Command(
+            "cat", stdin="abc"))) == "abc"
+
+
+def test_stream_command_errors() -> None:
+    """Test that failing, stopped, and timed out commands raise errors."""
+    with pytest.raises(ValueError, match="return code 3"):
+        list(stream_command(Command(("sh", "-c", "echo a; exit 3"))))
+    with pytest.raises(ValueError, match="more than 1000 characters"):
+        list(limit_chunks(stream_command(Command("yes")), 1000, "yes"))
+    with pytest.raises(ValueError, match="timed out"):
+        list(stream_command(Command(("sleep", "10"), timeout=1)))
+
+
+def test_stream_pipeline_usage() -> None:
+    """Test collecting the resources used by the stages of a pipeline."""
+    usage: dict[str, float] = {}
+    assert "".join(stream_pipeline([
+        Command(("python3", "-c",
+                 "x = bytearray(64 << 20); print(sum(range(10 ** 7)))")),
+        str.strip], usage=usage)) == str(sum(range(10 ** 7)))
+    assert usage["user"] + usage["system"] > 0.1
+    assert usage["maxrss"] > 64 << 20
@@ -0,0 +1,148 @@
+"""Test the cache maintenance tools."""
+
+import json
+import tarfile
+from os import utime
+
+import pytest
+from pycommons.io.temp import temp_dir
+
+from conftest import LocalGitServer
+from texgit.cache import (
+    cache_stats,
+    disk_usage,
+    export_cache,
+    gc_cache,
+    import_cache,
+    list_cache,
+    show_entry,
+)
+from texgit.repository.process_manager import ProcessManager
+
+
+def test_export_import(git_server: LocalGitServer) -> None:
+    """Test exporting and importing a cache snapshot."""
+    url: str = git_server.make_repo("a/b", {"a.txt": "1\n2\n3\n"})
+    with temp_dir() as td:
+        src = td.resolve_inside("src")
+        dst = td.resolve_inside("dst")
+        archive = td.resolve_inside("cache.tar.gz")
+        with ProcessManager(src) as pm:
+            gf = pm.get_git_file(url, "a.txt")
+            head = pm.get_git_file(url, "a.txt", "h", ("head", "-n", "1"))
+            out = pm.get_output("v", ("python3", "--version"))
+            with pytest.raises(ValueError, match="return code 1"):
+                pm.get_output("f", ("python3", "-c", "exit(1)"))
+        export_cache(archive, src)
+        archive.enforce_file()
+        with tarfile.open(archive) as tar:
+            stream = tar.extractfile("index.json")
+            assert stream is not None
+            records = json.load(stream)["records"]
+        assert "failures" not in records
+        assert "usage" not in records
+
+        # a partially existing cache
+        with ProcessManager(dst) as pm:
+            pm.get_output("v", ("python3", "--version"))
+        assert import_cache(archive, dst) == 2
+        assert import_cache(archive, dst) == 0
+
+        with ProcessManager(dst) as pm:
+            assert len(pm.list_realm("git")) == 1
+            gf2 = pm.get_git_file(url, "a.txt")
+            assert gf2.path.relative_to(dst) == gf.path.relative_to(src)
+            assert gf2.repo.commit == gf.repo.commit
+            assert gf2.url == gf.url
+            assert gf2.path.read_all_str() == "1\n2\n3\n"
+            head1 = pm.get_git_file(url, "a.txt", "h", ("head", "-n", "1"))
+            assert head1.path.relative_to(dst) == head.path.relative_to(src)
+            head2 = pm.get_git_file(url, "a.txt", "h", ("head", "-n", "2"))
+            assert head2.path != head1.path
+            assert head2.path.read_all_str() == "1\n2\n"
+            out2 = pm.get_output("v", ("python3", "--version"))
+            assert out2.read_all_str() == out.read_all_str()
+            with pytest.raises(ValueError, match="return code 1"):
+                pm.get_output("f", ("python3", "-c", "exit(1)"))
+
+
+def test_gc() -> None:
+    """Test removing unused entries and evicting entries."""
+    with temp_dir() as td:
+        cmd = ("python3", "--version")
+        with ProcessManager(td) as pm:
+            a = pm.get_output("a", cmd)
+            b = pm.get_output("b", ("python3", "-c", "print(1)"))
+        with ProcessManager(td) as pm:
+            assert pm.get_output("a", cmd) == a
+        orphan = td.resolve_inside("realms/output/orphan")
+        orphan.write_all_str("x")
+        utime(orphan, (0, 0))
+        clone = td.resolve_inside("realms/output/.clone_x.tmp")
+        clone.ensure_dir_exists()
+        clone.resolve_inside("x.txt").write_all_str("x")
+        utime(clone, (0, 0))
+
+        assert disk_usage(td)[-1].endswith(" 2 entries  total")
+        removed = gc_cache(td, max_runs=1)
+        assert [e.path for e in removed] == [b]
+        assert not orphan.exists()
+        assert not clone.exists()
+
+        aux = td.resolve_inside("paper.aux")
+        aux.write_all_str(r"\expandafter\xdef\csname @texgit@path@a"
+                          rf"\endcsname{{{a.relative_to(td)}}}%")
+        assert not gc_cache(td, max_size=0, aux=[aux])
+        assert a.is_file()
+        assert [e.path for e in gc_cache(td, max_size=0)] == [a]
+        assert not a.exists()
+
+
+def test_gc_arguments() -> None:
+    """Test removing argument files together with their outputs."""
+    with temp_dir() as td:
+        cmd = ("python3", "-c",
+               "import sys; open(sys.argv[1], 'w').write('x')", "(?f?)")
+        with ProcessManager(td) as pm:
+            out = pm.get_output("a", cmd)
+            arg = pm.get_argument_file("f")[0]
+            b = pm.get_output("b", ("python3", "-c", "print(1)"))
+        with ProcessManager(td) as pm:
+            assert pm.get_argument_file("f")[0] == arg
+
+        assert [e.path for e in gc_cache(td, max_runs=1)] == [b]
+        assert out.is_file()
+        assert sorted(e.path for e in gc_cache(td, max_size=0)) == sorted(
+            [out, arg])
+        assert not out.exists()
+        assert not arg.exists()
+
+
+def test_inspect() -> None:
+    """Test listing and summarizing the cache entries."""
+    with temp_dir() as td:
+        with ProcessManager(td) as pm:
+            pm.get_output("a", ("python3", "--version"))
+            pm.get_output("b", ("python3", "-c", "print(1)"))
+            key = pm.get_alias("output", "b")
+            assert key is not None
+            entry = pm.get_entry("output", key)
+        assert entry is not None
+        assert entry.meta["seconds"] > 0
+
+        lines = list_cache(td)
+        assert len(lines) == 2
+        assert any(line.startswith(f"output {key}  size=2 B  created=")
+                   for line in lines)
+        assert f"request={entry.request}" in lines[1]
+        assert not list_cache(td, "git")
+
+        shown = show_entry("output", "b", td)
+        assert f"path: {entry.path}" in shown
+        assert "size: 2 B" in shown
+
+        stats = cache_stats(td, top=1)
+        assert stats[0].endswith(" 2 entries  realm output")
+        assert stats[1].endswith(" 2 entries  total")
+        assert stats[2] == "most expensive entries to regenerate:"
+        assert len(stats) == 4
@@ -0,0 +1,492 @@
+"""
+Maintain the repository directory in which `texgit` caches its data.
+
+The repository directory (`__git__` by default) contains the cloned
+repositories and the outputs of all processes. This module offers commands to
+work with it as a whole, e.g.,
+`python3 -m texgit.cache export cache.tar.gz` to pack the cache into a single
+snapshot archive and `python3 -m texgit.cache import cache.tar.gz` to restore
+it, e.g., on a CI machine. `python3 -m texgit.cache verify` checks all cache
+entries and removes those whose files or directories have disappeared.
+`python3 -m texgit.cache rebuild` adds all entries that are missing from the
+index by scanning the sidecar files next to the entries.
+
+`python3 -m texgit.cache gc` removes entries that have not been used for a
+given number of runs or days and evicts the least recently used entries if
+the cache exceeds a size budget, e.g.,
+`python3 -m texgit.cache gc --maxRuns 20 --maxSize 2G --aux paper.aux`.
+Entries needed by the given `aux` files are never removed.
+The store shared between projects (see `python3 -m texgit.run --store`) is
+maintained the same way, e.g., via
+`python3 -m texgit.cache --repoDir ~/.cache/texgit gc --maxDays 90`.
+`python3 -m texgit.cache du` prints the disk usage per realm and per
+repository.
+
+`python3 -m texgit.cache ls [realm]` lists the entries with their size,
+creation time, last use, the seconds it took to compute them, the
+fingerprint of the request producing them, and their path.
+`python3 -m texgit.cache show realm name` prints all information about a
+single entry. `python3 -m texgit.cache stats` summarizes the entries, their
+size, and their compute time per realm and per repository and lists the
+entries that would be the most expensive to regenerate. This helps to choose
+cache budgets and to check whether warming the cache works.
+
+ `python3 -m texgit.cache shard` switches the realms with the
+outputs of commands to a sharded directory layout, which keeps directories
+small even if the cache contains very many entries.
+"""
+import argparse
+import datetime
+from os.path import dirname
+from typing import Final, Iterable
+
+from pycommons.io.arguments import make_argparser, make_epilog
+from pycommons.io.console import logger
+from pycommons.io.path import Path, directory_path
+
+from texgit.repository.file_manager import CacheEntry
+from texgit.repository.process_manager import ProcessManager
+from texgit.run import RESPONSE_PATH
+from texgit.version import __version__
+
+#: the units of sizes
+_UNITS: Final[tuple[str, ...]] = ("B", "KiB", "MiB", "GiB", "TiB")
+
+
+def parse_size(size: str) -> int:
+    """
+    Parse a size in bytes, optionally with a binary unit suffix.
+
+    :param size: the size string
+    :return: the size in bytes
+
+    >>> parse_size("100")
+    100
+    >>> parse_size("2k")
+    2048
+    >>> parse_size(" 1.5 G ")
+    1610612736
+    """
+    use: Final[str] = str.upper(str.strip(size))
+    for i, unit in enumerate("KMGT", 1):
+        if use.endswith(unit):
+            return int(float(use[:-1]) * (1024 ** i))
+    return int(use)
+
+
+def format_size(size: int) -> str:
+    """
+    Format a size in bytes in a human-readable way.
+
+    :param size: the size in bytes
+    :return: the formatted size
+
+    >>> format_size(100)
+    '100 B'
+    >>> format_size(1536)
+    '1.5 KiB'
+    >>> format_size(3 * 1024 * 1024 * 1024)
+    '3.0 GiB'
+    """
+    if size < 1024:
+        return f"{size} B"
+    value: float = size
+    i: int = 0
+    while (value >= 1024) and (i < tuple.__len__(_UNITS) - 1):
+        value /= 1024
+        i += 1
+    return f"{value:.1f} {_UNITS[i]}"
+
+
+def format_seconds(seconds: float | None) -> str:
+    """
+    Format a compute time in seconds.
+
+    :param seconds: the seconds, or `None` if unknown
+    :return: the formatted time
+
+    >>> format_seconds(None)
+    '?'
+    >>> format_seconds(0.0123)
+    '0.012 s'
+    >>> format_seconds(75.5)
+    '75.5 s'
+    """
+    if seconds is None:
+        return "?"
+    return f"{seconds:.3f} s" if seconds < 10 else f"{seconds:.1f} s"
+
+
+def format_time(when: float) -> str:
+    """
+    Format a point in time, given in seconds since the epoch, in UTC.
+
+    :param when: the time
+    :return: the formatted time
+
+    >>> format_time(0)
+    '1970-01-01 00:00:00'
+    """
+    return datetime.datetime.fromtimestamp(when, datetime.UTC).strftime(
+        "%Y-%m-%d %H:%M:%S")
+
+
+def entry_seconds(entry: CacheEntry) -> float | None:
+    """
+    Get the seconds it took to compute an entry, if they were recorded.
+
+    :param entry: the entry
+    :return: the seconds, or `None` if they are unknown
+    """
+    seconds: Final = entry.meta.get("seconds")
+    return float(seconds) if isinstance(seconds, int | float) else None
+
+
+def aux_paths(aux: str) -> list[Path]:
+    """
+    Get the paths that a processed `aux` file refers to.
+
+    :param aux: the `aux` file
+    :return: the paths
+    """
+    aux_file: Final[Path] = Path(aux)
+    base_dir: Final[Path] = directory_path(dirname(aux_file))
+    result: Final[list[Path]] = []
+    for line in aux_file.open_for_read():
+        idx: int = line.find(RESPONSE_PATH)
+        if idx < 0:
+            continue
+        start: int = line.find("{", idx)
+        end: int = line.rfind("}")
+        if 0 < start < end:
+            result.append(base_dir.resolve_inside(line[start + 1:end]))
+    return result
+
+
+def export_cache(archive: str, repo_dir: str = "__git__") -> None:
+    """
+    Export the cache to a snapshot archive.
+
+    :param archive: the archive file to create
+    :param repo_dir: the repository directory
+    """
+    with ProcessManager(repo_dir) as pm:
+        pm.export_cache(archive)
+
+
+def import_cache(archive: str, repo_dir: str = "__git__") -> int:
+    """
+    Import a snapshot archive into the cache.
+
+    :param archive: the archive file to import
+    :param repo_dir: the repository directory
+    :return: the number of imported entries
+    """
+    with ProcessManager(repo_dir) as pm:
+        return pm.import_cache(archive)
+
+
+def rebuild_cache(repo_dir: str = "__git__") -> int:
+    """
+    Add the entries missing from the index of the cache from sidecar files.
+
+    :param repo_dir: the repository directory
+    :return: the number of added entries
+    """
+    with ProcessManager(repo_dir) as pm:
+        return pm.rebuild_index()
+
+
+def verify_cache(repo_dir: str = "__git__") -> int:
+    """
+    Check all entries of the cache and remove the invalid ones.
+
+    :param repo_dir: the repository directory
+    :return: the number of removed entries
+    """
+    with ProcessManager(repo_dir) as pm:
+        return pm.verify()
+
+
+#: the realms that are sharded by default
+SHARD_REALMS: Final[tuple[str, ...]] = (
+    "output", "postprocessed", "args", "stages")
+
+
+def shard_cache(repo_dir: str = "__git__",
+                realms: Iterable[str] = SHARD_REALMS) -> int:
+    """
+    Switch realms of the cache to the sharded layout.
+
+    :param repo_dir: the repository directory
+    :param realms: the realms to shard
+    :return: the number of moved entries
+    """
+    with ProcessManager(repo_dir) as pm:
+        return sum(map(pm.shard, realms))
+
+
+def gc_cache(repo_dir: str = "__git__", max_runs: int | None = None,
+             max_days: float | None = None, max_size: int | None = None,
+             aux: Iterable[str] = ()) -> list[CacheEntry]:
+    """
+    Remove unused cache entries and evict entries to fit a size budget.
+
+    :param repo_dir: the repository directory
+    :param max_runs: remove entries not used during this many runs
+    :param max_days: remove entries not used for this many days
+    :param max_size: the maximum size of the cache in bytes
+    :param aux: the `aux` files whose entries must be kept
+    :return: the removed entries
+    """
+    keep: Final[list[Path]] = []
+    for a in aux:
+        keep.extend(aux_paths(a))
+    with ProcessManager(repo_dir) as pm:
+        return pm.gc(max_runs, None if max_days is None else (
+            max_days * 86400), max_size, keep)
+
+
+def _repository(entry: CacheEntry) -> str | None:
+    """
+    Get the key of the repository an entry belongs to, if any.
+
+    :param entry: the entry
+    :return: the repository key, or `None`
+    """
+    return entry.name if entry.realm == "git" else entry.meta.get("repo")
+
+
+def _summarize(entries: Iterable[CacheEntry]) -> tuple[
+        dict[str, list], dict[str, list]]:
+    """
+    Sum up the number, size, and compute time of entries.
+
+    :param entries: the entries
+    :return: the lists of number, size, and seconds per realm and per
+        repository
+    """
+    realms: Final[dict[str, list]] = {}
+    repos: Final[dict[str, list]] = {}
+    for entry in entries:
+        size: int = entry.size or 0
+        seconds: float = entry_seconds(entry) or 0.0
+        for key, usage in ((entry.realm, realms), (
+                _repository(entry), repos)):
+            if key is not None:
+                counts = usage.setdefault(key, [0, 0, 0.0])
+                counts[0] += 1
+                counts[1] += size
+                counts[2] += seconds
+    return realms, repos
+
+
+def disk_usage(repo_dir: str = "__git__") -> list[str]:
+    """
+    Summarize the disk usage of the cache per realm and per repository.
+
+    The usage of a repository includes its clone or archive as well as
+    the outputs of the commands executed in it and the postprocessed files
+    taken from it.
+
+    :param repo_dir: the repository directory
+    :return: the lines of the summary
+    """
+    with ProcessManager(repo_dir) as pm:
+        entries: Final[list[CacheEntry]] = pm.list_entries()
+    realms, repos = _summarize(entries)
+    lines: Final[list[str]] = [
+        f"{format_size(s):>12} {n:>7} entries  realm {r}"
+        for r, (n, s, _) in sorted(realms.items())]
+    lines.extend(
+        f"{format_size(s):>12} {n:>7} entries  repository {r}"
+        for r, (n, s, _) in sorted(repos.items(), key=lambda x: -x[1][1]))
+    lines.append(f"{format_size(sum(s for _, s, _ in realms.values())):>12} "
+                 f"{list.__len__(entries):>7} entries  total")
+    return lines
+
+
+def list_cache(repo_dir: str = "__git__",
+               realm: str | None = None) -> list[str]:
+    """
+    List the entries of the cache.
+
+    Each line contains the realm and name of an entry, its size, its
+    creation time, its last use, the seconds it took to compute it, the
+    fingerprint of the request that produced it, and its path.
+
+    :param repo_dir: the repository directory
+    :param realm: the realm to list, or `None` to list all realms
+    :return: the lines of the listing
+    """
+    with ProcessManager(repo_dir) as pm:
+        entries: Final[list[CacheEntry]] = pm.list_entries(realm)
+    entries.sort(key=lambda e: (e.realm, e.name))
+    return [f"{e.realm} {e.name}  size={format_size(e.size or 0)}  "
+            f"created={format_time(e.created)}  used={format_time(e.used)}"
+            f"  compute={format_seconds(entry_seconds(e))}  "
+            f"request={e.request or '?'}  path={e.path}" for e in entries]
+
+
+def show_entry(realm: str, name: str,
+               repo_dir: str = "__git__") -> list[str]:
+    """
+    Describe a single entry of the cache.
+
+    The outputs of commands are stored under fingerprints. Their entries
+    can also be found via the names given to them, which are aliases of the
+    fingerprints.
+
+    :param realm: the realm of the entry
+    :param name: the name of the entry, or an alias of it
+    :param repo_dir: the repository directory
+    :return: the lines of the description
+    """
+    with ProcessManager(repo_dir) as pm:
+        entry: CacheEntry | None = pm.get_entry(realm, name)
+        if entry is None:
+            key: Final[str | None] = pm.get_alias(realm, name)
+            if key is not None:
+                entry = pm.get_entry(realm, key)
+    if entry is None:
+        raise ValueError(f"No entry {name!r} in realm {realm!r}.")
+    lines: Final[list[str]] = [
+        f"realm: {entry.realm}", f"name: {entry.name}",
+        f"path: {entry.path}", f"size: {format_size(entry.size or 0)}",
+        f"created: {format_time(entry.created)}",
+        f"used: {format_time(entry.used)}",
+        f"run: {'?' if entry.run is None else entry.run}",
+        f"compute: {format_seconds(entry_seconds(entry))}",
+        f"request: {entry.request or '?'}"]
+    lines.extend(f"meta.{k}: {v}" for k, v in sorted(entry.meta.items())
+                 if k != "seconds")
+    return lines
+
+
+def cache_stats(repo_dir: str = "__git__", top: int = 10) -> list[str]:
+    """
+    Summarize the entries of the cache and find the most expensive ones.
+
+    For each realm and each repository, the number of entries, their total
+    size, and the total seconds it took to compute them are listed. Then
+    the `top` entries that took the longest to compute follow, i.e., the
+    entries that would be the most expensive to regenerate.
+
+    :param repo_dir: the repository directory
+    :param top: the number of most expensive entries to list
+    :return: the lines of the summary
+    """
+    with ProcessManager(repo_dir) as pm:
+        entries: Final[list[CacheEntry]] = pm.list_entries()
+    realms, repos = _summarize(entries)
+    lines: Final[list[str]] = [
+        f"{format_size(s):>12} {format_seconds(c):>12} {n:>7} entries  "
+        f"realm {r}" for r, (n, s, c) in sorted(realms.items())]
+    lines.extend(
+        f"{format_size(s):>12} {format_seconds(c):>12} {n:>7} entries  "
+        f"repository {r}" for r, (n, s, c) in sorted(
+            repos.items(), key=lambda x: -x[1][2]))
+    lines.append(
+        f"{format_size(sum(s for _, s, _ in realms.values())):>12} "
+        f"{format_seconds(sum(c for _, _, c in realms.values())):>12} "
+        f"{list.__len__(entries):>7} entries  total")
+    expensive: Final[list[CacheEntry]] = sorted(
+        (e for e in entries if entry_seconds(e) is not None),
+        key=lambda e: -(entry_seconds(e) or 0.0))[:max(0, top)]
+    if list.__len__(expensive) > 0:
+        lines.append("most expensive entries to regenerate:")
+        lines.extend(
+            f"{format_seconds(entry_seconds(e)):>12} "
+            f"{format_size(e.size or 0):>12}  {e.realm} {e.name}"
+            for e in expensive)
+    return lines
+
+
+# Execute the cache tool
+if __name__ == "__main__":
+    parser: Final[argparse.ArgumentParser] = make_argparser(
+        __file__, "Maintain the texgit Cache.",
+        make_epilog(
+            "Export, import, and inspect the repository directory in which "
+            "texgit caches repositories and outputs.",
+            2023, 2025, "Thomas Weise",
+            url="https://thomasweise.github.io/texgit_py",
+            email="tweise@hfuu.edu.cn, tweise@ustc.edu.cn"),
+        __version__)
+    parser.add_argument(
+        "--repoDir", help="the directory used for caching output",
+        type=str, default="__git__")
+    commands = parser.add_subparsers(dest="command", required=True)
+    cmd = commands.add_parser(
+        "export", help="pack the cache into a snapshot archive")
+    cmd.add_argument("archive", help="the archive file to create", type=str)
+    cmd = commands.add_parser(
+        "import", help="restore the cache from a snapshot archive")
+    cmd.add_argument("archive", help="the archive file to import", type=str)
+    commands.add_parser(
+        "verify", help="check all entries and remove the invalid ones")
+    commands.add_parser(
+        "rebuild", help="rebuild the index from the sidecar files")
+    cmd = commands.add_parser(
+        "gc", help="remove unused entries and fit the cache into a budget")
+    cmd.add_argument(
+        "--maxRuns", help="remove entries not used during this many runs",
+        type=int, default=None)
+    cmd.add_argument(
+        "--maxDays", help="remove entries not used for this many days",
+        type=float, default=None)
+    cmd.add_argument(
+        "--maxSize", help="the maximum size of the cache, e.g., 2G",
+        type=parse_size, default=None)
+    cmd.add_argument(
+        "--aux", help="an aux file whose entries must be kept",
+        type=str, action="append", default=[])
+    commands.add_parser(
+        "du", help="print the disk usage per realm and repository")
+    cmd = commands.add_parser(
+        "ls", help="list the entries with their metadata")
+    cmd.add_argument("realm", help="the realm to list", type=str, nargs="?",
+                     default=None)
+    cmd = commands.add_parser(
+        "show", help="print all information about one entry")
+    cmd.add_argument("realm", help="the realm of the entry", type=str)
+    cmd.add_argument("name", help="the name of the entry", type=str)
+    cmd = commands.add_parser(
+        "stats", help="summarize the entries and their compute time")
+    cmd.add_argument(
+        "--top", help="the number of most expensive entries to list",
+        type=int, default=10)
+    cmd = commands.add_parser(
+        "shard", help="switch realms to the sharded directory layout")
+    cmd.add_argument(
+        "realms", help="the realms to shard", type=str, nargs="*",
+        default=list(SHARD_REALMS))
+    args: Final[argparse.Namespace] = parser.parse_args()
+
+    if args.command == "export":
+        export_cache(args.archive.strip(), args.repoDir.strip())
+    elif args.command == "import":
+        import_cache(args.archive.strip(), args.repoDir.strip())
+    elif args.command == "verify":
+        verify_cache(args.repoDir.strip())
+    elif args.command == "rebuild":
+        rebuild_cache(args.repoDir.strip())
+    elif args.command == "gc":
+        gc_cache(args.repoDir.strip(), args.maxRuns, args.maxDays,
+                 args.maxSize, args.aux)
+    elif args.command == "shard":
+        shard_cache(args.repoDir.strip(), args.realms)
+    elif args.command == "du":
+        for du_line in disk_usage(args.repoDir.strip()):
+            logger(du_line)
+    elif args.command == "ls":
+        for ls_line in list_cache(args.repoDir.strip(), args.realm):
+            logger(ls_line)
+    elif args.command == "show":
+        for show_line in show_entry(args.realm.strip(), args.name.strip(),
+                                    args.repoDir.strip()):
+            logger(show_line)
+    elif args.command == "stats":
+        for stats_line in cache_stats(args.repoDir.strip(), args.top):
+            logger(stats_line)
+    logger("All done.")
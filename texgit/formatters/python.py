@@ -4,6 +4,7 @@ import io
 import sys
 import token
 import tokenize
+from contextlib import redirect_stderr, redirect_stdout
 from re import MULTILINE, Pattern, sub
 from re import compile as re_compile
 from typing import Final, Iterable
@@ -346,8 +347,12 @@ def preprocess_python(code: list[str],
     return "\n".join(map(str.rstrip, keep_lines))
 
 
-# Execute the formatter as script
-if __name__ == "__main__":
+def make_parser() -> argparse.ArgumentParser:
+    """
+    Create the parser for the command line arguments of the formatter.
+
+    :return: the argument parser
+    """
     parser: Final[argparse.ArgumentParser] = make_argparser(
         __file__, "Execute the Python Formatter.",
         make_epilog(
@@ -369,11 +374,51 @@ if __name__ == "__main__":
                        "'hints' means keep type hints, "
                        "'comments' means keep comments ",
         type=str, default="", nargs="?")
-    args: Final[argparse.Namespace] = parser.parse_args()
-    input_lines: Final[list[str]] = sys.stdin.readlines()
-    sys.stdout.write(preprocess_python(
-        input_lines,
-        split_line_choices(args.lines),
-        split_labels(args.labels),
-        split_labels(args.args)))
+    return parser
+
+
+def run_formatter(args: list[str], stdin: str | None) -> str:
+    r"""
+    Run the formatter like a command, but inside the current process.
+
+    This produces exactly the output that
+    `python3 -m texgit.formatters.python` would write to `stdout`.
+
+    :param args: the command line arguments
+    :param stdin: the text received via `stdin`, or `None` for no input
+    :return: the text written to `stdout`
+
+    >>> run_formatter([], "def a( x ):\n    return  x # c\n")
+    'def a(x):\n    return x\n'
+    >>> run_formatter(["--args", "comments"], "def a( x ):\n    return  x # c")
+    'def a(x):\n    return x  # c\n'
+    >>> run_formatter(["--version"], None) == f"{__version__}\n"
+    True
+    >>> run_formatter(["--help"], None).startswith("usage: ")
+    True
+    >>> run_formatter(["--unknown"], None)
+    Traceback (most recent call last):
+    ...
+    SystemExit: 2
+    """
+    # argparse prints the help and version to stdout and errors to stderr,
+    # then exits, so we collect what the process would have written
+    stdout: Final[io.StringIO] = io.StringIO()
+    try:
+        with redirect_stdout(stdout), redirect_stderr(io.StringIO()):
+            parsed: argparse.Namespace = make_parser().parse_args(args)
+    except SystemExit as se:
+        if se.code not in {0, None}:
+            raise
+        return stdout.getvalue()
+    return preprocess_python(
+        io.StringIO(stdin or "", None).readlines(),
+        split_line_choices(parsed.lines),
+        split_labels(parsed.labels),
+        split_labels(parsed.args))
+
+
+# Execute the formatter as script
+if __name__ == "__main__":
+    sys.stdout.write(run_formatter(sys.argv[1:], sys.stdin.read()))
     sys.stdout.flush()
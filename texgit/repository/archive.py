@@ -0,0 +1,241 @@
+"""
+Fetch snapshots of `git` repositories as archives instead of cloning them.
+
+For repositories that we only read files from, downloading a single commit
+as a compressed tar archive is cheaper than a `git clone`, even a shallow
+one. The archive is either obtained via `http(s)` from the archive url of the
+repository, `<url>/archive/HEAD.tar.gz`, which only GitHub offers, or via
+`git archive --remote` from the repository or a mirror, which must allow
+it. Repositories on other `http(s)` servers have no archive source.
+
+The archive is stored inside the repository directory and files or
+directories are extracted from it only when they are requested. The commit
+of the snapshot is taken from the archive itself, where `git archive` stores
+it in the global `pax` header, so that
+:meth:`~texgit.repository.git.GitRepository.make_url` works as for clones.
+"""
+import datetime
+import json
+import tarfile
+from contextlib import suppress
+from os import remove as os_remove
+from shutil import copyfileobj
+from typing import Any, Final
+from urllib.request import urlopen
+
+from pycommons.io.console import logger
+from pycommons.io.path import Path
+from pycommons.net.url import URL
+from pycommons.processes.shell import Command
+from pycommons.strings.string_conv import datetime_to_datetime_str
+
+from texgit.repository.file_manager import replace_if_changed
+from texgit.repository.git import (
+    CLONE_TIMEOUT,
+    GitRepository,
+    get_base_url,
+    git,
+)
+
+#: the name of the archive file inside the repository directory
+ARCHIVE_FILE: Final[str] = ".texgit-archive.tar.gz"
+#: the name of the file with the information about the archive
+ARCHIVE_INFO: Final[str] = ".texgit-archive.json"
+
+
+def archive_url(url: str, ref: str = "HEAD") -> URL:
+    """
+    Get the url of the `tar.gz` archive of a repository.
+
+    :param url: the repository url
+    :param ref: the commit, branch, or tag
+    :return: the archive url
+    :raises ValueError: if the repository is not on GitHub, as the archive
+        url layout is specific to GitHub
+
+    >>> archive_url("https://github.com/thomasWeise/texgit_py.git")
+    'https://github.com/thomasWeise/texgit_py/archive/HEAD.tar.gz'
+    >>> archive_url("ssh://git@github.com/thomasWeise/texgit_py.git")
+    'https://github.com/thomasWeise/texgit_py/archive/HEAD.tar.gz'
+    >>> try:
+    ...     archive_url("https://gitlab.com/a/b.git")
+    ... except ValueError as ve:
+    ...     print(ve)
+    No archive url known for repository 'https://gitlab.com/a/b.git'.
+    """
+    base_url: Final[URL] = get_base_url(url)
+    if str.lower(base_url.host or "") != "github.com":
+        raise ValueError(f"No archive url known for repository {url!r}.")
+    return URL(f"{base_url}/archive/{ref}.tar.gz")
+
+
+def archive_source(url: str) -> str:
+    """
+    Get the default source of the archive of a repository.
+
+    :param url: the url or path of the repository
+    :return: the :func:`archive_url` for repositories on GitHub, otherwise
+        the url or path itself, for `git archive --remote`
+    :raises ValueError: if the repository is on an `http(s)` server other
+        than GitHub, as `git archive --remote` does not work via `http(s)`
+
+    >>> archive_source("ssh://git@github.com/thomasWeise/texgit_py.git")
+    'https://github.com/thomasWeise/texgit_py/archive/HEAD.tar.gz'
+    >>> archive_source("ssh://git@example.com/a/b.git")
+    'ssh://git@example.com/a/b.git'
+    >>> archive_source("/srv/git/b.git")
+    '/srv/git/b.git'
+    """
+    return archive_url(url) if str.lower(url).startswith((
+        "http://", "https://", "ssh://git@github.")) else url
+
+
+def download_archive(url: str, dest_dir: str,
+                     source: str | None = None) -> GitRepository:
+    """
+    Download a snapshot of a git repository as archive.
+
+    :param url: the repository url
+    :param dest_dir: the destination directory
+    :param source: the source of the archive: an `http(s)` url of the
+        `tar.gz` archive, or the url or path of a mirror that supports
+        `git archive --remote`; `None` for :func:`archive_source`
+    :return: the repository information
+    :raises ValueError: if the archive could not be fetched, in which case
+        no files are left in `dest_dir`
+    """
+    use_source: Final[str] = archive_source(url) if source is None \
+        else source
+    dest: Final[Path] = Path(dest_dir)
+    dest.ensure_dir_exists()
+    try:
+        return _download(url, dest, use_source)
+    except BaseException:
+        for name in (ARCHIVE_FILE, ARCHIVE_INFO):
+            with suppress(FileNotFoundError):
+                os_remove(dest.resolve_inside(name))
+        raise
+
+
+def _download(url: str, dest: Path, use_source: str) -> GitRepository:
+    """
+    Download a snapshot of a git repository as archive from a source.
+
+    :param url: the repository url
+    :param dest: the destination directory
+    :param use_source: the source of the archive
+    :return: the repository information
+    """
+    archive: Final[Path] = dest.resolve_inside(ARCHIVE_FILE)
+    is_http: Final[bool] = use_source.startswith(("http://", "https://"))
+    logger(f"starting to load archive of repository {url!r} from "
+           f"{use_source!r} to {archive!r}.")
+    if is_http:
+        with (urlopen(URL(use_source),  # nosec
+                      timeout=CLONE_TIMEOUT) as response,
+              open(archive, "wb") as output):
+            copyfileobj(response, output, 1 << 20)
+    else:
+        Command([git(), "archive", "--format=tar.gz",
+                 f"--remote={use_source}", f"--output={archive}", "HEAD"],
+                timeout=CLONE_TIMEOUT, working_dir=dest).execute(True)
+
+    # Archives from http servers usually put all files into a top-level
+    # directory, whose name we need to detect. `git archive` does not.
+    commit: str | None = None
+    mtime: int | None = None
+    prefix: str | None = None if is_http else ""
+    with tarfile.open(archive, "r:gz") as tar:
+        for member in tar:
+            commit = commit or tar.pax_headers.get("comment")
+            if mtime is None:
+                mtime = int(member.mtime)
+            if prefix is None:
+                prefix = member.name if member.isdir() and (
+                    "/" not in member.name) else ""
+            elif prefix and not ((member.name == prefix) or str.startswith(
+                    member.name, f"{prefix}/")):
+                prefix = ""
+    if (commit is None) or (mtime is None):
+        raise ValueError(f"Archive {use_source!r} has no commit information.")
+    date_time: Final[str] = datetime_to_datetime_str(
+        datetime.datetime.fromtimestamp(mtime, datetime.UTC))
+    dest.resolve_inside(ARCHIVE_INFO).write_all_str(json.dumps({
+        "url": url, "commit": commit, "date_time": date_time,
+        "prefix": prefix}))
+    logger(f"successfully loaded archive of repository {url!r} with commit "
+           f"{commit!r}.")
+    return GitRepository(dest, url, commit, date_time)
+
+
+def load_archive(path: str) -> GitRepository | None:
+    """
+    Load the information about a repository snapshot archive.
+
+    :param path: the repository directory
+    :return: the repository information, or `None` if the directory does
+        not contain a snapshot archive
+    """
+    dest: Final[Path] = Path(path)
+    info_file: Final[Path] = dest.resolve_inside(ARCHIVE_INFO)
+    if not (info_file.is_file()
+            and dest.resolve_inside(ARCHIVE_FILE).is_file()):
+        return None
+    info: Final[dict[str, str]] = json.loads(info_file.read_all_str())
+    return GitRepository(dest, info["url"], info["commit"],
+                         info["date_time"])
+
+
+def extract_from_archive(repo: GitRepository, relative_path: str) -> bool:
+    """
+    Extract a file or directory from the snapshot archive of a repository.
+
+    The archive is read as a stream and only the members belonging to the
+    requested path are written to disk. Reading stops as soon as a
+    requested file has been extracted. Files that already exist and
+    directories that have already been extracted completely are not
+    extracted again.
+
+    :param repo: the repository
+    :param relative_path: the relative path of the file or directory
+    :return: `True` if anything was extracted, `False` otherwise
+    """
+    dest: Final[Path] = repo.path.resolve_inside(relative_path)
+    if dest.is_file():
+        return False
+    info_file: Final[Path] = repo.path.resolve_inside(ARCHIVE_INFO)
+    if not info_file.is_file():
+        return False
+    info: Final[dict[str, Any]] = json.loads(info_file.read_all_str())
+    wanted: Final[str] = "" if dest == repo.path \
+        else dest.relative_to(repo.path)
+    done: Final[list[str]] = info.setdefault("extracted", [])
+    if any((not d) or (d == wanted) or wanted.startswith(f"{d}/")
+           for d in done):
+        return False
+    prefix: Final[str] = f"{info['prefix']}/" if info["prefix"] else ""
+    found: bool = False
+    with tarfile.open(repo.path.resolve_inside(ARCHIVE_FILE),
+                      "r|gz") as tar:
+        for member in tar:
+            if not member.name.startswith(prefix):
+                continue
+            name: str = member.name[str.__len__(prefix):]
+            if str.__len__(name) <= 0:
+                continue
+            if (not wanted) or (name == wanted) or name.startswith(
+                    f"{wanted}/"):
+                member.name = name
+                tar.extract(member, repo.path, filter="data")
+                found = True
+                if (name == wanted) and not member.isdir():
+                    break  # a single file, we are done
+    if found and dest.is_dir():
+        done.append(wanted)
+        # replace the file instead of overwriting it, as it may be a hard
+        # link to a file in a store shared with other projects
+        temp: Final[Path] = repo.path.resolve_inside(f"{ARCHIVE_INFO}.tmp")
+        temp.write_all_str(json.dumps(info))
+        replace_if_changed(temp, info_file)
+    logger(f"extracted {wanted!r} from archive of {repo.url!r}: {found}.")
+    return found
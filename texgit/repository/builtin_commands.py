@@ -0,0 +1,108 @@
+"""
+Commands that are executed inside the current process.
+
+Many commands used for post-processing files are Python modules that read
+text from `stdin` and write text to `stdout`, most prominently
+:mod:`texgit.formatters.python`. Executing them via
+`python3 -m <module> ...` means starting a new interpreter and importing all
+the modules again, which often takes much longer than the actual work.
+
+If a module is registered as builtin command, then
+:class:`~texgit.repository.process_manager.ProcessManager` calls the
+registered function directly in the current process instead. The function
+receives the command line arguments and the text from `stdin` and returns
+the text that the module would write to `stdout`. It must therefore parse
+its arguments exactly like the module does and must not depend on the
+working directory or the environment.
+
+Builtin commands are registered by the name of their module and the
+fully-qualified name of their function, so that the module is only imported
+when it is needed.
+
+Common text filters like `head` or `sed -n` are builtin commands as well,
+see :mod:`texgit.repository.filters`.
+"""
+from functools import partial
+from importlib import import_module
+from typing import Callable, Final
+
+from texgit.repository.filters import find_filter
+
+#: the builtin commands, mapping module names to the `module:function`
+#: names of the functions implementing them
+_BUILTINS: Final[dict[str, str]] = {
+    "texgit.formatters.python": "texgit.formatters.python:run_formatter",
+}
+
+
+def register_builtin(module: str, function: str) -> None:
+    """
+    Register a module as a builtin command.
+
+    :param module: the name of the module, as used in `python3 -m <module>`
+    :param function: the function implementing the command, given as
+        `module:function`; it receives the list of arguments and the text
+        from `stdin` (or `None`) and returns the text for `stdout`
+    """
+    mod, sep, func = str.partition(str.strip(function), ":")
+    if (not mod) or (not sep) or (not func):
+        raise ValueError(f"Invalid function {function!r} for builtin "
+                         f"command {module!r}.")
+    _BUILTINS[str.strip(module)] = f"{mod}:{func}"
+
+
+def find_builtin(command: list[str]) -> Callable[[str | None], str] | None:
+    r"""
+    Find the builtin command that can replace a command.
+
+    :param command: the normalized command
+    :return: the function implementing the command, which receives the text
+        from `stdin` (or `None`) and returns the text for `stdout`, or
+        `None` if the command is not a builtin command
+
+    >>> fmt = find_builtin(["python3", "-m", "texgit.formatters.python"])
+    >>> fmt.func.__name__
+    'run_formatter'
+    >>> print(find_builtin(["python3", "-m", "json.tool"]))
+    None
+    >>> print(find_builtin(["ls", "-m", "texgit.formatters.python"]))
+    None
+    >>> find_builtin(["sed", "-n", "2p"])("a\nb\nc\n")
+    'b\n'
+    """
+    if (list.__len__(command) < 3) or (command[1] != "-m") or (
+            not str.lower(command[0]).startswith("python3")):
+        return find_filter(command)
+    function: Final[str | None] = _BUILTINS.get(command[2])
+    if function is None:
+        return None
+    mod, _, func = str.partition(function, ":")
+    return partial(getattr(import_module(mod), func), command[3:])
+
+
+def run_builtin(function: Callable[[str | None], str], command: list[str],
+                stdin: str | None) -> str:
+    """
+    Run a builtin command.
+
+    Errors are reported like failed processes, i.e., as :class:`ValueError`.
+
+    :param function: the function implementing the command
+    :param command: the command, for error messages
+    :param stdin: the text for `stdin`, or `None`
+    :return: the text written to `stdout`
+
+    >>> cmd = ["python3", "-m", "texgit.formatters.python", "--lines", "x"]
+    >>> run_builtin(find_builtin(cmd), cmd, "")
+    Traceback (most recent call last):
+    ...
+    ValueError: Builtin command 'python3 -m texgit.formatters.python ...
+    """
+    try:
+        return function(stdin)
+    except SystemExit as se:  # raised by argparse on invalid arguments
+        raise ValueError(f"Builtin command {' '.join(command)!r} failed "
+                         f"with exit code {se.code}.") from se
+    except Exception as ex:
+        raise ValueError(
+            f"Builtin command {' '.join(command)!r} failed: {ex}") from ex
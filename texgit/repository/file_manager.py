@@ -18,13 +18,39 @@ Every realm-name combination always uniquely identifies a path and there can
 never be another realm-name combination pointing to the same path.
 If need be, the paths are randomized to avoid potential clashes.
 
-Once the file manager is closed, the realm-name to path associations are
-stored.
+The realm-name to path associations are stored in an `SQLite` database in
+the base directory, the index. Each new entry is written to the index as
+soon as it is complete, together with some metadata, namely its creation
+time, its size, and the fingerprint of the request that produced it, see
+:class:`CacheEntry`. Entries are read from the index only when they are
+needed. Their paths are checked when they are accessed the first time and
+the result is remembered, so a run touching ten entries only checks ten
+paths. :meth:`FileManager.verify` checks all entries in parallel.
+Next to each entry, a small hidden sidecar file stores its realm, name, and
+metadata. The index can therefore always be rebuilt by scanning the realm
+directories, which happens automatically if the index is lost or corrupt,
+see :meth:`FileManager.rebuild_index`.
 When a new file manager instance is created for the same base directory, the
-associations of realms-names to paths are restored.
+associations of realms-names to paths are therefore available again.
 This means that a program that creates output files for certain commands can
 then find these files again later.
 
+Every time an entry is used, the time and the number of the current run are
+stored in the index. Each file manager that uses at least one entry counts
+as one run. :meth:`FileManager.gc` uses this information to remove entries
+that have not been used for a long time and to evict the least recently used
+entries if the cache exceeds a size budget.
+
+Normally, all the files and directories of a realm are located directly in
+the realm directory. For realms with many entries, a sharded layout can be
+enabled via :meth:`FileManager.shard`. Then, new entries are put into two
+levels of sub-directories named after the first hexadecimal digits of the
+hash of their name, so that no directory ever contains too many entries.
+Existing entries are moved into the sharded layout one by one, each while
+holding its claim, so this can be done while the cache is in use. Since the
+index stores the path of each entry, this is transparent to the users of the
+file manager.
+
 :class:`~texgit.repository.git_manager.GitManager` is the base and root of
 the functionality of a managed repository of files and data.
 Step-by-step, functionality is added to the manager by derived classes.
@@ -39,17 +65,76 @@ to execute programs or scripts and to store their output in files to the
 :class:`~texgit.repository.git_manager.GitManager`.
 These programs and scripts may be located in `git` repositories that have
 automatically been downloaded.
+
+Besides the paths, a file manager can also store small records, i.e.,
+JSON-serializable values under a key in a named section. Derived classes use
+this to persist information that is not a path, e.g., the alias index of the
+repository urls.
+
+A file manager also keeps a negative cache: If a request, e.g., cloning a
+repository or executing a command, fails, then its fingerprint is stored
+together with the error message and the time. If the same request is made
+again within a certain time-to-live, it fails immediately with the same
+error instead of repeating the (possibly slow) failure.
+
+The whole cache of a file manager can be exported to a single compressed
+snapshot archive and imported again elsewhere, e.g., to restore it on a CI
+machine. Importing is incremental: Entries that already exist are kept.
+
+A file manager can also use a store shared with other projects, e.g., all
+the projects of a user, see :func:`default_store_dir`. The store is itself
+a file manager, whose entries are the results of requests, named after the
+fingerprints of the requests. New entries produced by a known request are
+put into the store and entries are taken from the store instead of being
+produced again. In both cases, single files are hard-linked and the files
+of directories are reflinked or copied, so the projects are thin views into
+the store that cannot modify it, while the names of the entries stay
+separate for each project.
+
+Several file managers, even in different processes, can safely share the same
+base directory. New paths are allocated under an advisory lock, so that no
+two entries get the same path. Expensive entries, e.g., cloned repositories,
+are created while holding a claim on their realm-name combination, see
+:meth:`FileManager._claim`. This way, they are created only once and are
+visible to the other processes right after the claim is released.
 """
 import json
-from contextlib import AbstractContextManager, suppress
+import sqlite3
+import tarfile
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import AbstractContextManager, contextmanager, suppress
+from dataclasses import dataclass, replace
+from fcntl import LOCK_EX, flock
+from functools import partial
+from hashlib import sha256
+from io import BytesIO
+from itertools import starmap
+from operator import itemgetter
 from os import close as os_close
+from os import environ, link, lstat, scandir, walk
 from os import remove as os_remove
+from os import replace as os_replace
+from os import stat as os_stat
+from os.path import expanduser, getsize, isfile, join, relpath, split
+from shutil import copy2, copymode, copytree
+from stat import S_ISDIR, S_ISREG
+from string import hexdigits
 from tempfile import mkstemp
-from typing import Callable, Final
+from time import time
+from typing import Any, Callable, Final, Generator, Iterable, Mapping, TextIO
 
-from pycommons.io.path import Path
+from pycommons.ds.immutable_map import immutable_mapping
+from pycommons.io.console import logger
+from pycommons.io.path import Path, delete_path
 from pycommons.strings.enforce import enforce_non_empty_str_without_ws
 
+from texgit.repository.workdir import clone_file
+
 #: the characters that are OK for a file name
 _FILENAME_OK: Callable[[str], bool] = set(
     "abcdefghijklmnopqrstuvwxyz"
@@ -67,6 +152,374 @@ def _make_key(s: str) -> str:
     return enforce_non_empty_str_without_ws(str.strip(s))
 
 
+#: the version of the index format inside cache snapshot archives
+_CACHE_VERSION: Final[int] = 2
+#: the version of the database schema
+_DB_VERSION: Final[int] = 2
+#: the default number of seconds for which a failed request is remembered
+FAILURE_TTL: Final[int] = 3600
+#: the record section of the negative cache of failed requests
+_FAILURES: Final[str] = "failures"
+#: the maximum length of a stored error message
+_MAX_ERROR_LEN: Final[int] = 1024
+#: the name of the index inside a cache snapshot archive
+_SNAPSHOT_INDEX: Final[str] = "index.json"
+#: the seconds to wait for a database locked by another process
+_DB_TIMEOUT: Final[int] = 600
+#: the number of threads checking paths in parallel
+_VERIFY_THREADS: Final[int] = 32
+#: the record section with the usage statistics
+_USAGE: Final[str] = "usage"
+#: the seconds after which files in a realm that are not in the index are
+#: considered orphans, i.e., leftovers of crashed or concurrent runs
+_ORPHAN_AGE: Final[int] = 86400
+#: the record section with the realms that use the sharded layout
+_SHARDED: Final[str] = "sharded"
+#: the record sections that describe the history of the local cache and are
+#: therefore neither exported to nor imported from cache snapshots
+_LOCAL_SECTIONS: Final[tuple[str, ...]] = (_FAILURES, _USAGE)
+#: the suffix of the sidecar files describing the entries
+_SIDECAR: Final[str] = ".texgit.json"
+#: the suffix of temporary files and directories, which are hidden
+TEMP_SUFFIX: Final[str] = ".tmp"
+
+#: the statements creating the database schema
+_DB_SCHEMA: Final[str] = """
+CREATE TABLE IF NOT EXISTS entries (
+    realm TEXT NOT NULL, name TEXT NOT NULL, path TEXT NOT NULL,
+    created REAL NOT NULL, size INTEGER, request TEXT, meta TEXT,
+    used REAL, run INTEGER,
+    PRIMARY KEY (realm, name)) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS records (
+    section TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,
+    PRIMARY KEY (section, key)) WITHOUT ROWID;
+"""
+#: the statements upgrading the database schema from an older version
+_DB_UPGRADES: Final[dict[int, str]] = {
+    1: "ALTER TABLE entries ADD COLUMN used REAL;"
+       "ALTER TABLE entries ADD COLUMN run INTEGER;",
+}
+#: the query selecting all entries, with the columns in the order of the
+#: fields of `CacheEntry`
+_SELECT_ENTRIES: Final[str] = (
+    "SELECT realm, name, path, created, size, request, meta, used, run "
+    "FROM entries")
+#: the query selecting the entries of a realm
+_SELECT_REALM: Final[str] = (
+    "SELECT realm, name, path, created, size, request, meta, used, run "
+    "FROM entries WHERE realm = ?")
+#: the query selecting one entry
+_SELECT_ENTRY: Final[str] = (
+    "SELECT realm, name, path, created, size, request, meta, used, run "
+    "FROM entries WHERE realm = ? AND name = ?")
+#: the statement adding an entry, if it does not exist yet
+_INSERT_ENTRY: Final[str] = (
+    "INSERT OR IGNORE INTO entries (realm, name, path, created, size, "
+    "request, meta, used, run) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+#: the statement adding or replacing an entry
+_REPLACE_ENTRY: Final[str] = (
+    "INSERT OR REPLACE INTO entries (realm, name, path, created, size, "
+    "request, meta, used, run) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+
+
+@contextmanager
+def _locked(path: Path) -> Generator[None, None, None]:
+    """
+    Hold an exclusive advisory lock on a lock file.
+
+    The lock is released when the lock file is closed, even if the process
+    dies.
+
+    :param path: the lock file, which is created if it does not exist
+    """
+    with open(path, "ab") as stream:
+        flock(stream.fileno(), LOCK_EX)
+        yield
+
+
+def fingerprint(request: Any) -> str:
+    """
+    Compute a fingerprint of a request.
+
+    :param request: the request, a JSON-serializable object
+    :return: the fingerprint, a hexadecimal hash string
+
+    >>> fingerprint(("clone", "github.com/a/b"))
+    '531b5a28fad0548ca4834aad9c42e023ee4e4b74b4e5e2b2db1501359daaea33'
+    >>> fingerprint({"b": 1, "a": 2}) == fingerprint({"a": 2, "b": 1})
+    True
+    """
+    return sha256(json.dumps(request, sort_keys=True).encode()).hexdigest()
+
+
+def file_hash(path: str) -> str:
+    """
+    Compute the SHA-256 hash of the contents of a file.
+
+    The file is read in chunks, so it is never loaded into memory as a whole.
+
+    :param path: the file
+    :return: the hash, as hexadecimal string
+    """
+    digest: Final = sha256()
+    with open(path, "rb") as stream:
+        while chunk := stream.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def replace_if_changed(temp: str, dest: str) -> bool:
+    """
+    Move a new version of a file into place if its contents differ.
+
+    If `dest` already has the same contents as `temp`, `temp` is deleted and
+    `dest` is left untouched, so that its modification time does not change
+    and tools like `make` or `latexmk` do not see a change. Otherwise, `temp`
+    atomically replaces `dest`, so readers never see a half-written file.
+    The sizes of the files are compared first, their hashes only if the
+    sizes are the same. A replaced file keeps its permissions.
+
+    :param temp: the new version of the file, in the same directory
+    :param dest: the destination file
+    :return: `True` if `dest` was replaced, `False` if it was unchanged
+
+    >>> from pycommons.io.temp import temp_dir
+    >>> with temp_dir() as td:
+    ...     td.resolve_inside("a").write_all_str("x")
+    ...     td.resolve_inside("b").write_all_str("x")
+    ...     td.resolve_inside("c").write_all_str("y")
+    ...     print(replace_if_changed(td.resolve_inside("a"),
+    ...                              td.resolve_inside("b")))
+    ...     print(td.resolve_inside("a").exists())
+    ...     print(replace_if_changed(td.resolve_inside("c"),
+    ...                              td.resolve_inside("b")))
+    ...     print(td.resolve_inside("b").read_all_str())
+    False
+    False
+    True
+    y
+    <BLANKLINE>
+    """
+    if isfile(dest) and (getsize(dest) == getsize(temp)) and (
+            file_hash(dest) == file_hash(temp)):
+        os_remove(temp)
+        return False
+    if isfile(dest):
+        copymode(dest, temp)
+    os_replace(temp, dest)
+    return True
+
+
+@contextmanager
+def write_if_changed(dest: str) -> Generator[TextIO, None, None]:
+    """
+    Write a text file, but only touch it if its contents change.
+
+    The text is written to a temporary file in the same directory, which
+    then replaces `dest` via :func:`replace_if_changed`. If an exception is
+    raised while writing, the temporary file is deleted and `dest` is not
+    changed.
+
+    :param dest: the destination file
+    :return: the stream to write the text to
+
+    >>> from os import stat
+    >>> from pycommons.io.temp import temp_dir
+    >>> with temp_dir() as td:
+    ...     f = td.resolve_inside("f.txt")
+    ...     with write_if_changed(f) as out:
+    ...         _ = out.write("abc")
+    ...     ino = stat(f).st_ino
+    ...     with write_if_changed(f) as out:
+    ...         _ = out.write("abc")
+    ...     print(stat(f).st_ino == ino)
+    ...     with write_if_changed(f) as out:
+    ...         _ = out.write("abd")
+    ...     print(stat(f).st_ino == ino, f.read_all_str())
+    True
+    False abd
+    """
+    head, tail = split(dest)
+    handle, temp = mkstemp(prefix=f".{tail}.", suffix=".tmp", dir=head)
+    try:
+        with open(handle, "w", encoding="utf-8", errors="strict") as output:
+            yield output
+        replace_if_changed(temp, dest)
+    except BaseException:
+        with suppress(FileNotFoundError):
+            os_remove(temp)
+        raise
+
+
+def _shard(name: str) -> str:
+    """
+    Get the relative shard directory of a name.
+
+    :param name: the name
+    :return: the two-level shard directory
+
+    >>> _shard("test")
+    '9f/86'
+    """
+    digest: Final[str] = sha256(name.encode()).hexdigest()
+    return f"{digest[:2]}/{digest[2:4]}"
+
+
+def _size(path: Path) -> int:
+    """
+    Compute the size of a file or of all files in a directory.
+
+    :param path: the path
+    :return: the size in bytes
+    """
+    if path.is_file():
+        return getsize(path)
+    total: int = 0
+    for root, _, files in walk(path):
+        for file in files:
+            with suppress(OSError):
+                total += lstat(join(root, file)).st_size
+    return total
+
+
+def _kind(path: str) -> bool | None:
+    """
+    Check whether a path is a file or a directory, using a single `stat`.
+
+    :param path: the path
+    :return: `True` for a file, `False` for a directory, and `None` if the
+        path does not exist or is something else
+    """
+    try:
+        mode: Final[int] = os_stat(path).st_mode
+    except OSError:
+        return None
+    if S_ISREG(mode):
+        return True
+    return False if S_ISDIR(mode) else None
+
+
+def _sidecar(path: str) -> str:
+    """
+    Get the path of the sidecar file describing an entry.
+
+    :param path: the path of the entry
+    :return: the path of the hidden sidecar file next to it
+
+    >>> _sidecar("/a/b/c.txt")
+    '/a/b/.c.txt.texgit.json'
+    """
+    head, tail = split(path)
+    return join(head, f".{tail}{_SIDECAR}")
+
+
+def _scan(directory: str) -> tuple[list[tuple[str, dict[str, Any]]],
+                                   list[str]]:
+    """
+    Scan a directory for the sidecar files of entries.
+
+    :param directory: the directory
+    :return: the paths of the entries together with the contents of their
+        sidecar files, and the sub-directories that may be shard directories
+    """
+    found: Final[list[tuple[str, dict[str, Any]]]] = []
+    names: Final[set[str]] = set()
+    with scandir(directory) as items:
+        children: Final[list] = list(items)
+    for child in children:
+        if not (child.name.startswith(".") and child.name.endswith(_SIDECAR)):
+            continue
+        name: str = child.name[1:-str.__len__(_SIDECAR)]
+        with (suppress(OSError, ValueError),
+              open(child.path, encoding="utf-8") as stream):
+            found.append((join(directory, name), json.load(stream)))
+            names.add(name)
+    return found, [child.path for child in children if (
+        child.name not in names) and (str.__len__(child.name) == 2) and all(
+        c in hexdigits for c in child.name) and child.is_dir(
+        follow_symlinks=False)]
+
+
+def _write_sidecar(path: str, realm: str, name: str,
+                   info: Mapping[str, Any]) -> None:
+    """
+    Write the sidecar file describing an entry.
+
+    The sidecar file is written to a temporary file first and then moved
+    into place if it changed, so it is always complete.
+
+    :param path: the path of the entry
+    :param realm: the realm of the entry
+    :param name: the name of the entry
+    :param info: the creation time, request fingerprint, and metadata
+    """
+    dest: Final[str] = _sidecar(path)
+    handle, temp = mkstemp(prefix=".", suffix=".tmp", dir=split(dest)[0])
+    os_close(handle)
+    Path(temp).write_all_str(json.dumps({
+        "realm": realm, "name": name, "created": info["created"],
+        "request": info["request"], "meta": info["meta"]}))
+    replace_if_changed(temp, dest)
+
+
+def default_store_dir() -> str:
+    """
+    Get the default directory of the store shared by all projects of a user.
+
+    :return: `$XDG_CACHE_HOME/texgit`, or `~/.cache/texgit` if the variable
+        `XDG_CACHE_HOME` is not set
+    """
+    return join(environ.get("XDG_CACHE_HOME") or expanduser("~/.cache"),
+                "texgit")
+
+
+def _link_or_copy(src: str, dest: str) -> None:
+    """
+    Create a hard link to a file, or copy it if that is not possible.
+
+    Hard links only work within the same file system.
+
+    :param src: the source file
+    :param dest: the destination file, which must not exist
+    """
+    try:
+        link(src, dest)
+    except OSError:
+        copy2(src, dest)
+
+
+def _link_tree(src: str, dest: str, hard_link: bool = True) -> None:
+    """
+    Turn a new, empty file or directory into a view of another one.
+
+    A single file is hard-linked if allowed, so it does not need any
+    additional space. This is safe for files that are only ever replaced as
+    a whole, never written in place. The files of a directory, e.g., the
+    working tree of a cloned repository, may be modified in place by the
+    commands executed in it, though. They, as well as single files that
+    must not be hard-linked, are therefore reflinks if the file system
+    supports them and copies otherwise, so that such changes cannot leak
+    between the store and the projects.
+
+    :param src: the source file or directory
+    :param dest: the existing destination file or directory
+    :param hard_link: may a single file be hard-linked?
+    """
+    if not isfile(src):
+        copytree(src, dest, symlinks=True, dirs_exist_ok=True,
+                 copy_function=partial(clone_file, hard_link=False))
+        return
+    head, tail = split(dest)
+    temp: Final[str] = join(head, f".{tail}.link")
+    with suppress(FileNotFoundError):
+        os_remove(temp)
+    if hard_link:
+        _link_or_copy(src, temp)
+    else:
+        clone_file(src, temp, False)
+    os_replace(temp, dest)
+
+
 def _make_ignore(path: Path) -> None:
     """
     Create a `.gitignore` file in the given path.
@@ -81,14 +534,77 @@ def _make_ignore(path: Path) -> None:
         file.ensure_file_exists()
 
 
+def _connect(count: int, edges: Iterable[tuple[int, int]]) -> list[list[int]]:
+    """
+    Group items that are connected by edges.
+
+    :param count: the number of items
+    :param edges: the pairs of items that belong together
+    :return: the groups of items, each in increasing order
+
+    >>> _connect(5, [(0, 3), (3, 4)])
+    [[0, 3, 4], [1], [2]]
+    >>> _connect(3, [])
+    [[0], [1], [2]]
+    >>> _connect(4, [(3, 2), (1, 0), (2, 1)])
+    [[0, 1, 2, 3]]
+    """
+    owner: Final[list[int]] = list(range(count))
+
+    def __root(i: int) -> int:
+        while owner[i] != i:
+            owner[i] = owner[owner[i]]
+            i = owner[i]
+        return i
+
+    for i, j in edges:
+        ri, rj = __root(i), __root(j)
+        owner[max(ri, rj)] = min(ri, rj)
+    groups: Final[dict[int, list[int]]] = {}
+    for i in range(count):
+        groups.setdefault(__root(i), []).append(i)
+    return list(groups.values())
+
+
+@dataclass(frozen=True)
+class CacheEntry:
+    """An immutable record of an entry in the index of a file manager."""
+
+    #: the realm of the entry
+    realm: str
+    #: the name of the entry
+    name: str
+    #: the path of the file or directory
+    path: Path
+    #: the time when the entry was created, in seconds since the epoch
+    created: float
+    #: the size of the file or directory in bytes, if known
+    size: int | None
+    #: the fingerprint of the request that produced the entry, if known
+    request: str | None
+    #: additional information about the entry
+    meta: Mapping[str, Any]
+    #: the time when the entry was last used, in seconds since the epoch
+    used: float
+    #: the number of the run in which the entry was last used, if known
+    run: int | None
+
+
 class FileManager(AbstractContextManager):
     """A manager for files."""
 
-    def __init__(self, base_dir: str) -> None:
+    def __init__(self, base_dir: str,
+                 failure_ttl: int = FAILURE_TTL,
+                 store_dir: str | None = None) -> None:
         """
         Set up the git repository manager.
 
         :param base_dir: the base directory
+        :param failure_ttl: the number of seconds for which failed requests
+            are not retried, `0` to always retry them
+        :param store_dir: the directory of the store shared with other
+            projects, see :func:`default_store_dir`, or `None` for no
+            shared store
         """
         #: the base directory of the repository manager
         self.__base_dir: Final[Path] = Path(base_dir)
@@ -101,31 +617,178 @@ class FileManager(AbstractContextManager):
         self.__realms_dir.ensure_dir_exists()
         _make_ignore(self.__realms_dir)
 
-        #: the internal cache file
-        self.__cache_file: Final[Path] = self.__base_dir.resolve_inside(
-            ".cache.json")
+        #: the index database
+        self.__db_file: Final[Path] = self.__base_dir.resolve_inside(
+            ".cache.db")
+        #: the lock file guarding the index creation and new paths
+        self.__lock_file: Final[Path] = self.__base_dir.resolve_inside(
+            ".cache.lock")
+        #: the directory with the lock files of the claims
+        self.__claims_dir: Final[Path] = self.__base_dir.resolve_inside(
+            ".claims")
+        #: the directory with the temporary views of directories
+        self.__views_dir: Final[Path] = self.__base_dir.resolve_inside(
+            ".views")
         #: we are open
         self.__is_open = True
+        #: the seconds for which failed requests are not retried
+        self.__failure_ttl: Final[int] = failure_ttl
 
-        #: the dictionary of realms and IDs
+        #: the dictionary of realms and the IDs that were already used
         self.__map: Final[dict[str, tuple[Path, dict[str, Path]]]] = {}
+        #: the new entries not yet written to the index, with their metadata
+        self.__pending: Final[dict[tuple[str, str], dict[str, Any]]] = {}
+        #: the paths that were checked, `True` for files, `False` for dirs
+        self.__kinds: Final[dict[Path, bool]] = {}
+        #: the entries used since the usage was last written to the index
+        self.__used: Final[set[tuple[str, str]]] = set()
+        #: the number of the current run, assigned when first needed
+        self.__run: int | None = None
+        #: whether the realms use the sharded layout
+        self.__sharded: Final[dict[str, bool]] = {}
+        #: the directory of the shared store, or `None` if there is none
+        self.__store_dir: Final[str | None] = store_dir
+        #: the file manager of the shared store, opened when first needed
+        self.__store: FileManager | None = None
+
+        with _locked(self.__lock_file):
+            db, version = self.__connect()
+            #: the connection to the index database
+            self.__db: Final[sqlite3.Connection] = db
+            if version != _DB_VERSION:
+                if version <= 0:
+                    self.__db.executescript(_DB_SCHEMA)
+                else:
+                    for v in range(version, _DB_VERSION):
+                        self.__db.executescript(_DB_UPGRADES[v])
+                self.__db.execute(f"PRAGMA user_version={_DB_VERSION}")
+                self.__migrate()
+                if version <= 0:
+                    self.__rebuild()
+
+    def __connect(self) -> tuple[sqlite3.Connection, int]:
+        """
+        Connect to the index database, replacing it if it is corrupt.
+
+        A corrupt index is moved aside and a new, empty one is created, which
+        is then rebuilt from the sidecar files of the entries.
+
+        :return: the connection and the version of the database schema
+        """
+        for _ in range(2):
+            db: sqlite3.Connection = sqlite3.connect(
+                self.__db_file, timeout=_DB_TIMEOUT)
+            try:
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("PRAGMA synchronous=NORMAL")
+                version: int = db.execute("PRAGMA user_version").fetchone()[0]
+            except sqlite3.DatabaseError as de:
+                db.close()
+                logger(f"Index {self.__db_file!r} is corrupt ({de}), moving "
+                       "it aside and rebuilding it.")
+                for suffix in ("", "-wal", "-shm"):
+                    with suppress(FileNotFoundError):
+                        os_replace(f"{self.__db_file}{suffix}",
+                                   f"{self.__db_file}.corrupt{suffix}")
+            else:
+                return db, version
+        raise ValueError(f"Cannot create index {self.__db_file!r}.")
+
+    def __migrate(self) -> None:
+        """Move the entries and records of an old `.cache.json` file."""
+        old: Final[Path] = self.__base_dir.resolve_inside(".cache.json")
+        if not old.is_file():
+            return
+        cache: dict[str, Any] = json.loads(old.read_all_str())
+        records: dict[str, dict[str, Any]] = {}
+        if cache.get("version") == _CACHE_VERSION:
+            records = cache["records"]
+            cache = cache["realms"]
+        created: Final[float] = time()
+        with self.__db:
+            self.__db.executemany(
+                "INSERT OR IGNORE INTO entries (realm, name, path, created) "
+                "VALUES (?, ?, ?, ?)", [
+                    (_make_key(realm), _make_key(name), path, created)
+                    for realm, names in cache.items()
+                    for name, path in names.items()])
+            self.__db.executemany(
+                "INSERT OR IGNORE INTO records VALUES (?, ?, ?)", [
+                    (_make_key(section), _make_key(key), json.dumps(value))
+                    for section, values in records.items()
+                    for key, value in values.items()])
+        os_remove(old)
+        logger(f"Migrated cache index {old!r} to {self.__db_file!r}.")
+
+    def __rebuild(self) -> int:
+        """
+        Add the entries described by sidecar files to the index.
+
+        The realm directories are scanned in parallel. Only the shard
+        directories inside them are descended into, so the contents of
+        directory entries are never read.
+
+        :return: the number of added entries
+        """
+        found: Final[list[tuple[str, dict[str, Any]]]] = []
+        with ThreadPoolExecutor(_VERIFY_THREADS) as pool:
+            running: set[Future] = {pool.submit(_scan, d) for d in
+                                    self.__realms_dir.list_dir(files=False)}
+            while set.__len__(running) > 0:
+                done, running = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    entries, subdirs = future.result()
+                    found.extend(entries)
+                    running.update(pool.submit(_scan, d) for d in subdirs)
+        rows: Final[list[tuple]] = []
+        sharded: Final[set[str]] = set()
+        for path, info in found:
+            kind: bool | None = _kind(path)
+            if kind is None:
+                continue
+            with suppress(KeyError, TypeError, ValueError):
+                realm: str = _make_key(info["realm"])
+                relative: str = relpath(path, join(self.__realms_dir, realm))
+                if relative.startswith(".."):
+                    continue
+                if "/" in relative:
+                    sharded.add(realm)
+                created: float = float(info["created"])
+                meta: Any = info.get("meta")
+                rows.append((realm, _make_key(info["name"]), relative,
+                             created, getsize(path) if kind else None,
+                             info.get("request"),
+                             None if meta is None else json.dumps(meta),
+                             created, None))
+        before: Final[int] = self.__db.total_changes
+        with self.__db:
+            self.__db.executemany(_INSERT_ENTRY, rows)
+        added: Final[int] = self.__db.total_changes - before
+        with self.__db:
+            self.__db.executemany(
+                "INSERT OR IGNORE INTO records VALUES (?, ?, ?)",
+                [(_SHARDED, realm, "true") for realm in sharded])
+        if list.__len__(found) > 0:
+            logger(f"Added {added} entries from {list.__len__(found)} sidecar "
+                   f"files to index {self.__db_file!r}.")
+        return added
+
+    def rebuild_index(self) -> int:
+        """
+        Rebuild the index from the sidecar files of the entries.
 
-        #: load the cache
-        if self.__cache_file.exists():
-            self.__cache_file.enforce_file()
-            for key, values in json.loads(
-                    self.__cache_file.read_all_str()).items():
-                realm = _make_key(key)
-                realm_dir = self.__realms_dir.resolve_inside(realm)
-                realm_map = {}
-                for name, path in values.items():
-                    use_name = _make_key(name)
-                    use_path = realm_dir.resolve_inside(path)
-                    if use_path.exists() and (
-                            use_path.is_file() or use_path.is_dir()):
-                        realm_map[use_name] = use_path
-                if dict.__len__(realm_map) > 0:
-                    self.__map[realm] = (realm_dir, realm_map)
+        Each entry has a hidden sidecar file next to it that records its
+        realm, name, creation time, request fingerprint, and metadata. If the
+        index is lost or corrupt, a new one is rebuilt automatically. This
+        method adds all entries with a sidecar file that are missing from the
+        index, e.g., after the index was restored from an old backup.
+
+        :return: the number of added entries
+        """
+        self._check_open()
+        self.__publish()
+        with _locked(self.__lock_file):
+            return self.__rebuild()
 
     def _check_open(self) -> None:
         """Enforce that the file manager is open."""
@@ -139,10 +802,136 @@ class FileManager(AbstractContextManager):
         :return: the list of sensitive paths
         """
         paths: Final[list[Path]] = [
-            self.__base_dir, self.__realms_dir, self.__cache_file]
-        paths.extend(map(self.__realms_dir.resolve_inside, self.__map.keys()))
+            self.__base_dir, self.__realms_dir, self.__db_file]
+        realms: Final[set[str]] = set(self.__map.keys())
+        realms.update(r for (r, ) in self.__db.execute(
+            "SELECT DISTINCT realm FROM entries"))
+        paths.extend(map(self.__realms_dir.resolve_inside, realms))
         return paths
 
+    def _get_view_dir(self, name: str) -> Path:
+        """
+        Get the path for a temporary view of a directory.
+
+        The path is inside the base directory, i.e., on the same file system
+        as the realms, but not in any realm. It does not exist yet.
+
+        :param name: the name of the view, e.g., the fingerprint of the
+            request using it
+        :return: the path for the view
+        """
+        self._check_open()
+        self.__views_dir.ensure_dir_exists()
+        return self.__views_dir.resolve_inside(_make_key(name))
+
+    def __get_realm(self, realm: str) -> tuple[Path, dict[str, Path]]:
+        """
+        Get the directory and name map of a realm, creating it if needed.
+
+        :param realm: the realm
+        :return: the realm directory and the map of names to paths
+        """
+        if realm in self.__map:
+            return self.__map[realm]
+        realm_dir: Final[Path] = self.__realms_dir.resolve_inside(realm)
+        realm_dir.ensure_dir_exists()
+        _make_ignore(realm_dir)
+        result: Final[tuple[Path, dict[str, Path]]] = realm_dir, {}
+        self.__map[realm] = result
+        return result
+
+    def __lookup(self, realm: str, name: str) -> Path | None:
+        """
+        Look up the path of a name in a realm, consulting the index.
+
+        The path of an entry is checked only once, when it is read from the
+        index. Entries whose path no longer exists are ignored.
+
+        :param realm: the realm
+        :param name: the name
+        :return: the path, or `None` if there is no valid entry
+        """
+        if (realm in self.__map) and (name in self.__map[realm][1]):
+            return self.__map[realm][1][name]
+        row: Final[tuple[str] | None] = self.__db.execute(
+            "SELECT path FROM entries WHERE realm = ? AND name = ?",
+            (realm, name)).fetchone()
+        if row is None:
+            return None
+        realm_dir, realm_map = self.__get_realm(realm)
+        path: Final[Path] = realm_dir.resolve_inside(row[0])
+        kind: Final[bool | None] = _kind(path)
+        if kind is None:
+            return None
+        realm_map[name] = path
+        self.__kinds[path] = kind
+        return path
+
+    def __add(self, realm: str, name: str, path: Path, is_file: bool,
+              created: float | None = None) -> None:
+        """
+        Add a new entry, to be written to the index by :meth:`__publish`.
+
+        :param realm: the realm
+        :param name: the name
+        :param path: the path
+        :param is_file: is the path a file (`True`) or directory (`False`)?
+        :param created: the creation time, `None` for now
+        """
+        self.__get_realm(realm)[1][name] = path
+        self.__kinds[path] = is_file
+        self.__pending[realm, name] = {
+            "created": time() if created is None else created,
+            "request": None, "meta": None}
+
+    def __get_run(self) -> int:
+        """
+        Get the number of the current run.
+
+        :return: the number of the current run
+        """
+        if self.__run is None:
+            with _locked(self.__lock_file):
+                self.__run = (self._get_record(_USAGE, "run") or 0) + 1
+                self._set_record(_USAGE, "run", self.__run)
+        return self.__run
+
+    def __publish(self) -> None:
+        """Write the new entries and the usage to the index."""
+        if dict.__len__(self.__pending) > 0:
+            run: Final[int] = self.__get_run()
+            rows: Final[list[tuple]] = []
+            shares: Final[list[tuple]] = []
+            for (realm, name), info in self.__pending.items():
+                realm_dir, realm_map = self.__map[realm]
+                path: Path | None = realm_map.get(name)
+                if (path is None) or (not path.exists()):
+                    continue
+                _write_sidecar(path, realm, name, info)
+                if (info["request"] is not None) and not info.get("shared"):
+                    shares.append((realm, info["request"], path, info["meta"]))
+                rows.append((realm, name, path.relative_to(realm_dir),
+                             info["created"], _size(path), info["request"],
+                             None if info["meta"] is None
+                             else json.dumps(info["meta"]),
+                             info["created"], run))
+                self.__used.discard((realm, name))
+            self.__pending.clear()
+            with self.__db:
+                self.__db.executemany(_REPLACE_ENTRY, rows)
+            if self.__store_dir is not None:
+                for share in shares:
+                    self.__share(*share)
+        if set.__len__(self.__used) > 0:
+            used: Final[list[tuple]] = [
+                (time(), self.__get_run(), realm, name)
+                for realm, name in self.__used]
+            self.__used.clear()
+            with self.__db:
+                self.__db.executemany(
+                    "UPDATE entries SET used = ?, run = ? WHERE realm = ? "
+                    "AND name = ?", used)
+
     def __get(self, realm: str, name: str,
               is_file: bool,
               prefix: str | None = None,
@@ -166,51 +955,45 @@ class FileManager(AbstractContextManager):
         if suffix is not None:
             suffix = _make_key(suffix)
 
-        if realm in self.__map:
-            realm_dir, realm_map = self.__map[realm]
-        else:
-            realm_dir = self.__realms_dir.resolve_inside(realm)
-            realm_dir.ensure_dir_exists()
-            _make_ignore(realm_dir)
-            realm_map = {}
-            self.__map[realm] = realm_dir, realm_map
-
-        result: Path | None = None
+        result: Path | None = self.__lookup(realm, name)
         is_new: bool = False
-        if name in realm_map:
-            result = realm_map[name]
-        else:
+        if result is None:
+            realm_dir, _ = self.__get_realm(realm)
+            if self.__is_sharded(realm):
+                realm_dir = realm_dir.resolve_inside(_shard(name))
+                realm_dir.ensure_dir_exists()
             is_new = True
             rootname = prefix or "".join(filter(_FILENAME_OK, name))
             usename = rootname
             if suffix:
                 usename = f"{usename}{suffix}"
 
-            if usename:
-                test = realm_dir.resolve_inside(usename)
-                if not test.exists():
-                    if is_file:
-                        if not test.ensure_file_exists():
+            # other processes may allocate paths in the same realm
+            with _locked(self.__lock_file):
+                if usename:
+                    test = realm_dir.resolve_inside(usename)
+                    if not test.exists():
+                        if is_file:
+                            if not test.ensure_file_exists():
+                                result = test
+                        else:
+                            test.ensure_dir_exists()
                             result = test
-                    else:
-                        test.ensure_dir_exists()
-                        result = test
-
-            if result is None:
-                (handle, fpath) = mkstemp(prefix=rootname or None,
-                                          suffix=suffix, dir=realm_dir)
-                os_close(handle)
-                result = Path(fpath)
-                if not is_file:
-                    with suppress(FileNotFoundError):
-                        os_remove(result)
-                    result.ensure_dir_exists()
-            realm_map[name] = result
 
-        if is_file:
-            result.enforce_file()
-        else:
-            result.enforce_dir()
+                if result is None:
+                    (handle, fpath) = mkstemp(prefix=rootname or None,
+                                              suffix=suffix, dir=realm_dir)
+                    os_close(handle)
+                    result = Path(fpath)
+                    if not is_file:
+                        with suppress(FileNotFoundError):
+                            os_remove(result)
+                        result.ensure_dir_exists()
+            self.__add(realm, name, result, is_file)
+        elif self.__kinds[result] != is_file:
+            raise ValueError(f"{result!r} is not a "
+                             f"{'file' if is_file else 'directory'}.")
+        self.__used.add((realm, name))
 
         bn: Final[str] = result.basename()
         if prefix and (not bn.startswith(prefix)):
@@ -219,6 +1002,336 @@ class FileManager(AbstractContextManager):
             raise ValueError(f"suffix={suffix!r} but f={result!r}.")
         return result, is_new
 
+    def _describe(self, realm: str, name: str, request: str | None = None,
+                  meta: Mapping[str, Any] | None = None) -> None:
+        """
+        Store information about how an entry was produced.
+
+        An entry produced by a request is put into the shared store, if there
+        is one: a new entry when the index is written, an existing entry
+        right away.
+
+        :param realm: the realm
+        :param name: the name or ID of the file or directory
+        :param request: the fingerprint of the request producing the entry
+        :param meta: additional JSON-serializable information
+        """
+        self._check_open()
+        key: Final[tuple[str, str]] = (_make_key(realm), _make_key(name))
+        use_meta: Final[dict[str, Any] | None] = \
+            None if meta is None else dict(meta)
+        if key in self.__pending:
+            self.__pending[key].update(request=request, meta=use_meta)
+            return
+        with self.__db:
+            self.__db.execute(
+                "UPDATE entries SET request = ?, meta = ? WHERE realm = ? "
+                "AND name = ?", (request, None if use_meta is None
+                                 else json.dumps(use_meta), *key))
+        row: Final[tuple[float] | None] = self.__db.execute(
+            "SELECT created FROM entries WHERE realm = ? AND name = ?",
+            key).fetchone()
+        path: Final[Path | None] = self.__lookup(*key)
+        if (row is not None) and (path is not None):
+            _write_sidecar(path, *key, {
+                "created": row[0], "request": request, "meta": use_meta})
+            if (request is not None) and (self.__store_dir is not None):
+                self.__share(key[0], request, path, use_meta)
+
+    def get_entry(self, realm: str, name: str) -> CacheEntry | None:
+        """
+        Get the index entry of a name in a realm.
+
+        :param realm: the realm
+        :param name: the name or ID of the file or directory
+        :return: the entry, or `None` if there is none
+        """
+        self._check_open()
+        realm = _make_key(realm)
+        name = _make_key(name)
+        if (realm, name) in self.__pending:
+            info: Final[dict[str, Any]] = self.__pending[realm, name]
+            return CacheEntry(realm, name, self.__map[realm][1][name],
+                              info["created"], None, info["request"],
+                              immutable_mapping(info["meta"] or {}),
+                              info["created"], self.__run)
+        return self.__entry(self.__db.execute(
+            _SELECT_ENTRY, (realm, name)).fetchone())
+
+    def __entry(self, row: tuple | None) -> CacheEntry | None:
+        """
+        Turn a row of the index into an entry, if its path is valid.
+
+        :param row: the row with the columns of `_SELECT_ENTRIES`, or `None`
+        :return: the entry, or `None` if the row is `None` or the path of
+            the entry is invalid
+        """
+        if row is None:
+            return None
+        path: Final[Path | None] = self.__lookup(row[0], row[1])
+        if path is None:
+            return None
+        return CacheEntry(row[0], row[1], path, row[3], row[4], row[5],
+                          immutable_mapping(json.loads(row[6] or "{}")),
+                          row[3] if row[7] is None else row[7], row[8])
+
+    def list_entries(self, realm: str | None = None) -> list[CacheEntry]:
+        """
+        List the entries in the index.
+
+        :param realm: the realm to list, or `None` to list all realms
+        :return: the list of entries
+        """
+        self._check_open()
+        self.__publish()
+        rows: Final[list[tuple]] = self.__db.execute(
+            _SELECT_ENTRIES).fetchall() if realm is None else \
+            self.__db.execute(_SELECT_REALM, (_make_key(realm), )).fetchall()
+        return [e for e in map(self.__entry, rows) if e is not None]
+
+    def gc(self, max_runs: int | None = None, max_age: float | None = None,
+           max_size: int | None = None,
+           keep: Iterable[str] = ()) -> list[CacheEntry]:
+        """
+        Remove unused entries and evict entries to fit into a size budget.
+
+        First, all entries that were not used during the last `max_runs`
+        runs or the last `max_age` seconds are removed. Then, if the
+        remaining entries together are larger than `max_size` bytes, the
+        least recently used entries are removed until the rest fits. Entries
+        used by this file manager and entries that are or contain any of the
+        paths in `keep` are never removed. Entries that belong together, see
+        :meth:`_get_companions`, are only kept or removed together. Finally,
+        files and directories in the realms that do not belong to any entry
+        and are older than a day are deleted, including temporary ones left
+        behind by crashed runs, e.g., of interrupted clones.
+
+        :param max_runs: the number of runs after which unused entries are
+            removed, or `None` to not remove entries based on runs
+        :param max_age: the seconds after which unused entries are removed,
+            or `None` to not remove entries based on their age
+        :param max_size: the maximum total size of the entries in bytes, or
+            `None` for no budget
+        :param keep: the paths that must be kept, e.g., the paths used by
+            the current `aux` file
+        :return: the removed entries
+        """
+        self._check_open()
+        entries: Final[list[CacheEntry]] = self.list_entries()
+        keep_paths: Final[list[Path]] = [Path(k) for k in keep]
+        last_run: Final[int] = self._get_record(_USAGE, "run") or 0
+        now: Final[float] = time()
+
+        removed: Final[list[CacheEntry]] = []
+        candidates: Final[list[tuple[float, int, list[CacheEntry]]]] = []
+        sizes: Final[list[tuple[int, str, str]]] = []
+        total: int = 0
+        for i, entry in enumerate(entries):
+            if entry.size is None:  # e.g., migrated from an old index
+                entries[i] = replace(entry, size=_size(entry.path))
+                sizes.append((entries[i].size, entry.realm, entry.name))
+        index: Final[dict[tuple[str, str], int]] = {
+            (entry.realm, entry.name): i for i, entry in enumerate(entries)}
+        for group in _connect(list.__len__(entries), (
+                (i, index[key]) for i, entry in enumerate(entries)
+                for key in self._get_companions(entry) if key in index)):
+            members: list[CacheEntry] = [entries[i] for i in group]
+            size: int = sum(entry.size or 0 for entry in members)
+            if any(((self.__run is not None) and (
+                    entry.run == self.__run)) or any(
+                    (k == entry.path) or k.startswith(f"{entry.path}/")
+                    for k in keep_paths) for entry in members):
+                total += size
+            elif all(((max_runs is not None) and (
+                    last_run - (entry.run or 0) >= max_runs)) or (
+                    (max_age is not None) and (now - entry.used > max_age))
+                    for entry in members):
+                removed.extend(members)
+            else:
+                total += size
+                candidates.append((max(entry.used for entry in members),
+                                   size, members))
+        if (max_size is not None) and (total > max_size):
+            candidates.sort(key=itemgetter(0))
+            for _, size, members in candidates:
+                if total <= max_size:
+                    break
+                removed.extend(members)
+                total -= size
+
+        with self.__db:
+            self.__db.executemany(
+                "UPDATE entries SET size = ? WHERE realm = ? AND name = ?",
+                sizes)
+        for entry in removed:
+            self.delete(entry.realm, entry.name)
+        self.__remove_orphans(now - _ORPHAN_AGE)
+        logger(f"Removed {list.__len__(removed)} of {list.__len__(entries)} "
+               f"cache entries, the remaining ones have {total} bytes.")
+        return removed
+
+    def __remove_orphans(self, before: float) -> None:
+        """
+        Delete the files and directories in the realms without entry.
+
+        :param before: only paths last modified before this time are deleted
+        """
+        known: Final[set[str]] = set(starmap(join, self.__db.execute(
+            "SELECT realm, path FROM entries")))
+        known.update(join(realm, path.relative_to(self.__map[realm][0]))
+                     for realm, name in self.__pending
+                     for path in (self.__map[realm][1][name], ))
+        parents: Final[set[str]] = set()  # e.g., the shard directories
+        for path in known:
+            parts: list[str] = path.split("/")
+            parents.update("/".join(parts[:i])
+                           for i in range(2, list.__len__(parts)))
+        todo: Final[list[Path]] = list(
+            self.__realms_dir.list_dir(files=False))
+        while list.__len__(todo) > 0:
+            for child in todo.pop().list_dir():
+                relative: str = child.relative_to(self.__realms_dir)
+                if relative in known:
+                    continue
+                base: str = child.basename()
+                if base.startswith("."):
+                    if (lstat(child).st_mtime < before) and (
+                            base.endswith(TEMP_SUFFIX) or (base.endswith(
+                                _SIDECAR) and (join(split(relative)[0], base[
+                                    1:-str.__len__(_SIDECAR)]) not in known))):
+                        logger(f"Deleting orphaned {child!r}.")
+                        delete_path(child)
+                    continue
+                if relative in parents:
+                    todo.append(child)
+                elif lstat(child).st_mtime < before:
+                    logger(f"Deleting orphaned {child!r}.")
+                    delete_path(child)
+
+    def __is_sharded(self, realm: str) -> bool:
+        """
+        Check whether a realm uses the sharded layout.
+
+        :param realm: the realm
+        :return: `True` if new entries are put into shard directories
+        """
+        if realm not in self.__sharded:
+            self.__sharded[realm] = bool(self._get_record(_SHARDED, realm))
+        return self.__sharded[realm]
+
+    def shard(self, realm: str) -> int:
+        """
+        Switch a realm to the sharded layout and move its existing entries.
+
+        From now on, new entries of the realm are put into shard directories
+        by all file managers using the same base directory. The existing
+        entries are moved one by one, each while holding its claim.
+
+        :param realm: the realm
+        :return: the number of moved entries
+        """
+        self._check_open()
+        realm = _make_key(realm)
+        self._set_record(_SHARDED, realm, True)
+        self.__sharded[realm] = True
+        self.__publish()
+        realm_dir, realm_map = self.__get_realm(realm)
+        moved: int = 0
+        for (name, ) in self.__db.execute(
+                "SELECT name FROM entries WHERE realm = ? AND path NOT LIKE "
+                "'%/%'", (realm, )).fetchall():
+            with self._claim(realm, name):
+                row: tuple[str] | None = self.__db.execute(
+                    "SELECT path FROM entries WHERE realm = ? AND name = ?",
+                    (realm, name)).fetchone()
+                if (row is None) or ("/" in row[0]):
+                    continue  # removed or moved by another process
+                path: Path = realm_dir.resolve_inside(row[0])
+                dest_dir: Path = realm_dir.resolve_inside(_shard(name))
+                dest_dir.ensure_dir_exists()
+                dest: Path = dest_dir.resolve_inside(row[0])
+                if (not path.exists()) or dest.exists():
+                    continue
+                os_replace(path, dest)
+                with suppress(FileNotFoundError):
+                    os_replace(_sidecar(path), _sidecar(dest))
+                with self.__db:
+                    self.__db.execute(
+                        "UPDATE entries SET path = ? WHERE realm = ? AND "
+                        "name = ?", (dest.relative_to(realm_dir), realm, name))
+                if name in realm_map:
+                    del self.__kinds[realm_map.pop(name)]
+                moved += 1
+        logger(f"Moved {moved} entries of realm {realm!r} to shards.")
+        return moved
+
+    def _get_record(self, section: str, key: str) -> Any:
+        """
+        Get a record stored in the file manager.
+
+        :param section: the section of the record
+        :param key: the key of the record
+        :return: the stored value, or `None` if there is none
+        """
+        self._check_open()
+        row: Final[tuple[str] | None] = self.__db.execute(
+            "SELECT value FROM records WHERE section = ? AND key = ?",
+            (_make_key(section), _make_key(key))).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def _set_record(self, section: str, key: str, value: Any) -> None:
+        """
+        Store a record in the file manager.
+
+        The value must be serializable to JSON. It is written to the index
+        immediately. Setting a value of `None` deletes the record.
+
+        :param section: the section of the record
+        :param key: the key of the record
+        :param value: the value
+        """
+        self._check_open()
+        section = _make_key(section)
+        key = _make_key(key)
+        with self.__db:
+            if value is None:
+                self.__db.execute(
+                    "DELETE FROM records WHERE section = ? AND key = ?",
+                    (section, key))
+            else:
+                self.__db.execute(
+                    "INSERT OR REPLACE INTO records VALUES (?, ?, ?)",
+                    (section, key, json.dumps(value)))
+
+    def _check_failure(self, request: str) -> None:
+        """
+        Fail immediately if a request has failed recently.
+
+        :param request: the fingerprint of the request
+        :raises ValueError: with the cached error message if the request
+            failed less than the failure time-to-live ago
+        """
+        failure: Final[Any] = self._get_record(_FAILURES, request)
+        if failure is None:
+            return
+        age: Final[float] = time() - failure["time"]
+        if 0 <= age < self.__failure_ttl:
+            raise ValueError(f"Request {request} failed {age:.0f}s ago, not "
+                             f"retrying: {failure['error']}")
+        self._set_record(_FAILURES, request, None)
+
+    def _note_failure(self, request: str, error: BaseException) -> None:
+        """
+        Remember that a request has failed.
+
+        :param request: the fingerprint of the request
+        :param error: the error that the request raised
+        """
+        message: Final[str] = str(error)[:_MAX_ERROR_LEN]
+        logger(f"Remembering failure of request {request}: {message}")
+        self._set_record(_FAILURES, request, {
+            "error": message, "time": time()})
+
     def list_realm(self, realm: str, files: bool = True,
                    directories: bool = True) -> tuple[Path, ...]:
         """
@@ -230,22 +1343,71 @@ class FileManager(AbstractContextManager):
         :return: the iterator with the data
         """
         realm = _make_key(realm)
+        for (name, ) in self.__db.execute(
+                "SELECT name FROM entries WHERE realm = ?",
+                (realm, )).fetchall():
+            self.__lookup(realm, name)
         if realm in self.__map:
-            _, realm_map = self.__map[_make_key(realm)]
-            return tuple(filter(lambda v: (files and v.is_file()) or (
-                directories and v.is_dir()), realm_map.values()))
+            _, realm_map = self.__map[realm]
+            return tuple(filter(lambda v: files if self.__kinds[v] else (
+                directories), realm_map.values()))
         return ()
 
-    def get_dir(self, realm: str, name: str) -> tuple[Path, bool]:
+    def verify(self, realm: str | None = None) -> int:
+        """
+        Check all entries in the index and remove the invalid ones.
+
+        An entry is invalid if its path does not exist or is neither a file
+        nor a directory. The paths are checked by several threads in
+        parallel, which is much faster on network file systems.
+
+        :param realm: the realm to check, or `None` to check all realms
+        :return: the number of removed entries
+        """
+        self._check_open()
+        self.__publish()
+        rows: Final[list[tuple[str, str, str]]] = self.__db.execute(
+            "SELECT realm, name, path FROM entries").fetchall() \
+            if realm is None else self.__db.execute(
+                "SELECT realm, name, path FROM entries WHERE realm = ?",
+                (_make_key(realm), )).fetchall()
+        dirs: Final[dict[str, Path]] = {
+            r: self.__get_realm(r)[0] for r in {row[0] for row in rows}}
+
+        def __check(row: tuple[str, str, str]) -> tuple[Path, bool | None]:
+            path: Path = dirs[row[0]].resolve_inside(row[2])
+            return path, _kind(path)
+
+        invalid: Final[list[tuple[str, str]]] = []
+        with ThreadPoolExecutor(_VERIFY_THREADS) as pool:
+            for (rlm, name, _), (path, kind) in zip(
+                    rows, pool.map(__check, rows), strict=True):
+                realm_map: dict[str, Path] = self.__map[rlm][1]
+                if kind is None:
+                    invalid.append((rlm, name))
+                    realm_map.pop(name, None)
+                else:
+                    realm_map[name] = path
+                    self.__kinds[path] = kind
+        with self.__db:
+            self.__db.executemany(
+                "DELETE FROM entries WHERE realm = ? AND name = ?", invalid)
+        logger(f"Verified {list.__len__(rows)} cache entries, removed "
+               f"{list.__len__(invalid)} invalid ones.")
+        return list.__len__(invalid)
+
+    def get_dir(self, realm: str, name: str,
+                prefix: str | None = None) -> tuple[Path, bool]:
         """
         Get a directory representing the given name in the given realm.
 
         :param realm: the realm
         :param name: the name or ID that the directory should represent
+        :param prefix: the optional prefix
         :return: the directory path and a `bool` indicating whether it was
             newly generated (`True`) or not if it already existed (`False`)
         """
-        return self.__get(realm, name, False)
+        return self.__get(realm, name, False, prefix)
 
     def get_file(self, realm: str, name: str,
                  prefix: str | None = None,
@@ -262,20 +1424,370 @@ class FileManager(AbstractContextManager):
         """
         return self.__get(realm, name, True, prefix, suffix)
 
+    def delete(self, realm: str, name: str) -> bool:
+        """
+        Delete the file or directory representing a name in a realm.
+
+        :param realm: the realm
+        :param name: the name or ID of the file or directory
+        :return: `True` if the path was deleted, `False` if there was none
+        """
+        self._check_open()
+        realm = _make_key(realm)
+        name = _make_key(name)
+        path: Final[Path | None] = self.__lookup(realm, name)
+        self.__pending.pop((realm, name), None)
+        if realm in self.__map:
+            self.__map[realm][1].pop(name, None)
+        if path is not None:
+            self.__kinds.pop(path, None)
+        with self.__db:
+            self.__db.execute(
+                "DELETE FROM entries WHERE realm = ? AND name = ?",
+                (realm, name))
+        if path is None:
+            return False
+        with suppress(FileNotFoundError):
+            os_remove(_sidecar(path))
+        if path.exists():
+            delete_path(path)
+        return True
+
+    def _find(self, realm: str, name: str) -> Path | None:
+        """
+        Get the path representing a name in a realm, if there is one.
+
+        :param realm: the realm
+        :param name: the name or ID of the file or directory
+        :return: the path, or `None` if the name is not yet known
+        """
+        self._check_open()
+        realm = _make_key(realm)
+        name = _make_key(name)
+        path: Final[Path | None] = self.__lookup(realm, name)
+        if path is not None:
+            self.__used.add((realm, name))
+        return path
+
+    @contextmanager
+    def _claim(self, realm: str, name: str) -> Generator[None, None, None]:
+        """
+        Claim a realm-name combination exclusively across processes.
+
+        Only one file manager at a time can hold the claim on a realm-name
+        combination, all others wait until it is released. When the claim is
+        released, the new entries are written to the index, so that they
+        become visible to the other processes. This way, expensive entries,
+        like cloned repositories, are created only once.
+
+        :param realm: the realm
+        :param name: the name or ID of the file or directory
+        """
+        self._check_open()
+        self.__claims_dir.ensure_dir_exists()
+        with _locked(self.__claims_dir.resolve_inside(
+                f"{fingerprint((_make_key(realm), _make_key(name)))}.lock")):
+            try:
+                yield
+            finally:
+                self.__publish()
+
+    def __get_store(self) -> "FileManager | None":
+        """
+        Get the file manager of the shared store, if there is one.
+
+        :return: the file manager of the shared store, or `None`
+        """
+        if (self.__store is None) and (self.__store_dir is not None):
+            self.__store = FileManager(self.__store_dir)
+        return self.__store
+
+    def _fetch_shared(self, realm: str, name: str, request: str) -> bool:
+        """
+        Fill a new entry from the shared store, if it has a matching entry.
+
+        The store keeps the results of requests under their fingerprints,
+        independent of the names they have in the different projects. If it
+        has the result of the request, the new entry becomes a view of it,
+        see :func:`_link_tree`, and the metadata is copied.
+
+        :param realm: the realm
+        :param name: the name of the new entry
+        :param request: the fingerprint of the request producing the entry
+        :return: `True` if the entry was filled from the store, `False` if
+            it needs to be produced
+        """
+        store: Final[FileManager | None] = self.__get_store()
+        if store is None:
+            return False
+        key: Final[tuple[str, str]] = (_make_key(realm), _make_key(name))
+        path: Final[Path | None] = self.__lookup(*key)
+        if path is None:
+            return False
+        found: Final[tuple[Path, Mapping[str, Any]] | None] = \
+            FileManager.__provide(store, key[0], request,
+                                  self.__kinds[path])
+        if found is None:
+            return False
+        _link_tree(found[0], path, self._shares_by_link(key[0]))
+        self._describe(*key, request, found[1])
+        if key in self.__pending:
+            self.__pending[key]["shared"] = True
+        logger(f"Took {path!r} from the shared store {self.__store_dir!r}.")
+        return True
+
+    def __provide(self, realm: str, request: str,
+                  is_file: bool) -> tuple[Path, Mapping[str, Any]] | None:
+        """
+        Provide the result of a request as the shared store.
+
+        :param realm: the realm
+        :param request: the fingerprint of the request
+        :param is_file: should the result be a file (`True`) or a directory
+            (`False`)?
+        :return: the path and the metadata of the result, or `None` if the
+            store does not have it
+        """
+        path: Final[Path | None] = self._find(realm, request)
+        if (path is None) or (self.__kinds.get(path) != is_file):
+            return None
+        entry: Final[CacheEntry | None] = self.get_entry(realm, request)
+        return path, {} if entry is None else entry.meta
+
+    def __share(self, realm: str, request: str, path: Path,
+                meta: Mapping[str, Any] | None) -> None:
+        """
+        Put a new entry into the shared store.
+
+        :param realm: the realm
+        :param request: the fingerprint of the request producing the entry
+        :param path: the path of the entry
+        :param meta: the metadata of the entry
+        """
+        store: Final[FileManager | None] = self.__get_store()
+        if store is not None:
+            FileManager.__accept(store, realm, request, path, meta,
+                                 self._shares_by_link(realm))
+
+    def __accept(self, realm: str, request: str, path: Path,
+                 meta: Mapping[str, Any] | None, hard_link: bool) -> None:
+        """
+        Accept the result of a request from a project as the shared store.
+
+        :param realm: the realm
+        :param request: the fingerprint of the request
+        :param path: the path of the result in the project
+        :param meta: the metadata of the result
+        :param hard_link: may the result be hard-linked if it is a file?
+        """
+        if not self.__is_sharded(realm):
+            self.shard(realm)
+        with self._claim(realm, request):
+            dest, is_new = self.get_file(realm, request) if path.is_file() \
+                else self.get_dir(realm, request)
+            if not is_new:
+                return
+            try:
+                _link_tree(path, dest, hard_link)
+                self._describe(realm, request, request, meta)
+            except BaseException:
+                self.delete(realm, request)
+                raise
+
+    def _get_companions(  # pylint: disable=W0613
+            self, entry: CacheEntry) -> Iterable[tuple[str, str]]:
+        """
+        Get the entries that must be kept or removed together with an entry.
+
+        :param entry: the entry
+        :return: the realms and names of the companion entries
+        """
+        return ()
+
+    def _shares_by_link(self, realm: str) -> bool:  # pylint: disable=W0613
+        """
+        Check whether files of a realm may be hard-linked with the store.
+
+        Files that programs may write in place must be copied instead.
+
+        :param realm: the realm
+        :return: `True` if single files of the realm are hard-linked, `False`
+            if they are copied
+        """
+        return True
+
+    def _snapshot_paths(  # pylint: disable=W0613
+            self, realm: str, path: Path) -> Iterable[Path]:
+        """
+        Get the paths that represent an entry in a cache snapshot.
+
+        By default, this is just the path of the entry itself. Derived
+        classes can store less, as long as :meth:`_snapshot_restore` can
+        re-create the entry from it.
+
+        :param realm: the realm of the entry
+        :param path: the path of the entry
+        :return: the paths to store in the snapshot
+        """
+        return (path, )
+
+    def _snapshot_restore(  # pylint: disable=W0613
+            self, realm: str, name: str, path: Path) -> bool:
+        """
+        Re-create and verify an entry imported from a cache snapshot.
+
+        :param realm: the realm of the entry
+        :param name: the name of the entry
+        :param path: the path of the entry
+        :return: `True` if the entry is valid, `False` if it should be
+            discarded
+        """
+        return path.exists() and (path.is_file() or path.is_dir())
+
+    def export_cache(self, dest: str) -> None:
+        """
+        Export the cache into a single compressed snapshot archive.
+
+        The archive contains the index, followed by the paths of all entries
+        relative to the base directory.
+
+        :param dest: the path to the archive file to create
+        """
+        self._check_open()
+        archive: Final[Path] = Path(dest)
+        index: Final[dict[str, Any]] = self.__serialize()
+        data: Final[bytes] = json.dumps(index).encode()
+        count: int = 0
+        with tarfile.open(archive, "w:gz", compresslevel=1) as tar:
+            info: Final[tarfile.TarInfo] = tarfile.TarInfo(_SNAPSHOT_INDEX)
+            info.size = bytes.__len__(data)
+            info.mtime = int(time())
+            tar.addfile(info, BytesIO(data))
+            for realm, names in index["realms"].items():
+                realm_map = self.__map[realm][1]
+                for name in names:
+                    for item in self._snapshot_paths(realm, realm_map[name]):
+                        tar.add(item, arcname=item.relative_to(
+                            self.__base_dir))
+                    count += 1
+        logger(f"Exported {count} cache entries to {archive!r}.")
+
+    def import_cache(self, source: str) -> int:
+        """
+        Import a cache snapshot archive created by :meth:`export_cache`.
+
+        The archive is read as a stream. Only the entries that do not yet
+        exist in this file manager are extracted, re-created, and verified.
+        Records that do not yet exist are taken over as well, except for
+        failed requests and usage statistics.
+
+        :param source: the path to the archive file
+        :return: the number of imported entries
+        """
+        self._check_open()
+        archive: Final[Path] = Path(source)
+        archive.enforce_file()
+        #: the prefixes of the member names of the entries to import
+        pending: Final[dict[str, tuple[str, str, Path]]] = {}
+        extracted: Final[set[str]] = set()
+        has_index: bool = False
+        with tarfile.open(archive, "r|*") as tar:
+            for member in tar:
+                if not has_index:
+                    if member.name != _SNAPSHOT_INDEX:
+                        raise ValueError(f"{archive!r} is not a snapshot.")
+                    has_index = True
+                    stream = tar.extractfile(member)
+                    if stream is None:
+                        raise ValueError(f"Invalid index in {archive!r}.")
+                    self.__plan_import(json.loads(stream.read()), pending)
+                    continue
+                parts: list[str] = member.name.split("/")
+                for i in range(3, list.__len__(parts) + 1):
+                    prefix: str = "/".join(parts[:i])
+                    if prefix in pending:
+                        tar.extract(member, self.__base_dir, filter="data")
+                        extracted.add(prefix)
+                        break
+
+        count: int = 0
+        for prefix in extracted:
+            realm, name, path = pending[prefix]
+            if self._snapshot_restore(realm, name, path):
+                self.__add(realm, name, path, path.is_file())
+                count += 1
+            else:
+                logger(f"Discarding invalid entry {name!r} of realm "
+                       f"{realm!r} from snapshot.")
+                if path.exists():
+                    delete_path(path)
+        self.__publish()
+        logger(f"Imported {count} cache entries from {archive!r}.")
+        return count
+
+    def __plan_import(self, index: dict[str, Any],
+                      pending: dict[str, tuple[str, str, Path]]) -> None:
+        """
+        Determine which entries of a snapshot index need to be imported.
+
+        :param index: the snapshot index
+        :param pending: the map to receive the archive member name prefixes
+            of the entries to import, pointing to their realm, name, and path
+        """
+        if index.get("version") != _CACHE_VERSION:
+            raise ValueError("Unsupported cache snapshot version "
+                             f"{index.get('version')!r}.")
+        for section, records in index["records"].items():
+            if section in _LOCAL_SECTIONS:
+                continue
+            for key, value in records.items():
+                if self._get_record(section, key) is None:
+                    self._set_record(section, key, value)
+        for key, names in index["realms"].items():
+            realm: str = _make_key(key)
+            realm_dir, _ = self.__get_realm(realm)
+            for name, relative in names.items():
+                path: Path = realm_dir.resolve_inside(relative)
+                if (self.__lookup(realm, name) is not None) or path.exists():
+                    continue
+                pending[path.relative_to(self.__base_dir)] = (
+                    realm, name, path)
+
+    def __serialize(self) -> dict[str, Any]:
+        """
+        Serialize the index of this file manager to a JSON-compatible map.
+
+        The negative cache of failed requests and the usage statistics are
+        left out, as they only make sense for the local cache.
+
+        :return: the map with the realms and the records
+        """
+        self.__publish()
+        realms: Final[dict[str, dict[str, str]]] = {}
+        for realm, name in self.__db.execute(
+                "SELECT realm, name FROM entries").fetchall():
+            path: Path | None = self.__lookup(realm, name)
+            if path is not None:
+                realms.setdefault(realm, {})[name] = path.relative_to(
+                    self.__map[realm][0])
+        records: Final[dict[str, dict[str, Any]]] = {}
+        for section, key, value in self.__db.execute(
+                "SELECT section, key, value FROM records WHERE section NOT "
+                "IN (?, ?)", _LOCAL_SECTIONS):
+            records.setdefault(section, {})[key] = json.loads(value)
+        return {"version": _CACHE_VERSION, "realms": realms,
+                "records": records}
+
     def close(self) -> None:
-        """Close the file manager and write cache list."""
-        opn: bool = self.__is_open
-        self.__is_open = False
-        if opn:  # only if we were open...
-            # flush or clear directory of cached post-processed files
-            with suppress(FileNotFoundError):
-                os_remove(self.__cache_file)
-            if len(self.__map) > 0:  # we got cached files
-                self.__cache_file.write_all_str(json.dumps(  # store cache
-                    {realm: {
-                        name: path.relative_to(rv[0])
-                        for name, path in rv[1].items()
-                    } for realm, rv in self.__map.items()}))
+        """Close the file manager and write the new index entries."""
+        if self.__is_open:  # only if we were open...
+            try:
+                self.__publish()
+            finally:
+                self.__is_open = False
+                self.__db.close()
+                if self.__store is not None:
+                    self.__store.close()
 
     def __exit__(self, exception_type, _, __) -> bool:
         """
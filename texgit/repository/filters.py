@@ -0,0 +1,547 @@
+r"""
+In-process implementations of common text filters.
+
+Many post-processing commands are trivial text filters like `head -n 5` or
+`sed -n '3,7p'` that read the file from `stdin`. Executing them means forking
+a new process, which takes much longer than the actual filtering. This
+module provides compatible implementations of a subset of the GNU versions
+of these tools, which are used by
+:func:`~texgit.repository.builtin_commands.find_builtin` instead of the real
+programs. The following forms are supported, where `N` and `M` are
+non-negative integers:
+
+- `cat` and `cat -`
+- `head`, `head -n N`, `head -nN`, `head -N`, `head --lines=N`, and
+  `head -n -N`
+- `tail`, `tail -n N`, `tail -nN`, `tail -N`, `tail --lines=N`, and
+  `tail -n +N`
+- `sort` with the options `-r` and `-u`, if the collation locale is `C`
+- `grep PATTERN` and `grep -e PATTERN` with the options `-v`, `-c`, `-n`,
+  and `-F`, if the pattern is a fixed string
+- `sed -n 'Np'`, `sed -n 'N,Mp'`, and `sed -n 'N,$p'`, also with `-e`
+- `cut -f LIST` with `-d DELIM` and `-s`, as well as `cut -c LIST` and
+  `cut -b LIST`
+
+In all cases, the input is only read from `stdin`. Commands with any other
+option, a file operand, or an unsupported argument are executed by the real
+programs.
+
+If the environment variable :data:`CROSS_CHECK_ENV` is set to `1`, each
+in-process filter is also executed by the real program and an error is
+raised if the outputs differ. This mode exists for testing the
+implementations on real documents.
+
+>>> f = find_filter(["head", "-n", "2"])
+>>> f("a\nb\nc\n")
+'a\nb\n'
+>>> print(find_filter(["head", "-n", "2", "file.txt"]))
+None
+>>> print(find_filter(["head", "-c", "2"]))
+None
+"""
+from functools import partial
+from os import environ
+from re import Pattern
+from re import compile as re_compile
+from subprocess import PIPE, run  # nosec
+from typing import Callable, Final
+
+#: the environment variable which enables cross-checking the filters
+CROSS_CHECK_ENV: Final[str] = "TEXGIT_CROSS_CHECK"
+
+#: a non-negative number
+_NUMBER: Final[Pattern] = re_compile(r"[0-9]+")
+#: the sed scripts we support
+_SED_PRINT: Final[Pattern] = re_compile(r"([0-9]+|\$)(?:,([0-9]+|\$))?p")
+#: a range in a list of cut
+_CUT_RANGE: Final[Pattern] = re_compile(r"([0-9]*)-([0-9]*)")
+#: the characters that have a special meaning in basic regular expressions
+_BRE_SPECIAL: Final[frozenset[str]] = frozenset(".[]*^$\\\n")
+
+
+def _split(text: str) -> list[str]:
+    r"""
+    Split a text into lines, keeping the `\n` terminators.
+
+    :param text: the text
+    :return: the lines; only the last one may lack the terminator
+
+    >>> _split("a\nb")
+    ['a\n', 'b']
+    >>> _split("a\r\n\n")
+    ['a\r\n', '\n']
+    >>> _split("")
+    []
+    """
+    lines: Final[list[str]] = str.split(text, "\n")
+    last: Final[str] = lines.pop()
+    result: Final[list[str]] = [f"{line}\n" for line in lines]
+    if last:
+        result.append(last)
+    return result
+
+
+def _unterminated(text: str) -> list[str]:
+    r"""
+    Split a text into lines, dropping the `\n` terminators.
+
+    :param text: the text
+    :return: the lines
+
+    >>> _unterminated("a\n\nb\n")
+    ['a', '', 'b']
+    >>> _unterminated("a")
+    ['a']
+    >>> _unterminated("")
+    []
+    """
+    lines: Final[list[str]] = str.split(text, "\n")
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _terminated(lines: list[str]) -> str:
+    r"""
+    Join lines, terminating each of them with `\n`.
+
+    :param lines: the lines, without terminators
+    :return: the text
+
+    >>> _terminated(["a", "b"])
+    'a\nb\n'
+    >>> _terminated([])
+    ''
+    """
+    return "".join(f"{line}\n" for line in lines)
+
+
+def _count_arg(args: list[str]) -> str | None:
+    """
+    Get the line count argument of `head` or `tail`.
+
+    :param args: the arguments
+    :return: the count, or `None` if the arguments are not supported
+
+    >>> _count_arg([])
+    '10'
+    >>> _count_arg(["-n", "-3"])
+    '-3'
+    >>> _count_arg(["-n3"])
+    '3'
+    >>> _count_arg(["--lines=4"])
+    '4'
+    >>> _count_arg(["-5"])
+    '5'
+    >>> print(_count_arg(["-c", "5"]))
+    None
+    """
+    if list.__len__(args) <= 0:
+        return "10"
+    if list.__len__(args) == 2:
+        return args[1] if args[0] in {"-n", "--lines"} else None
+    if list.__len__(args) != 1:
+        return None
+    arg: Final[str] = args[0]
+    if arg.startswith("--lines="):
+        return arg[8:]
+    if arg.startswith("-n") and (str.__len__(arg) > 2):
+        return arg[2:]
+    if arg.startswith("-") and _NUMBER.fullmatch(arg[1:]):
+        return arg[1:]
+    return None
+
+
+def _head(args: list[str]) -> Callable[[str], str] | None:
+    r"""
+    Implement `head`.
+
+    :param args: the arguments
+    :return: the filter, or `None` if the arguments are not supported
+
+    >>> _head(["-n", "1"])("a\nb\n")
+    'a\n'
+    >>> _head(["-n", "-1"])("a\nb\nc")
+    'a\nb\n'
+    >>> _head(["-n", "0"])("a\nb\n")
+    ''
+    """
+    count: Final[str | None] = _count_arg(args)
+    if count is None:
+        return None
+    if _NUMBER.fullmatch(count):
+        return lambda text: "".join(_split(text)[:int(count)])
+    if count.startswith("-") and _NUMBER.fullmatch(count[1:]):
+        return lambda text: "".join(_split(text)[:-int(count[1:]) or None])
+    return None
+
+
+def _tail(args: list[str]) -> Callable[[str], str] | None:
+    r"""
+    Implement `tail`.
+
+    :param args: the arguments
+    :return: the filter, or `None` if the arguments are not supported
+
+    >>> _tail(["-n", "1"])("a\nb")
+    'b'
+    >>> _tail(["-n", "+2"])("a\nb\nc\n")
+    'b\nc\n'
+    >>> _tail(["-n", "0"])("a\nb\n")
+    ''
+    """
+    count: Final[str | None] = _count_arg(args)
+    if count is None:
+        return None
+    if count.startswith("+") and _NUMBER.fullmatch(count[1:]):
+        return lambda text: "".join(_split(text)[
+            max(0, int(count[1:]) - 1):])
+    last: Final[str] = count.removeprefix("-")
+    if _NUMBER.fullmatch(last):
+        return lambda text: "".join(
+            _split(text)[-int(last):] if int(last) > 0 else [])
+    return None
+
+
+def _collates_by_code_point() -> bool:
+    """
+    Check whether the locale sorts strings by code points.
+
+    :return: `True` if `sort` compares strings by code points
+    """
+    for key in ("LC_ALL", "LC_COLLATE", "LANG"):
+        value: str = environ.get(key, "")
+        if value:
+            return value in {"C", "POSIX", "C.UTF-8", "C.utf8"}
+    return True
+
+
+def _sort(args: list[str]) -> Callable[[str], str] | None:
+    r"""
+    Implement `sort`.
+
+    :param args: the arguments
+    :return: the filter, or `None` if the arguments are not supported
+
+    >>> _sort(["-ru"])("a\nc\nb\nc")
+    'c\nb\na\n'
+    """
+    flags: Final[set[str]] = set()
+    for arg in args:
+        if (str.__len__(arg) < 2) or (not arg.startswith("-")) or (
+                not set(arg[1:]).issubset("ru")):
+            return None
+        flags.update(arg[1:])
+    if not _collates_by_code_point():
+        return None
+
+    def __sort(text: str) -> str:
+        lines: list[str] = _unterminated(text)
+        if "u" in flags:
+            lines = list(dict.fromkeys(lines))
+        return _terminated(sorted(lines, reverse="r" in flags))
+    return __sort
+
+
+def _grep(args: list[str]) -> Callable[[str], str] | None:
+    r"""
+    Implement `grep` for fixed strings.
+
+    :param args: the arguments
+    :return: the filter, or `None` if the arguments are not supported
+
+    >>> _grep(["-n", "b"])("abc\nd\nb")
+    '1:abc\n3:b\n'
+    >>> _grep(["-vc", "b"])("abc\nd\nb")
+    '1\n'
+    >>> _grep(["x"])("abc")
+    Traceback (most recent call last):
+    ...
+    ValueError: grep selected no lines.
+    >>> print(_grep(["a.c"]))
+    None
+    """
+    flags: Final[set[str]] = set()
+    patterns: Final[list[str]] = []
+    expect_pattern: bool = False
+    for arg in args:
+        if expect_pattern:
+            patterns.append(arg)
+            expect_pattern = False
+        elif arg == "-e":
+            expect_pattern = True
+        elif (str.__len__(arg) > 1) and arg.startswith("-"):
+            if not set(arg[1:]).issubset("vcnF"):
+                return None
+            flags.update(arg[1:])
+        else:
+            patterns.append(arg)
+    if expect_pattern or (list.__len__(patterns) != 1) or (
+            "\n" in patterns[0]) or (("F" not in flags) and (
+            not _BRE_SPECIAL.isdisjoint(patterns[0]))):
+        return None
+    pattern: Final[str] = patterns[0]
+    invert: Final[bool] = "v" in flags
+
+    def __grep(text: str) -> str:
+        if "\0" in text:  # grep treats such input as binary
+            return run_real(["grep", *args], text)
+        lines: Final[list[str]] = _unterminated(text)
+        selected: Final[list[str]] = [
+            f"{i}:{line}" if "n" in flags else line
+            for i, line in enumerate(lines, 1)
+            if (pattern in line) != invert]
+        result: Final[str] = f"{list.__len__(selected)}\n" \
+            if "c" in flags else _terminated(selected)
+        if list.__len__(selected) <= 0:
+            raise ValueError("grep selected no lines.")
+        return result
+    return __grep
+
+
+def _sed(args: list[str]) -> Callable[[str], str] | None:
+    r"""
+    Implement `sed -n` with a single range of lines to print.
+
+    :param args: the arguments
+    :return: the filter, or `None` if the arguments are not supported
+
+    >>> _sed(["-n", "2,3p"])("a\nb\nc\nd")
+    'b\nc\n'
+    >>> _sed(["-n", "3,$p"])("a\nb\nc\nd")
+    'c\nd'
+    >>> _sed(["-n", "3,1p"])("a\nb\nc\nd")
+    'c\n'
+    >>> _sed(["-n", "$p"])("a\nb\n")
+    'b\n'
+    >>> print(_sed(["-n", "0,1p"]))
+    None
+    """
+    if (list.__len__(args) == 3) and (args[1] == "-e"):
+        args = [args[0], args[2]]
+    if (list.__len__(args) != 2) or (args[0] != "-n"):
+        return None
+    match: Final = _SED_PRINT.fullmatch(args[1])
+    if (match is None) or (match.group(1) == "0") or (
+            match.group(2) == "0"):
+        return None
+    start: Final[str] = match.group(1)
+    end: Final[str | None] = match.group(2)
+
+    def __sed(text: str) -> str:
+        lines: Final[list[str]] = _split(text)
+        first: Final[int] = list.__len__(lines) if start == "$" \
+            else int(start)
+        last: int = first
+        if end == "$":
+            last = list.__len__(lines)
+        elif end is not None:
+            last = max(first, int(end))
+        return "".join(lines[first - 1:last])
+    return __sed
+
+
+def _cut_list(text: str) -> list[tuple[int, int]] | None:
+    """
+    Parse the list of fields or bytes of `cut`.
+
+    :param text: the list
+    :return: the list of ranges, with `0` meaning unbounded, or `None` if
+        the list is invalid
+
+    >>> _cut_list("1,3-4,6-")
+    [(1, 1), (3, 4), (6, 0)]
+    >>> print(_cut_list("0"))
+    None
+    """
+    ranges: Final[list[tuple[int, int]]] = []
+    for part in str.split(text, ","):
+        match = _CUT_RANGE.fullmatch(part)
+        if match is not None:
+            if (not match.group(1)) and (not match.group(2)):
+                return None
+            ranges.append((int(match.group(1) or "1"),
+                           int(match.group(2) or "0")))
+        elif _NUMBER.fullmatch(part):
+            ranges.append((int(part), int(part)))
+        else:
+            return None
+    if any((lo <= 0) or (0 < hi < lo) for lo, hi in ranges):
+        return None
+    return ranges
+
+
+def _cut_options(args: list[str]) -> dict[str, str] | None:
+    """
+    Parse the options of `cut`.
+
+    :param args: the arguments
+    :return: the options, or `None` if they are not supported
+
+    >>> _cut_options(["-d", ",", "-f2"])
+    {'d': ',', 'f': '2'}
+    >>> print(_cut_options(["-f2", "file.txt"]))
+    None
+    """
+    options: Final[dict[str, str]] = {}
+    i: int = 0
+    while i < list.__len__(args):
+        arg: str = args[i]
+        if arg == "-s":
+            options["s"] = ""
+        elif arg.startswith("--delimiter="):
+            options["d"] = arg[12:]
+        elif arg.startswith("--fields="):
+            options["f"] = arg[9:]
+        elif (str.__len__(arg) >= 2) and (arg[:2] in {"-d", "-f", "-c",
+                                                      "-b"}):
+            if str.__len__(arg) > 2:
+                options[arg[1]] = arg[2:]
+            elif i + 1 < list.__len__(args):
+                i += 1
+                options[arg[1]] = args[i]
+            else:
+                return None
+        else:
+            return None
+        i += 1
+    return options
+
+
+def _cut(args: list[str]) -> Callable[[str], str] | None:
+    r"""
+    Implement `cut`.
+
+    :param args: the arguments
+    :return: the filter, or `None` if the arguments are not supported
+
+    >>> _cut(["-d", ",", "-f", "3,1"])("a,b,c\nd\ne,f")
+    'a,c\nd\ne\n'
+    >>> _cut(["-s", "-d,", "-f2-"])("a,b,c\nd\ne,f")
+    'b,c\nf\n'
+    >>> _cut(["-c", "2-3"])("abcd\nx")
+    'bc\n\n'
+    """
+    options: Final[dict[str, str] | None] = _cut_options(args)
+    if options is None:
+        return None
+    modes: Final[list[str]] = [m for m in "fcb" if m in options]
+    if list.__len__(modes) != 1:
+        return None
+    ranges: Final[list[tuple[int, int]] | None] = _cut_list(
+        options[modes[0]])
+    delimiter: Final[str] = options.get("d", "\t")
+    if (ranges is None) or (str.__len__(delimiter) != 1) or (
+            not delimiter.isascii()) or ((modes[0] != "f") and (
+            ("d" in options) or ("s" in options))):
+        return None
+
+    def __select(count: int) -> list[int]:
+        return [i for i in range(count) if any(
+            lo <= i + 1 and ((hi <= 0) or (i + 1 <= hi))
+            for lo, hi in ranges)]
+
+    def __cut_line(line: str) -> str | None:
+        if modes[0] != "f":
+            data: bytes = line.encode()
+            return bytes(data[i] for i in __select(bytes.__len__(
+                data))).decode()
+        if delimiter not in line:
+            return None if "s" in options else line
+        fields: list[str] = str.split(line, delimiter)
+        return delimiter.join(fields[i] for i in __select(
+            list.__len__(fields)))
+
+    def __cut(text: str) -> str:
+        return _terminated([c for c in map(__cut_line, _unterminated(text))
+                            if c is not None])
+    return __cut
+
+
+def _cat(args: list[str]) -> Callable[[str], str] | None:
+    r"""
+    Implement `cat`.
+
+    :param args: the arguments
+    :return: the filter, or `None` if the arguments are not supported
+
+    >>> _cat(["-"])("a\nb")
+    'a\nb'
+    """
+    if any(arg != "-" for arg in args) or (list.__len__(args) > 1):
+        return None
+    return str
+
+
+#: the parsers of the supported filters
+_FILTERS: Final[dict[str, Callable[[list[str]], Callable[
+    [str], str] | None]]] = {
+    "cat": _cat, "cut": _cut, "grep": _grep, "head": _head, "sed": _sed,
+    "sort": _sort, "tail": _tail}
+
+
+def run_real(command: list[str], stdin: str | None) -> str:
+    """
+    Execute a filter as real program.
+
+    :param command: the command
+    :param stdin: the text for `stdin`, or `None`
+    :return: the output of the program
+    :raises ValueError: if the program fails
+    """
+    result: Final = run(command, input=(stdin or "").encode(),  # nosec
+                        stdout=PIPE, check=False)
+    if result.returncode != 0:
+        raise ValueError(f"{command} yields return code "
+                         f"{result.returncode}.")
+    return result.stdout.decode()
+
+
+def __cross_check(command: list[str], function: Callable[[str], str],
+                  stdin: str | None) -> str:
+    """
+    Execute a filter in-process and as real program and compare the outputs.
+
+    :param command: the command
+    :param function: the in-process implementation
+    :param stdin: the text for `stdin`, or `None`
+    :return: the output
+    :raises ValueError: if the outputs differ
+    """
+    result: str | None = None
+    try:
+        result = function(stdin or "")
+    except ValueError:
+        result = None
+    try:
+        expected: str | None = run_real(command, stdin)
+    except ValueError:
+        expected = None
+    if result != expected:
+        raise ValueError(f"In-process filter {command} returned {result!r}, "
+                         f"but the program returned {expected!r}.")
+    if result is None:
+        raise ValueError(f"{command} failed.")
+    return result
+
+
+def find_filter(command: list[str]) -> Callable[[str | None], str] | None:
+    """
+    Find the in-process implementation of a filter command.
+
+    :param command: the normalized command
+    :return: the implementation, receiving the text from `stdin` or `None`
+        and returning the text written to `stdout`, or `None` if the command
+        is not supported
+    """
+    if list.__len__(command) <= 0:
+        return None
+    parser: Final[Callable[[list[str]], Callable[[str], str] | None] | None] \
+        = _FILTERS.get(command[0])
+    function: Final[Callable[[str], str] | None] = None if parser is None \
+        else parser(command[1:])
+    if function is None:
+        return None
+    if environ.get(CROSS_CHECK_ENV) == "1":
+        return partial(__cross_check, list(command), function)
+    return lambda stdin: function(stdin or "")
@@ -0,0 +1,268 @@
+"""
+Execute Python scripts and modules in forks of a pre-warmed interpreter.
+
+Scripts that import large packages, e.g., `numpy` or `pandas`, often spend
+much more time on importing them than on their actual computation. A
+:class:`ForkServer` starts a single Python interpreter, the server, which
+imports a configurable set of modules once. For each request, the server
+forks itself and the child process runs the requested module or script,
+just like `python3 -m <module> args...` or `python3 <script> args...` would,
+but without importing the preloaded modules again.
+
+The child process gets the requested working directory, `argv`, `stdin`,
+and :data:`~pycommons.processes.python.PYTHON_ENV`. Its `stdout` is
+written to a file and its `stderr` is discarded, just like
+:class:`~pycommons.processes.shell.Command` does for normal processes.
+Since `stdin` and `stdout` are redirected on the level of file descriptors,
+sub-processes started by the scripts behave the same as well.
+
+Forking a process that runs several threads can lead to deadlocks in the
+children, so only modules that do not start threads on import should be
+preloaded.
+"""
+import json
+import os
+import sys
+from contextlib import AbstractContextManager, suppress
+from importlib import import_module
+from os.path import dirname
+from runpy import run_module, run_path
+from signal import SIGKILL
+from subprocess import DEVNULL, PIPE, Popen  # nosec
+from threading import Lock, Timer
+from typing import IO, Any, Final, Iterable
+
+from pycommons.io.console import logger
+from pycommons.processes.python import PYTHON_ENV, PYTHON_INTERPRETER
+
+from texgit.repository.streams import add_usage
+
+#: the default seconds after which a forked process is killed, the same as
+#: for :class:`~pycommons.processes.shell.Command`
+FORK_TIMEOUT: Final[int] = 3600
+
+
+def fork_args(args: list[str]) -> tuple[bool, str, list[str]] | None:
+    """
+    Check whether the arguments of a `python3` command can be forked.
+
+    Only commands executing a module via `-m` or a script are supported,
+    but no other interpreter options.
+
+    :param args: the arguments passed to the interpreter
+    :return: a tuple of whether a module is executed, the module or script,
+        and the arguments for it; or `None` if the command is not supported
+
+    >>> fork_args(["-m", "json.tool", "--indent", "2"])
+    (True, 'json.tool', ['--indent', '2'])
+    >>> fork_args(["make_pdf.py", "x"])
+    (False, 'make_pdf.py', ['x'])
+    >>> print(fork_args(["-c", "print(1)"]))
+    None
+    >>> print(fork_args([]))
+    None
+    """
+    if (list.__len__(args) >= 2) and (args[0] == "-m"):
+        return True, args[1], args[2:]
+    if (list.__len__(args) >= 1) and not args[0].startswith("-"):
+        return False, args[0], args[1:]
+    return None
+
+
+def _redirect(request: dict[str, Any], root: str | None) -> None:
+    """
+    Set up the forked child process for executing a request.
+
+    :param request: the request
+    :param root: the path that was added to `sys.path` to import `texgit`,
+        or `None`
+    """
+    with open(request["stdin"], "rb") as stdin:
+        os.dup2(stdin.fileno(), 0)
+    with open(request["stdout"], "wb") as stdout:
+        os.dup2(stdout.fileno(), 1)
+    with open(os.devnull, "wb") as stderr:
+        os.dup2(stderr.fileno(), 2)
+    os.chdir(request["cwd"])
+    if (root is not None) and (root in sys.path):
+        sys.path.remove(root)
+    sys.argv = [request["target"], *request["args"]]
+    sys.path.insert(0, request["cwd"] if request["module"] else dirname(
+        os.path.abspath(request["target"])))
+
+
+def _run_child(request: dict[str, Any], root: str | None) -> None:
+    """
+    Run a request in the forked child process and exit.
+
+    :param request: the request
+    :param root: the path that was added to `sys.path` to import `texgit`,
+        or `None`
+    """
+    code: int = 1  # exceptions other than `SystemExit` mean failure
+    try:
+        _redirect(request, root)
+        _ = run_module(request["target"], run_name="__main__",
+                       alter_sys=True) if request["module"] else run_path(
+            request["target"], run_name="__main__")
+        code = 0
+    except SystemExit as se:
+        code = se.code if isinstance(se.code, int) else (
+            0 if se.code is None else 1)
+    finally:
+        with suppress(BaseException):
+            sys.stdout.flush()
+        os._exit(code)
+
+
+def serve(preload: Iterable[str], root: str | None = None) -> None:
+    """
+    Run the fork server, reading requests from `stdin`.
+
+    Each request is a JSON object on a single line. The server answers
+    each request with a JSON object on a single line containing the exit
+    code of the forked child process and the resources it used. A child
+    that runs longer than the timeout of its request is killed.
+
+    :param preload: the modules to import before serving requests
+    :param root: the path that was added to `sys.path` to import `texgit`,
+        or `None`
+    """
+    for module in preload:
+        try:
+            import_module(module)
+        except ImportError as ie:
+            sys.stderr.write(f"Could not preload {module!r}: {ie}\n")
+    requests: Final[IO[str]] = sys.stdin
+    answers: Final[IO[str]] = sys.stdout
+    for line in requests:
+        request: dict[str, Any] = json.loads(line)
+        pid: int = os.fork()
+        if pid == 0:
+            _run_child(request, root)
+        timer: Timer = Timer(request["timeout"], os.kill, (pid, SIGKILL))
+        timer.start()
+        _, status, usage = os.wait4(pid, 0)
+        timed_out: bool = not timer.is_alive()
+        timer.cancel()
+        timer.join()  # no other thread may run when we fork next time
+        answers.write(json.dumps({
+            "code": os.waitstatus_to_exitcode(status), "timeout": timed_out,
+            "user": usage.ru_utime, "system": usage.ru_stime,
+            "maxrss": usage.ru_maxrss * 1024}) + "\n")
+        answers.flush()
+
+
+class ForkServer(AbstractContextManager):
+    """A server executing Python scripts and modules in forked processes."""
+
+    def __init__(self, preload: Iterable[str] = ()) -> None:
+        """
+        Set up the fork server, which is started when it is first needed.
+
+        :param preload: the modules to import once in the server
+        """
+        #: the modules to preload
+        self.__preload: Final[tuple[str, ...]] = tuple(
+            str.strip(p) for p in preload if str.strip(p))
+        #: the server process
+        self.__process: Popen | None = None
+        #: the lock protecting the communication with the server
+        self.__lock: Final[Lock] = Lock()
+
+    def __start(self) -> Popen:
+        """
+        Start the server process if it is not running.
+
+        :return: the server process
+        """
+        if (self.__process is None) or (self.__process.poll() is not None):
+            root: Final[str] = dirname(dirname(dirname(__file__)))
+            self.__process = Popen(  # nosec # pylint: disable=R1732
+                [PYTHON_INTERPRETER, "-c", (
+                    "import sys\n"
+                    f"sys.path.insert(0, {root!r})\n"
+                    "from texgit.repository.forkserver import serve\n"
+                    f"serve({self.__preload!r}, {root!r})")],
+                stdin=PIPE, stdout=PIPE, stderr=DEVNULL, env=PYTHON_ENV,
+                text=True)
+            logger(f"Started fork server preloading {self.__preload}.")
+        return self.__process
+
+    def __call(self, request: dict[str, Any]) -> dict[str, Any] | None:
+        """
+        Send a request to the server and wait for the answer.
+
+        :param request: the request
+        :return: the answer with the exit code and resource usage of the
+            forked process, or `None` if the server died
+        """
+        with self.__lock:
+            process: Final[Popen] = self.__start()
+            process.stdin.write(json.dumps(request) + "\n")
+            process.stdin.flush()
+            answer: Final[str] = process.stdout.readline()
+        return json.loads(answer) if answer else None
+
+    def execute(self, args: list[str], output: str,
+                working_dir: str | None = None,
+                stdin: str | None = None,
+                usage: dict[str, float] | None = None,
+                timeout: int = FORK_TIMEOUT) -> bool:
+        """
+        Execute a Python module or script in a forked process.
+
+        :param args: the arguments to the interpreter
+        :param output: the file to which `stdout` is written
+        :param working_dir: the working directory, or `None` for the current
+            directory
+        :param stdin: the file from which `stdin` is read, or `None` for an
+            empty `stdin`
+        :param usage: the usage record to which the resources used by the
+            forked process are added, see
+            :func:`~texgit.repository.streams.add_usage`, or `None`
+        :param timeout: the seconds after which the process is killed
+        :return: `True` if the module or script was executed, `False` if the
+            arguments are not supported, see :func:`fork_args`
+        :raises ValueError: if the process fails or times out
+        """
+        target: Final[tuple[bool, str, list[str]] | None] = fork_args(args)
+        if target is None:
+            return False
+        answer: Final[dict[str, Any] | None] = self.__call({
+            "module": target[0], "target": target[1], "args": target[2],
+            "stdin": stdin or os.devnull, "stdout": output,
+            "cwd": working_dir or os.getcwd(), "timeout": timeout})
+        if answer is None:
+            raise ValueError(f"Fork server died while executing {args}.")
+        if usage is not None:
+            add_usage(usage, answer["user"], answer["system"],
+                      answer["maxrss"])
+        if answer["timeout"]:
+            raise ValueError(f"Forked {args} in {working_dir!r} timed out "
+                             f"after {timeout}s.")
+        code: Final[int] = answer["code"]
+        if code != 0:
+            raise ValueError(f"Forked {args} in {working_dir!r} yields "
+                             f"return code {code}.")
+        return True
+
+    def close(self) -> None:
+        """Stop the server process."""
+        if self.__process is not None:
+            with suppress(OSError):
+                self.__process.stdin.close()
+            self.__process.wait()
+            self.__process = None
+
+    def __exit__(self, exception_type, _, __) -> bool:
+        """
+        Close the context manager.
+
+        :param exception_type: ignored
+        :param _: ignored
+        :param __: ignored
+        :returns: `True` to suppress an exception, `False` to rethrow it
+        """
+        self.close()
+        return exception_type is None
@@ -1,10 +1,19 @@
 """Tools for interacting with repository."""
 import datetime
+from contextlib import suppress
 from dataclasses import dataclass
+from os import killpg
+from os import read as os_read
+from os import replace as os_replace
 from re import MULTILINE, Pattern, search
 from re import compile as re_compile
 from shutil import rmtree, which
-from typing import Final, cast
+from signal import SIGKILL
+from subprocess import DEVNULL, PIPE, Popen  # nosec
+from tempfile import mkdtemp
+from threading import Thread
+from time import monotonic, sleep
+from typing import Final, Iterable, cast
 
 from pycommons.io.console import logger
 from pycommons.io.path import Path, file_path
@@ -17,6 +26,8 @@ from pycommons.strings.enforce import (
 from pycommons.strings.string_conv import datetime_to_datetime_str
 from pycommons.types import type_error
 
+from texgit.repository.file_manager import TEMP_SUFFIX
+
 
 def git() -> Path:
     """
@@ -43,7 +54,176 @@ _COMMIT: Final[Pattern] = re_compile(r"^\s*commit\s+(.+?)\s+", flags=MULTILINE)
 _DATE: Final[Pattern] = re_compile(r"^\s*Date:\s+(.+?)$", flags=MULTILINE)
 
 
-def _get_base_url(url: str) -> URL:
+#: the default number of seconds that a clone may go without producing any
+#: progress output before an alternative source is tried in parallel
+HEDGE_DELAY: Final[int] = 20
+#: the timeout in seconds after which a single clone attempt is abandoned
+CLONE_TIMEOUT: Final[int] = 600
+
+
+class _CloneAttempt:
+    """A single running `git clone` attempt into its own directory."""
+
+    def __init__(self, source: str, directory: Path) -> None:
+        """
+        Start cloning from a source into a directory.
+
+        :param source: the url or path to clone from
+        :param directory: the empty directory to clone into
+        """
+        #: the source we are cloning from
+        self.source: Final[str] = source
+        #: the directory we are cloning into
+        self.directory: Final[Path] = directory
+        #: the time when the attempt was started
+        self.start: Final[float] = monotonic()
+        #: the last time when the attempt produced progress output
+        self.last_progress: float = self.start
+        logger(f"starting attempt to clone {source!r} into {directory!r}.")
+        #: the git process
+        self.process: Final[Popen] = Popen(  # nosec # pylint: disable=R1732
+            [git(), "clone", "--depth", "1", "--progress", source,
+             directory], stdin=DEVNULL, stdout=DEVNULL, stderr=PIPE,
+            cwd=directory, start_new_session=True)
+        #: the thread draining the progress output
+        self.__drainer: Final[Thread] = Thread(
+            target=self.__drain, daemon=True)
+        self.__drainer.start()
+
+    def __drain(self) -> None:
+        """Drain the progress output of `git` and record its time."""
+        fd: Final[int] = self.process.stderr.fileno()
+        try:
+            with suppress(OSError, ValueError):
+                while True:
+                    chunk: bytes = os_read(fd, 4096)
+                    if not chunk:
+                        break
+                    # the initial "Cloning into" line is not progress
+                    if not (chunk.startswith(b"Cloning into")
+                            and chunk.count(b"\n") <= 1):
+                        self.last_progress = monotonic()
+        finally:
+            self.process.stderr.close()
+
+    def stop(self) -> None:
+        """Terminate the attempt if it is still running and clean up."""
+        if self.process.poll() is None:
+            # kill the helpers of `git`, too, as they hold on to the pipe
+            with suppress(ProcessLookupError):
+                killpg(self.process.pid, SIGKILL)
+        with suppress(OSError):
+            self.process.wait(10)
+        # the pipe is closed by the drainer once it reaches its end
+        self.__drainer.join(10)
+
+    def discard(self) -> None:
+        """Stop the attempt and delete its directory."""
+        self.stop()
+        rmtree(self.directory, ignore_errors=True)
+
+
+def _clone_hedged(sources: Iterable[str], dest: Path,
+                  hedge_delay: float = HEDGE_DELAY,
+                  timeout: int = CLONE_TIMEOUT) -> str:
+    """
+    Clone a repository from the first of several sources that succeeds.
+
+    The first source is cloned into a temporary directory next to `dest`.
+    If it fails or does not produce any progress output for `hedge_delay`
+    seconds, the next source is started in parallel in a separate temporary
+    directory. The first attempt to finish successfully wins and is moved to
+    `dest`, all other attempts are killed and their directories deleted.
+
+    :param sources: the urls or paths to clone from, in order of preference
+    :param dest: the empty destination directory
+    :param hedge_delay: the seconds without progress after which the next
+        source is tried in parallel
+    :param timeout: the seconds after which an attempt is abandoned
+    :return: the source that was cloned successfully
+    """
+    pending: Final[list[str]] = list(sources)
+    if list.__len__(pending) <= 0:
+        raise ValueError(f"No sources to clone into {dest!r}.")
+    parent: Final[Path] = dest.up(1)
+    running: Final[list[_CloneAttempt]] = []
+    errors: Final[list[str]] = []
+    winner: _CloneAttempt | None = None
+    try:
+        while winner is None:
+            now: float = monotonic()
+            for attempt in list(running):
+                rc: int | None = attempt.process.poll()
+                if rc == 0:
+                    winner = attempt
+                    break
+                if (rc is None) and ((now - attempt.start) <= timeout):
+                    continue
+                errors.append(f"{attempt.source!r}: " + (
+                    f"timeout after {timeout}s" if rc is None
+                    else f"return code {rc}"))
+                logger(f"cloning {attempt.source!r} failed: {errors[-1]}.")
+                running.remove(attempt)
+                attempt.discard()
+            if winner is not None:
+                break
+            if (list.__len__(pending) > 0) and all(
+                    (now - a.last_progress) >= hedge_delay for a in running):
+                if list.__len__(running) > 0:
+                    logger(f"no progress from {running[-1].source!r} for "
+                           f"{hedge_delay}s, hedging with {pending[0]!r}.")
+                running.append(_CloneAttempt(pending.pop(0), Path(
+                    mkdtemp(prefix=".clone_", suffix=TEMP_SUFFIX,
+                            dir=parent))))
+            elif list.__len__(running) <= 0:
+                raise ValueError(f"Could not clone into {dest!r}: "
+                                 f"{'; '.join(errors)}.")
+            sleep(0.05)
+    finally:
+        for attempt in running:
+            if attempt is not winner:
+                attempt.discard()
+
+    winner.stop()
+    rmtree(dest, ignore_errors=True)
+    os_replace(winner.directory, dest)
+    logger(f"cloned {winner.source!r} into {dest!r} after "
+           f"{monotonic() - winner.start:.1f}s.")
+    return winner.source
+
+
+#: the scp-like `[user@]host:path` syntax of git urls
+_SCP_URL: Final[Pattern] = re_compile(r"^([\w.-]+@)?([\w.-]+):(?!//)(.+)$")
+
+
+def normalize_url(url: str) -> URL:
+    """
+    Turn any spelling of a git repository url into a :class:`URL`.
+
+    Besides the normal urls, this also accepts the scp-like syntax
+    `git@host:path` used by `git` for `ssh` urls.
+
+    :param url: the url
+    :return: the normalized url
+
+    >>> normalize_url(" https://github.com/a/b ")
+    'https://github.com/a/b'
+    >>> normalize_url("git@github.com:a/b.git")
+    'ssh://git@github.com/a/b.git'
+    >>> normalize_url("github.com:a/b")
+    'ssh://git@github.com/a/b'
+    >>> normalize_url("ssh://git@github.com/a/b")
+    'ssh://git@github.com/a/b'
+    """
+    use_url: str = enforce_non_empty_str_without_ws(str.strip(url))
+    match = _SCP_URL.match(use_url)
+    if match is not None:
+        use_url = (f"ssh://{match.group(1) or 'git@'}{match.group(2)}/"
+                   f"{match.group(3)}")
+    return URL(use_url)
+
+
+def get_base_url(url: str) -> URL:
     """
     Get the base url of a git repository.
 
@@ -84,7 +264,7 @@ class GitRepository:
             raise type_error(path, "path", Path)
         path.enforce_dir()
         object.__setattr__(self, "path", path)
-        object.__setattr__(self, "url", _get_base_url(url))
+        object.__setattr__(self, "url", get_base_url(url))
         object.__setattr__(self, "commit",
                            enforce_non_empty_str_without_ws(commit))
         if len(self.commit) != 40:
@@ -101,36 +281,36 @@ class GitRepository:
                f"date {self.date_time!r}.")
 
     @staticmethod
-    def download(url: str, dest_dir: str) -> "GitRepository":
+    def download(url: str, dest_dir: str, mirrors: Iterable[str] = (),
+                 hedge_delay: float = HEDGE_DELAY) -> "GitRepository":
         """
         Download a git repository.
 
+        The repository is cloned from `url`. If this clone does not make
+        progress for `hedge_delay` seconds or fails, alternative sources are
+        tried in parallel: for GitHub `https` urls, the `ssh` url, followed by
+        the `mirrors`. Whichever clone finishes first is used.
+
         :param url: the repository url
         :param dest_dir: the destination directory
+        :param mirrors: alternative urls or paths of the same repository
+        :param hedge_delay: the seconds without progress after which the next
+            alternative source is tried
         :return: the repository information
         """
         dest: Final[Path] = Path(dest_dir)
         gt: Final[Path] = git()
         dest.ensure_dir_exists()
         url = URL(url)
+        sources: Final[list[str]] = [url]
+        if url.startswith("https://github.com"):
+            sources.append(URL(f"ssh://git@{url[8:]}"))
+        sources.extend(map(str.strip, mirrors))
         s = f" repository {url!r} to directory {dest!r}"
         logger(f"starting to load{s} via {gt!r}.")
-        try:
-            Command([
-                gt, "-C", dest, "clone", "--depth", "1", url, dest],
-                timeout=600, working_dir=dest).execute(True)
-        except ValueError:
-            if not url.startswith("https://github.com"):
-                raise
-            url2 = URL(f"ssh://git@{url[8:]}")
-            logger(f"timeout when loading url {url!r}, so we try "
-                   f"{url2!r} instead, but first delete {dest!r}.")
-            rmtree(dest, ignore_errors=True)
-            dest.ensure_dir_exists()
-            logger(f"{dest!r} deleted and created, now re-trying cloning.")
-            Command([
-                gt, "-C", dest, "clone", "--depth", "1", url2, dest],
-                timeout=600, working_dir=dest).execute(True)
+        if _clone_hedged(sources, dest, hedge_delay) != url:
+            Command([gt, "-C", dest, "remote", "set-url", "origin", url],
+                    timeout=120, working_dir=dest).execute(True)
         logger(f"successfully finished loading{s}.")
 
         return GitRepository.from_local(path=dest, url=url)
@@ -7,15 +7,33 @@ times.
 """
 
 from dataclasses import dataclass
-from os import rmdir
-from typing import Final
+from tarfile import TarError
+from time import monotonic
+from typing import Final, Iterable, Mapping
 
+from pycommons.io.console import logger
 from pycommons.io.path import Path
 from pycommons.net.url import URL
+from pycommons.processes.shell import Command
 from pycommons.types import type_error
 
-from texgit.repository.file_manager import FileManager
-from texgit.repository.git import GitRepository
+from texgit.repository.archive import (
+    archive_source,
+    download_archive,
+    extract_from_archive,
+    load_archive,
+)
+from texgit.repository.file_manager import (
+    FAILURE_TTL,
+    FileManager,
+    fingerprint,
+)
+from texgit.repository.git import (
+    HEDGE_DELAY,
+    GitRepository,
+    git,
+    normalize_url,
+)
 
 
 @dataclass(frozen=True, init=False, order=True)
@@ -48,42 +66,129 @@ class GitPath:
         object.__setattr__(self, "url", url)
 
 
-def _make_key(u: URL) -> tuple[str, str]:
+def _make_key(url: str) -> str:
     """
-    Turn a URL into a key.
+    Turn any spelling of a repository URL into its canonical key.
 
-    :param u: the url
-    :return: the key
+    The key consists of the host and the path of the repository, without
+    user, scheme, trailing `.git`, or slashes. Since GitHub treats the names
+    of users and repositories case-insensitively, GitHub keys are lower case.
+
+    :param url: the url
+    :return: the canonical key
+
+    >>> _make_key("https://github.com/thomasWeise/texgit_py")
+    'github.com/thomasweise/texgit_py'
+    >>> _make_key("http://GitHub.com/thomasWeise/texgit_py.git/")
+    'github.com/thomasweise/texgit_py'
+    >>> _make_key("ssh://git@github.com/thomasWeise/texgit_py.git")
+    'github.com/thomasweise/texgit_py'
+    >>> _make_key("git@github.com:thomasWeise/texgit_py")
+    'github.com/thomasweise/texgit_py'
+    >>> _make_key("https://example.com:8080/A/b.git")
+    'example.com:8080/A/b'
+    >>> _make_key("ssh://git@example.com/A/b")
+    'example.com/A/b'
     """
-    pt: str = u.path
+    u: Final[URL] = normalize_url(url)
+    pt: str = u.path or ""
     while pt.startswith("/"):
         pt = pt[1:]
-    while pt.endswith(".git"):
-        pt = pt[:-4]
-    while pt.endswith("/"):
-        pt = pt[:-1]
-    pt = pt.replace("/", "_")
-    return "gh" if u.host.lower() == "github.com" else u.host, pt
+    while pt.endswith((".git", "/")):
+        pt = pt[:-4] if pt.endswith(".git") else pt[:-1]
+    host: str = str.lower(u.host)
+    if host == "github.com":
+        pt = str.lower(pt)
+    if (u.port is not None) and (u.scheme != "ssh"):
+        host = f"{host}:{u.port}"
+    return f"{host}/{pt}" if pt else host
+
+
+def _make_prefix(key: str) -> str:
+    """
+    Make a readable directory name prefix for a repository key.
+
+    The prefix is only used to make the directory names recognizable. The
+    file manager takes care that two different keys never share the same
+    directory, even if they have the same prefix.
+
+    :param key: the repository key
+    :return: the prefix
+
+    >>> _make_prefix("github.com/a/b_c")
+    'gh_a_b_c'
+    >>> _make_prefix("example.com:8080/a/b")
+    'example.com_8080_a_b'
+    """
+    if key.startswith("github.com/"):
+        key = f"gh/{key[11:]}"
+    return "".join(c if (c.isalnum() or c in "._-") else "_" for c in key)
+
+
+#: the record section with the alias index of the repository urls
+_ALIASES: Final[str] = "git-aliases"
+
+
+def _load(path: Path) -> GitRepository | None:
+    """
+    Load a cloned repository or a repository snapshot archive.
+
+    :param path: the repository directory
+    :return: the repository, or `None` if the directory contains neither
+    """
+    if path.resolve_inside(".git").is_dir():
+        return GitRepository.from_local(path)
+    return load_archive(path)
 
 
 class GitManager(FileManager):
-    """A git repository manager can provide a set of git repositories."""
+    """
+    A git repository manager can provide a set of git repositories.
+
+    By default, repositories are cloned with `git`. Alternatively, only a
+    snapshot archive of the current commit of each new repository can be
+    fetched, see :mod:`~texgit.repository.archive`. Files and directories
+    are then extracted from the archive when they are requested, which is
+    cheaper if the repository is only used to read files from. Archives of
+    repositories on GitHub are downloaded from their archive urls, those of
+    other repositories via `git archive --remote` from the repository or
+    its mirrors. If no archive can be fetched, the repository is cloned.
+    """
 
-    def __init__(self, base_dir: str) -> None:
+    def __init__(self, base_dir: str,
+                 failure_ttl: int = FAILURE_TTL,
+                 hedge_delay: float = HEDGE_DELAY,
+                 fetch_archives: bool = False,
+                 store_dir: str | None = None,
+                 mirrors: Mapping[str, Iterable[str]] | None = None) -> None:
         """
         Set up the git repository manager.
 
         :param base_dir: the base directory
+        :param failure_ttl: the number of seconds for which failed requests
+            are not retried, `0` to always retry them
+        :param hedge_delay: the seconds that a clone may go without progress
+            before alternative sources are tried in parallel
+        :param fetch_archives: should new repositories be fetched as
+            snapshot archives instead of being cloned?
+        :param store_dir: the directory of the store shared with other
+            projects, or `None` for no shared store
+        :param mirrors: a mapping of repository urls, in any spelling, to
+            alternative urls or paths of the same repositories, which are
+            tried if a clone makes no progress, or `None` for no mirrors
         """
-        super().__init__(base_dir)
-        #: the internal set of github repositories
-        self.__repos: Final[dict[tuple[str, str], GitRepository]] = {}
-
-        #: load all the repository repositories
-        for the_dir in self.list_realm("git", files=False, directories=True):
-            if the_dir.resolve_inside(".git").is_dir():
-                gr: GitRepository = GitRepository.from_local(the_dir)
-                self.__repos[_make_key(gr.url)] = gr
+        super().__init__(base_dir, failure_ttl, store_dir)
+        #: the seconds without progress before hedging a clone
+        self.__hedge_delay: Final[float] = hedge_delay
+        #: the mirrors of the repositories, under their canonical keys
+        self.__mirrors: Final[dict[str, tuple[str, ...]]] = {} \
+            if mirrors is None else {
+                _make_key(url): tuple(alternatives)
+                for url, alternatives in mirrors.items()}
+        #: should we fetch archives instead of cloning?
+        self.__fetch_archives: Final[bool] = fetch_archives
+        #: the internal set of github repositories, loaded when needed
+        self.__repos: Final[dict[str, GitRepository]] = {}
 
     def _get_sensitive_paths(self) -> list[Path]:
         """
@@ -95,31 +200,158 @@ class GitManager(FileManager):
         paths.extend(r.path for r in self.__repos.values())
         return paths
 
+    def _snapshot_paths(self, realm: str, path: Path) -> Iterable[Path]:
+        """
+        Get the paths that represent an entry in a cache snapshot.
+
+        Of a cloned `git` repository, only the object store in its `.git`
+        directory is stored. The working tree is checked out again upon
+        import. Repositories fetched as archives are stored as they are.
+
+        :param realm: the realm of the entry
+        :param path: the path of the entry
+        :return: the paths to store in the snapshot
+        """
+        if realm == "git":
+            dot_git: Final[Path] = path.resolve_inside(".git")
+            if dot_git.is_dir():
+                return (dot_git, )
+        return super()._snapshot_paths(realm, path)
+
+    def _snapshot_restore(self, realm: str, name: str, path: Path) -> bool:
+        """
+        Re-create and verify an entry imported from a cache snapshot.
+
+        A cloned `git` repository is restored by checking out its working
+        tree.
+
+        :param realm: the realm of the entry
+        :param name: the name of the entry
+        :param path: the path of the entry
+        :return: `True` if the entry is valid, `False` if it should be
+            discarded
+        """
+        if not super()._snapshot_restore(realm, name, path):
+            return False
+        if realm != "git":
+            return True
+        gr: GitRepository | None = load_archive(path)
+        if gr is not None:
+            self.__repos[self._get_key(gr.url)] = gr
+            return True
+        try:
+            Command([git(), "-C", path, "reset", "--hard", "-q"],
+                    timeout=600, working_dir=path).execute(True)
+            gr = GitRepository.from_local(path)
+        except ValueError as ve:
+            logger(f"Could not restore repository in {path!r}: {ve}")
+            return False
+        self.__repos[self._get_key(gr.url)] = gr
+        return True
+
+    def _get_key(self, url: str) -> str:
+        """
+        Get the canonical key of a repository URL via the alias index.
+
+        Every spelling of a repository URL that was ever used is stored in a
+        persistent alias index, pointing to the canonical key of the
+        repository. This way, the same repository is never cloned twice.
+
+        :param url: the URL, in any spelling
+        :return: the canonical key
+        """
+        alias: Final[str] = str.strip(url)
+        key: str | None = self._get_record(_ALIASES, alias)
+        if key is None:
+            key = _make_key(alias)
+            self._set_record(_ALIASES, alias, key)
+        return key
+
     def get_repository(self, url: str) -> GitRepository:
         """
         Get the git repository for the given URL.
 
+        The repository is downloaded while holding the claim on its key, so
+        that concurrent processes sharing the same base directory do not
+        clone it twice. A process waiting for the claim will find the
+        repository downloaded by the other one.
+
         :param url: the URL to load
         :return: the repository
         """
         self._check_open()
-        use_url: Final[URL] = URL(url)
-        key: Final[tuple[str, str]] = _make_key(use_url)
+        key: Final[str] = self._get_key(url)
         if key in self.__repos:
             return self.__repos[key]
-        name: str = "_".join(key)
-        dirpath, found = self.get_dir("git", name)
-        if not found:
-            raise ValueError("Inconsistent archive state!")
+        path: Final[Path | None] = self._find("git", key)
+        if path is not None:
+            gr: Final[GitRepository | None] = _load(path)
+            if gr is not None:
+                self.__repos[key] = gr
+                return gr
+        with self._claim("git", key):
+            return self.__get_repository(url, key)
+
+    def __get_repository(self, url: str, key: str) -> GitRepository:
+        """
+        Get the git repository for the given URL while holding its claim.
+
+        :param url: the URL to load
+        :param key: the canonical key of the repository
+        :return: the repository
+        """
+        request: Final[str] = fingerprint(("clone", key))
+        self._check_failure(request)
+        use_url: Final[URL] = normalize_url(url)
+        dirpath, is_new = self.get_dir("git", key, _make_prefix(key))
+        if not is_new:  # downloaded by another process
+            gr: Final[GitRepository | None] = _load(dirpath)
+            if gr is not None:
+                self.__repos[key] = gr
+                return gr
+            self.delete("git", key)  # incomplete, e.g., process died
+            dirpath, is_new = self.get_dir("git", key, _make_prefix(key))
+        if self._fetch_shared("git", key, request):
+            shared: Final[GitRepository | None] = _load(dirpath)
+            if shared is not None:
+                self.__repos[key] = shared
+                return shared
+            self.delete("git", key)  # broken, so we download it again
+            dirpath, is_new = self.get_dir("git", key, _make_prefix(key))
+        start: Final[float] = monotonic()
         try:
-            gt: Final[GitRepository] = GitRepository.download(use_url, dirpath)
-        except ValueError:
-            rmdir(dirpath)
+            gt: Final[GitRepository] = self.__download(use_url, dirpath, key)
+        except ValueError as ve:
+            self.delete("git", key)
+            self._note_failure(request, ve)
             raise
+        self._describe("git", key, request, {
+            "url": gt.url, "commit": gt.commit,
+            "seconds": monotonic() - start})
         self.__repos[key] = gt
-        self.__repos[_make_key(gt.url)] = gt
+        self.__repos[self._get_key(gt.url)] = gt
         return gt
 
+    def __download(self, url: str, dest: Path, key: str) -> GitRepository:
+        """
+        Fetch the archive of a repository or clone it.
+
+        :param url: the normalized url of the repository
+        :param dest: the destination directory
+        :param key: the canonical key of the repository
+        :return: the repository
+        """
+        mirrors: Final[tuple[str, ...]] = self.__mirrors.get(key, ())
+        if self.__fetch_archives:
+            for source in (url, *mirrors):
+                try:
+                    return download_archive(url, dest, archive_source(source))
+                except (OSError, ValueError, TarError) as ex:
+                    logger(f"Could not fetch archive of {url!r} from "
+                           f"{source!r}: {ex}")
+            logger(f"No archive of {url!r} available, cloning it.")
+        return GitRepository.download(url, dest, mirrors, self.__hedge_delay)
+
     def __get_git(self, repo_url: str, relative_path: str,
                   is_file: bool) -> GitPath:
         """
@@ -133,6 +365,8 @@ class GitManager(FileManager):
         relative_path = str.strip(relative_path)
         repo: Final[GitRepository] = self.get_repository(repo_url)
         dest: Final[Path] = repo.path.resolve_inside(relative_path)
+        if not (is_file and dest.exists()):
+            extract_from_archive(repo, relative_path)
         if is_file:
             dest.enforce_file()
         else:
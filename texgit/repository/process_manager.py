@@ -21,33 +21,93 @@ associations of realms-names to paths are restored.
 This means that a program that creates output files for certain commands can
 then find these files again later.
 """
-from os import environ
-from os.path import getsize
-from typing import Final, Iterable, Mapping
+from contextlib import closing, suppress
+from functools import partial
+from os import close as os_close
+from os import environ, sep
+from os import remove as os_remove
+from os.path import getsize, join, relpath
+from tempfile import mkstemp
+from time import monotonic
+from typing import Any, Callable, Final, Generator, Iterable, Mapping
 
 from pycommons.ds.immutable_map import immutable_mapping
 from pycommons.io.console import logger
-from pycommons.io.path import Path, write_lines
+from pycommons.io.path import Path, delete_path
 from pycommons.processes.python import PYTHON_ENV, PYTHON_INTERPRETER
 from pycommons.processes.shell import STREAM_CAPTURE, Command
 from pycommons.types import type_error
 
+from texgit.repository.builtin_commands import find_builtin, run_builtin
+from texgit.repository.file_manager import (
+    FAILURE_TTL,
+    CacheEntry,
+    file_hash,
+    fingerprint,
+    write_if_changed,
+)
 from texgit.repository.fix_path import replace_base_path
+from texgit.repository.forkserver import ForkServer, fork_args
+from texgit.repository.git import HEDGE_DELAY
 from texgit.repository.git_manager import GitManager, GitPath
-
-
-def _write(orig: str, dest: Path) -> None:
+from texgit.repository.remote_cache import CacheBackend
+from texgit.repository.streams import (
+    MAX_OUTPUT,
+    limit_chunks,
+    read_chunks,
+    split_lines,
+    stream_pipeline,
+)
+from texgit.repository.venvs import (
+    create_venv,
+    find_requirements,
+    venv_key,
+    venv_python,
+)
+from texgit.repository.workdir import VIEW_MODES, isolated_dir
+
+
+def _write(chunks: Iterable[str], dest: Path,
+           replace: list[Path] | None) -> None:
     """
-    Write the string to the destination.
+    Write the chunks of an output to the destination.
+
+    If `replace` is `None`, the output is written as is. Otherwise, all
+    occurrences of the paths in `replace` are replaced in each line, see
+    :func:`~texgit.repository.fix_path.replace_base_path`, then the lines are
+    r-stripped and trailing empty lines are dropped. The destination is only
+    touched if its contents change, see
+    :func:`~texgit.repository.file_manager.write_if_changed`.
 
-    :param orig: the original string
+    :param chunks: the chunks of the output
     :param dest: the destination
+    :param replace: the paths to replace, longest first, or `None` to write
+        the raw output
     """
-    orig = str.rstrip(orig)
-    with dest.open_for_write() as output:
-        write_lines(map(str.rstrip, str.rstrip(orig).splitlines()), output)
-    logger("Wrote r-stripped string of originally "
-           f"{str.__len__(orig)} characters to {dest!r}, "
+    chars: int = 0
+    with write_if_changed(dest) as output:
+        if replace is None:
+            for chunk in chunks:
+                chars += str.__len__(chunk)
+                output.write(chunk)
+        else:
+            empty: int = 0
+            for line in split_lines(chunks):
+                chars += str.__len__(line) + 1
+                fixed: str = line
+                for base_dir in replace:  # fix the base path
+                    if base_dir in fixed:
+                        fixed = replace_base_path(fixed, base_dir)
+                fixed = str.rstrip(fixed)
+                if str.__len__(fixed) <= 0:
+                    empty += 1
+                    continue
+                output.write("\n" * empty)
+                output.write(fixed)
+                output.write("\n")
+                empty = 0
+    logger(f"Wrote {'raw' if replace is None else 'r-stripped'} output of "
+           f"originally {chars} characters to {dest!r}, "
            f"produced file of size {getsize(dest)} bytes.")
 
 
@@ -67,8 +127,199 @@ SYS_ENV: Final[Mapping[str, str]] = __get_sys_env()
 del __get_sys_env
 
 
+#: the environment variables that may change the output of a command and
+#: therefore are part of its fingerprint
+FINGERPRINT_ENV: Final[tuple[str, ...]] = (
+    "LANG", "LANGUAGE", "LC_ALL", "LC_COLLATE", "LC_CTYPE", "LC_MESSAGES",
+    "LC_NUMERIC", "LC_TIME", "PYTHONHASHSEED", "PYTHONPATH", "TZ")
+
+
+#: the argument separating the stages of a pipeline, written like the
+#: `(?name?)` argument files so that it cannot be confused with a normal
+#: argument: a literal `|` is passed to the program as is
+PIPE_SEPARATOR: Final[str] = "(|)"
+
+
+def _normalize(command: str | Iterable[str]) -> list[str]:
+    """
+    Normalize a command by stripping its parts and removing empty ones.
+
+    :param command: the command
+    :return: the normalized command
+
+    >>> _normalize(" ls ")
+    ['ls']
+    >>> _normalize(("head", " ", " -n ", "1"))
+    ['head', '-n', '1']
+    """
+    cmd_lst: Final[list[str]] = [c for c in map(str.strip, [
+        command] if isinstance(command, str) else command) if c]
+    if list.__len__(cmd_lst) <= 0:
+        raise ValueError(f"Invalid command {command!r}.")
+    return cmd_lst
+
+
+def _split_pipeline(command: list[str]) -> list[list[str]]:
+    """
+    Split a normalized command into the stages of a pipeline.
+
+    The stages are separated by :data:`PIPE_SEPARATOR`.
+
+    :param command: the normalized command
+    :return: the stages
+
+    >>> _split_pipeline(["ls"])
+    [['ls']]
+    >>> _split_pipeline(["cat", "(|)", "head", "-n", "1", "(|)", "sort"])
+    [['cat'], ['head', '-n', '1'], ['sort']]
+    >>> _split_pipeline(["cut", "-d", "|", "-f", "1"])
+    [['cut', '-d', '|', '-f', '1']]
+    >>> _split_pipeline(["ls", "(|)"])
+    Traceback (most recent call last):
+    ...
+    ValueError: Empty stage in pipeline ['ls', '(|)'].
+    """
+    stages: Final[list[list[str]]] = [[]]
+    for part in command:
+        if part == PIPE_SEPARATOR:
+            stages.append([])
+        else:
+            stages[-1].append(part)
+    if not all(stages):
+        raise ValueError(f"Empty stage in pipeline {command!r}.")
+    return stages
+
+
+def _argument_names(command: list[str]) -> list[str]:
+    """
+    Get the names of the `(?name?)` argument files of a command.
+
+    :param command: the normalized command
+    :return: the names, without duplicates, in the order of their first
+        occurrence
+
+    >>> _argument_names(["python3", "a.py", "(?x?)", "(? y ?)", "(?x?)"])
+    ['x', 'y']
+    >>> _argument_names(["cat", "a.txt", "(|)", "head"])
+    []
+    """
+    names: Final[list[str]] = []
+    for arg in command[1:]:
+        if arg.startswith("(?") and arg.endswith("?)"):
+            name: str = str.strip(arg[2:-2])
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def _argument_request(request: str, name: str) -> str:
+    """
+    Get the fingerprint of an argument file written by a request.
+
+    :param request: the fingerprint of the request
+    :param name: the name of the argument file
+    :return: the fingerprint of the argument file
+    """
+    return fingerprint(("argument", request, name))
+
+
+def _environment(command: list[str]) -> Mapping[str, str]:
+    """
+    Get the environment in which a command is executed.
+
+    :param command: the normalized command
+    :return: the environment
+    """
+    return PYTHON_ENV if str.lower(command[0]).startswith("python3") \
+        else SYS_ENV
+
+
 class ProcessManager(GitManager):
-    """A manager for processes."""
+    """
+    A manager for processes.
+
+    Commands can be pipelines, whose stages are separated by
+    :data:`PIPE_SEPARATOR` arguments and are connected via pipes, see
+    :func:`~texgit.repository.streams.stream_pipeline`.
+    A process manager can use a remote cache, see
+    :class:`~texgit.repository.remote_cache.CacheBackend`, to download the
+    outputs of commands that were executed on other machines and to upload
+    the outputs of the commands it executes.
+    It can also execute `python3` commands in forks of a pre-warmed
+    interpreter, see :class:`~texgit.repository.forkserver.ForkServer`,
+    and execute commands in isolated views of the repositories, see
+    :mod:`~texgit.repository.workdir`, and in virtual environments with the
+    requirements of the repositories, see :mod:`~texgit.repository.venvs`.
+    """
+
+    def __init__(self, base_dir: str,
+                 failure_ttl: int = FAILURE_TTL,
+                 hedge_delay: float = HEDGE_DELAY,
+                 fetch_archives: bool = False,
+                 store_dir: str | None = None,
+                 backend: CacheBackend | None = None,
+                 preload: Iterable[str] | None = None,
+                 max_output: int = MAX_OUTPUT,
+                 cache_stages: bool = False,
+                 isolate: str | None = None,
+                 venvs: bool = False,
+                 venv_source: str | None = None,
+                 mirrors: Mapping[str, Iterable[str]] | None = None) -> None:
+        """
+        Set up the process manager.
+
+        :param base_dir: the base directory
+        :param failure_ttl: the number of seconds for which failed requests
+            are not retried, `0` to always retry them
+        :param hedge_delay: the seconds that a clone may go without progress
+            before alternative sources are tried in parallel
+        :param fetch_archives: should new repositories be fetched as
+            snapshot archives instead of being cloned?
+        :param store_dir: the directory of the store shared with other
+            projects, or `None` for no shared store
+        :param backend: the remote cache, or `None` for no remote cache
+        :param preload: the modules to preload in a fork server executing
+            the `python3` commands, or `None` to execute them as new
+            processes
+        :param max_output: the maximum number of characters that a command
+            may output
+        :param cache_stages: should the outputs of the first stages of
+            pipelines be cached, so that pipelines with the same first stages
+            can share them?
+        :param isolate: the mode of the views of the repositories in which
+            commands are executed, see :mod:`~texgit.repository.workdir`, or
+            `None` to execute them directly inside the repositories
+        :param venvs: should the `python3` commands of repositories with a
+            requirements file be executed in virtual environments, see
+            :mod:`~texgit.repository.venvs`?
+        :param venv_source: the wheelhouse directory or the url of the
+            package index from which the requirements are installed, or
+            `None` for the default index
+        :param mirrors: a mapping of repository urls to alternative urls or
+            paths of the same repositories, or `None` for no mirrors
+        """
+        super().__init__(base_dir, failure_ttl, hedge_delay, fetch_archives,
+                         store_dir, mirrors)
+        #: the remote cache
+        self.__backend: Final[CacheBackend | None] = backend
+        #: the fork server for `python3` commands
+        self.__forkserver: Final[ForkServer | None] = None \
+            if preload is None else ForkServer(preload)
+        #: the maximum number of characters that a command may output
+        self.__max_output: Final[int] = max_output
+        #: should the outputs of the first stages of pipelines be cached?
+        self.__cache_stages: Final[bool] = cache_stages
+        if (isolate is not None) and (isolate not in VIEW_MODES):
+            raise ValueError(f"Invalid isolation mode {isolate!r}, must be "
+                             f"one of {VIEW_MODES!r}.")
+        #: the mode of the views in which commands are executed, or `None`
+        self.__isolate: Final[str | None] = isolate
+        #: should virtual environments be used for the repositories?
+        self.__venvs: Final[bool] = venvs
+        #: the source of the packages for the virtual environments
+        self.__venv_source: Final[str | None] = venv_source
+        #: the resources used by the commands executed so far
+        self.__usage: Final[list[dict[str, Any]]] = []
 
     def get_argument_file(self, name: str, prefix: str | None = None,
                           suffix: str | None = None) -> tuple[Path, bool]:
@@ -105,28 +356,99 @@ class ProcessManager(GitManager):
             return arg
         return None
 
-    def __execute(self, dest: Path,
-                  command: str | Iterable[str],
+    def __stage(self, command: list[str], working_dir: Path | None,
+                python: Path | None) -> Command | Callable[[str | None], str]:
+        """
+        Create a stage of a pipeline.
+
+        Builtin commands are executed in the current process. Otherwise, we
+        need to fix the command if we are running inside a virtual
+        environment. Then, it is necessary to use the same Python interpreter
+        that was used to run texgit, unless the repository has its own
+        virtual environment. We should also pass along all the
+        Python-related environment parameters.
+
+        :param command: the command, with the arguments already filtered
+        :param working_dir: an optional working directory
+        :param python: the interpreter of the virtual environment of the
+            repository, or `None`
+        :return: the stage
+        """
+        builtin: Final[Callable[[str | None], str] | None] = find_builtin(
+            command)
+        if builtin is not None:
+            return partial(run_builtin, builtin, command)
+        return Command(
+            command=[python or PYTHON_INTERPRETER, *command[1:]] if str.lower(
+                command[0]).startswith("python3") else command,
+            working_dir=working_dir, env=_environment(command),
+            stdout=STREAM_CAPTURE)
+
+    def __run_command(self, command: list[str], working_dir: Path | None,
+                      stdin: Path | None, usage: dict[str, float],
+                      python: Path | None) -> Generator[str, None, None]:
+        """
+        Run a command or pipeline and yield its output in chunks.
+
+        `python3` commands that are not part of a pipeline and do not need
+        a virtual environment may be executed by the fork server.
+
+        :param command: the command, with the arguments already filtered
+        :param working_dir: an optional working directory
+        :param stdin: the file attached to the standard input of the program,
+            or `None`
+        :param usage: the record to which the used resources are added, see
+            :func:`~texgit.repository.streams.add_usage`
+        :param python: the interpreter of the virtual environment of the
+            repository, or `None`
+        :return: the generator of the chunks of the output
+        """
+        stages: Final[list[list[str]]] = _split_pipeline(command)
+        if (list.__len__(stages) == 1) and (python is None) and (
+                self.__forkserver is not None) and (find_builtin(
+                command) is None) and str.lower(command[0]).startswith(
+                "python3") and (fork_args(command[1:]) is not None):
+            handle, temp = mkstemp(suffix=".txt")
+            os_close(handle)
+            try:
+                self.__forkserver.execute(command[1:], temp, working_dir,
+                                          stdin, usage)
+                yield from read_chunks(temp)
+            finally:
+                with suppress(FileNotFoundError):
+                    os_remove(temp)
+            return
+        yield from stream_pipeline([self.__stage(
+            stage, working_dir, python) for stage in stages], stdin,
+            self.__max_output, usage)
+
+    def __execute(self, dest: Path, request: str, command: list[str],
                   working_dir: Path | None = None,
-                  stdin: str | None = None) -> None:
+                  stdin: Path | None = None,
+                  raw: bool = False,
+                  view: Path | None = None,
+                  python: Path | None = None) -> dict[str, Any]:
         """
-        Make a command and environment.
+        Execute a command and write its output to a file.
 
         :param dest: the destination path
-        :param command: the command
+        :param request: the fingerprint of the request
+        :param command: the normalized command
         :param working_dir: an optional working directory
-        :param stdin: the standard input for the program, or `None`
-        """
-        # process the command
-        cmd_lst: Final[list[str]] = [command] if isinstance(command, str)\
-            else list(command)
-        for i in range(list.__len__(cmd_lst) - 1, -1, -1):
-            cmd: str = str.strip(cmd_lst[i])
-            if str.__len__(cmd) <= 0:
-                del cmd_lst[i]
-                continue
-
+        :param stdin: the file attached to the standard input of the program,
+            or `None`
+        :param raw: should the output be written as is instead of fixing the
+            paths and r-stripping the lines?
+        :param view: the root of the view of the repository in which the
+            command is executed, whose paths are fixed as well, or `None`
+        :param python: the interpreter of the virtual environment of the
+            repository, or `None`
+        :return: the metadata of the output, namely the seconds it took to
+            compute and the resources used, see
+            :func:`~texgit.repository.streams.add_usage`
+        """
         # process the arguments
+        cmd_lst: Final[list[str]] = list(command)
         for i in range(list.__len__(cmd_lst) - 1, 0, -1):
             cmd = self.filter_argument(cmd_lst[i])
             if cmd is None:
@@ -134,30 +456,474 @@ class ProcessManager(GitManager):
                 continue
             cmd_lst[i] = cmd
 
-        if list.__len__(cmd_lst) <= 0:
-            raise ValueError(f"Invalid command {command!r}.")
-
-        # Now we need to fix the command if we are running inside a virtual
-        # environment. If we are running inside a virtual environment, it is
-        # necessary to use the same Python interpreter that was used to run
-        # texgit. We should also pass along all the Python-related
-        # environment parameters.
-        env: Mapping[str, str] = SYS_ENV
-        if str.lower(cmd_lst[0]).startswith("python3"):
-            cmd_lst[0] = PYTHON_INTERPRETER
-            env = PYTHON_ENV
-
-        # execute the command and capture the output
-        output: str = Command(
-            command=cmd_lst, working_dir=working_dir, env=env,
-            stdout=STREAM_CAPTURE, stdin=stdin).execute(True)[0]
-
-        replace: list[Path] = self._get_sensitive_paths()
-        replace.append(dest)
-        replace.sort(key=str.__len__, reverse=True)
-        for base_dir in replace:  # fix the base path
-            output = replace_base_path(output, base_dir)
-        _write(output, dest)
+        # do not repeat commands that have failed recently
+        self._check_failure(request)
+
+        replace: list[Path] | None = None
+        if not raw:
+            replace = self._get_sensitive_paths()
+            replace.append(dest)
+            if view is not None:
+                replace.append(view)
+            replace.sort(key=str.__len__, reverse=True)
+
+        # Execute the command and stream its output into the destination
+        # file.
+        usage: Final[dict[str, float]] = {}
+        record: Final[dict[str, Any]] = {"command": " ".join(cmd_lst)}
+        self.__usage.append(record)
+        start: Final[float] = monotonic()
+        try:
+            with closing(self.__run_command(
+                    cmd_lst, working_dir, stdin, usage, python)) as chunks:
+                _write(limit_chunks(chunks, self.__max_output, " ".join(
+                    cmd_lst)), dest, replace)
+        except ValueError as ve:
+            record.update(usage, seconds=monotonic() - start, error=str(ve))
+            self._note_failure(request, ve)
+            raise
+        meta: Final[dict[str, Any]] = {"seconds": monotonic() - start,
+                                       **usage}
+        record.update(meta, size=getsize(dest))
+        return meta
+
+    def __fingerprint(self, command: list[str], repo_key: str | None,
+                      working_dir: GitPath | None,
+                      stdin: Path | None) -> str:
+        """
+        Compute the fingerprint of the request to execute a command.
+
+        The fingerprint covers everything that determines the output: the
+        normalized command, the commit of the repository and the directory
+        inside it in which the command is executed, a hash of the standard
+        input, and the values of the environment variables in
+        :data:`FINGERPRINT_ENV`. If the repository has its own virtual
+        environment, its key is included as well.
+
+        :param command: the normalized command
+        :param repo_key: the key of the repository, or `None`
+        :param working_dir: the directory inside the repository in which the
+            command is executed, or `None`
+        :param stdin: the file attached to the standard input of the program,
+            or `None`
+        :return: the fingerprint
+        """
+        env: Final[dict[str, str]] = {}
+        for stage in _split_pipeline(command):
+            stage_env: Mapping[str, str] = _environment(stage)
+            env.update({k: stage_env[k] for k in FINGERPRINT_ENV
+                        if k in stage_env})
+        request: Final[tuple] = (
+            "execute", command, None if working_dir is None else (
+                repo_key, working_dir.repo.commit,
+                relpath(working_dir.path, working_dir.repo.path)),
+            None if stdin is None else file_hash(stdin), env)
+        venv: Final[tuple[str, Path] | None] = self.__find_venv(
+            command, working_dir)
+        return fingerprint(request if venv is None else (*request, venv[0]))
+
+    def __run_stages(self, dest: Path, request: str, command: list[str],
+                     repo_key: str | None, working_dir: GitPath | None,
+                     stdin: Path | None, raw: bool) -> dict[str, Any]:
+        """
+        Execute a command or pipeline and write its output to a file.
+
+        If the outputs of the first stages of pipelines are cached, only the
+        last stage is executed here, reading the cached output of the other
+        stages. If commands are isolated, they are executed in a temporary
+        view of the repository, see :mod:`~texgit.repository.workdir`.
+        `python3` commands use the virtual environment of the repository,
+        if it has one.
+
+        :param dest: the destination path
+        :param request: the fingerprint of the request
+        :param command: the normalized command
+        :param repo_key: the key of the repository, or `None`
+        :param working_dir: the directory inside the repository in which the
+            command is executed, or `None`
+        :param stdin: the file attached to the standard input of the program,
+            or `None`
+        :param raw: should the output be written as is?
+        :return: the metadata of the output
+        """
+        last: Final[list[str]] = _split_pipeline(command)[-1]
+        if self.__cache_stages and (list.__len__(last) < list.__len__(
+                command)):
+            stdin = self.__get_stage(
+                command[:list.__len__(command) - list.__len__(last) - 1],
+                repo_key, working_dir, stdin)
+            command = last
+        venv: Final[tuple[str, Path] | None] = self.__find_venv(
+            command, working_dir)
+        python: Final[Path | None] = None if venv is None \
+            else self.__get_venv(*venv)
+        if (self.__isolate is None) or (working_dir is None):
+            return self.__execute(dest, request, command, None if (
+                working_dir is None) else working_dir.path, stdin, raw,
+                None, python)
+
+        # The view of the repository has the same path relative to its root
+        # as the repository relative to the sensitive path that is replaced
+        # in the output, so the output does not depend on the view.
+        repo_dir: Final[Path] = working_dir.repo.path
+        anchor: Final[Path] = max((p for p in self._get_sensitive_paths()
+                                   if (p == repo_dir) or repo_dir.startswith(
+                                       f"{p}{sep}")), key=str.__len__)
+        root: Final[Path] = self._get_view_dir(request)
+        try:
+            with isolated_dir(repo_dir, join(root, relpath(
+                    repo_dir, anchor)), self.__isolate) as view:
+                return self.__execute(
+                    dest, request, command, view.resolve_inside(relpath(
+                        working_dir.path, repo_dir)), stdin, raw, root,
+                    python)
+        finally:
+            if root.exists():
+                delete_path(root)
+
+    def __hash_arguments(self, command: list[str]) -> dict[str, Any]:
+        """
+        Describe the argument files of a command after producing its output.
+
+        :param command: the normalized command
+        :return: the metadata to add to the output: the SHA-256 hashes of the
+            argument files under the key `args`, or nothing if the command
+            has no argument files
+        """
+        names: Final[list[str]] = _argument_names(command)
+        return {"args": {name: file_hash(self.get_argument_file(name)[0])
+                         for name in names}} if list.__len__(names) > 0 \
+            else {}
+
+    def __arguments_intact(self, realm: str, request: str,
+                           command: list[str]) -> bool:
+        """
+        Check whether the argument files of a cached output are intact.
+
+        An output is only valid together with the argument files that were
+        written when it was produced. If any of them has been deleted or
+        changed since, the command must be executed again.
+
+        :param realm: the realm of the output
+        :param request: the fingerprint of the request
+        :param command: the normalized command
+        :return: `True` if all argument files of the command exist and have
+            the hashes recorded with the output, `False` otherwise
+        """
+        names: Final[list[str]] = _argument_names(command)
+        if list.__len__(names) <= 0:
+            return True
+        entry: Final[CacheEntry | None] = self.get_entry(realm, request)
+        hashes: Final[Mapping[str, str]] = {} if entry is None \
+            else entry.meta.get("args") or {}
+        for name in names:
+            path: Path | None = self._find("args", name)
+            if (path is None) or (not path.is_file()) or (
+                    hashes.get(name) != file_hash(path)):
+                logger(f"Argument file {name!r} of {request!r} in realm "
+                       f"{realm!r} is missing or changed.")
+                return False
+        return True
+
+    def __describe_arguments(self, command: list[str], request: str) -> None:
+        """
+        Record that the argument files of a command were written by a request.
+
+        This puts the argument files into the shared store next to the
+        output, if there is a store.
+
+        :param command: the normalized command
+        :param request: the fingerprint of the request
+        """
+        for name in _argument_names(command):
+            self._describe("args", name, _argument_request(request, name))
+
+    def __fetch_shared_output(self, realm: str, request: str,
+                              command: list[str]) -> bool:
+        """
+        Take an output and the argument files of its command from the store.
+
+        :param realm: the realm of the output
+        :param request: the fingerprint of the request
+        :param command: the normalized command
+        :return: `True` if the output and all of its argument files were
+            taken from the store, `False` if the command must be executed
+        """
+        for name in _argument_names(command):
+            self.get_argument_file(name)
+            if not self._fetch_shared(
+                    "args", name, _argument_request(request, name)):
+                return False
+        return self._fetch_shared(realm, request, request) and \
+            self.__arguments_intact(realm, request, command)
+
+    def _get_companions(self, entry: CacheEntry) \
+            -> Iterable[tuple[str, str]]:
+        """
+        Get the argument files that were written together with an output.
+
+        An output is useless without its argument files, so both are only
+        removed together.
+
+        :param entry: the entry
+        :return: the realms and names of the argument files
+        """
+        hashes: Final[Any] = entry.meta.get("args")
+        return [("args", name) for name in hashes] \
+            if isinstance(hashes, Mapping) else []
+
+    def _shares_by_link(self, realm: str) -> bool:
+        """
+        Check whether files of a realm may be hard-linked with the store.
+
+        Argument files are written in place by the commands and are therefore
+        copied.
+
+        :param realm: the realm
+        :return: `True` if single files of the realm are hard-linked, `False`
+            if they are copied
+        """
+        return (realm != "args") and super()._shares_by_link(realm)
+
+    def __find_venv(self, command: list[str], working_dir: GitPath | None) \
+            -> tuple[str, Path] | None:
+        """
+        Find the virtual environment that a command needs.
+
+        Only `python3` commands that are not builtin commands are executed
+        in virtual environments.
+
+        :param command: the normalized command
+        :param working_dir: the directory inside the repository in which the
+            command is executed, or `None`
+        :return: the key of the environment and the requirements file, or
+            `None` if virtual environments are not used, the command does
+            not execute `python3`, or the repository has no requirements file
+        """
+        if (not self.__venvs) or (working_dir is None) or not any(
+                str.lower(stage[0]).startswith("python3") and (
+                    find_builtin(stage) is None)
+                for stage in _split_pipeline(command)):
+            return None
+        requirements: Final[Path | None] = find_requirements(
+            working_dir.repo.path)
+        return None if requirements is None else (
+            venv_key(requirements, self.__venv_source), requirements)
+
+    def __get_venv(self, key: str, requirements: Path) -> Path:
+        """
+        Get the interpreter of a virtual environment, creating it if needed.
+
+        The environments are stored in the realm `venvs` under their keys,
+        so repositories with the same requirements share them.
+
+        :param key: the key of the environment
+        :param requirements: the requirements file
+        :return: the Python interpreter of the environment
+        """
+        found: Path | None = self._find("venvs", key)
+        if found is None:
+            self._check_failure(key)
+            with self._claim("venvs", key):
+                found, is_new = self.get_dir("venvs", key)
+                if is_new:
+                    start: Final[float] = monotonic()
+                    try:
+                        create_venv(found, requirements, self.__venv_source)
+                    except ValueError as ve:
+                        self._note_failure(key, ve)
+                        self.delete("venvs", key)
+                        raise
+                    except BaseException:
+                        self.delete("venvs", key)  # no incomplete venv
+                        raise
+                    self._describe("venvs", key, key, {
+                        "seconds": monotonic() - start,
+                        "source": self.__venv_source})
+        return venv_python(found)
+
+    def __get_stage(self, command: list[str], repo_key: str | None,
+                    working_dir: GitPath | None, stdin: Path | None) -> Path:
+        """
+        Get the raw output of the first stages of a pipeline.
+
+        The output is cached in the realm `stages` under its fingerprint, so
+        that all pipelines starting with the same stages can use it.
+
+        :param command: the normalized command of the first stages
+        :param repo_key: the key of the repository, or `None`
+        :param working_dir: the directory inside the repository in which the
+            command is executed, or `None`
+        :param stdin: the file attached to the standard input of the program,
+            or `None`
+        :return: the path to the output
+        """
+        request: Final[str] = self.__fingerprint(
+            command, repo_key, working_dir, stdin)
+        found: Final[Path | None] = self._find("stages", request)
+        if found is not None:
+            if self.__arguments_intact("stages", request, command):
+                return found
+            self.delete("stages", request)
+        with self._claim("stages", request):
+            path, is_new = self.get_file("stages", request)
+            if is_new:
+                try:
+                    meta: dict[str, Any] = self.__run_stages(
+                        path, request, command, repo_key, working_dir, stdin,
+                        True)
+                    meta.update(self.__hash_arguments(command))
+                    if repo_key is not None:
+                        meta["repo"] = repo_key
+                    self._describe("stages", request, request, meta)
+                except BaseException:
+                    self.delete("stages", request)  # no incomplete output
+                    raise
+        return path
+
+    def __produce(self, realm: str, request: str, dest: Path,
+                  command: list[str], repo_key: str | None,
+                  working_dir: GitPath | None,
+                  stdin: Path | None) -> dict[str, Any]:
+        """
+        Download the output of a command or execute the command.
+
+        :param realm: the realm of the output
+        :param request: the fingerprint of the request
+        :param dest: the destination path
+        :param command: the normalized command
+        :param repo_key: the key of the repository, or `None`
+        :param working_dir: the directory inside the repository in which the
+            command is executed, or `None`
+        :param stdin: the file attached to the standard input of the program,
+            or `None`
+        :return: the metadata of the output
+        """
+        if self.__backend is not None:
+            downloaded: Final[Mapping[str, Any] | None] = self.__backend.get(
+                realm, request, dest)
+            if (downloaded is not None) and self.__download_arguments(
+                    self.__backend, request, command, downloaded):
+                return dict(downloaded)
+        meta: Final[dict[str, Any]] = self.__run_stages(
+            dest, request, command, repo_key, working_dir, stdin, False)
+        meta.update(self.__hash_arguments(command))
+        if self.__backend is not None:
+            for name in _argument_names(command):  # before the output
+                self.__backend.put("args", _argument_request(request, name),
+                                   self.get_argument_file(name)[0], {})
+            self.__backend.put(realm, request, dest, meta)
+        return meta
+
+    def __download_arguments(self, backend: CacheBackend, request: str,
+                             command: list[str],
+                             meta: Mapping[str, Any]) -> bool:
+        """
+        Download the argument files written together with an output.
+
+        :param backend: the remote cache
+        :param request: the fingerprint of the request
+        :param command: the normalized command
+        :param meta: the metadata of the downloaded output
+        :return: `True` if all argument files of the command were downloaded
+            and have the hashes recorded with the output, `False` if the
+            command must be executed
+        """
+        hashes: Final[Any] = meta.get("args") or {}
+        for name in _argument_names(command):
+            path: Path = self.get_argument_file(name)[0]
+            if (not isinstance(hashes, Mapping)) or (backend.get(
+                    "args", _argument_request(request, name),
+                    path) is None) or (hashes.get(name) != file_hash(path)):
+                logger(f"Remote cache has no intact argument file {name!r} "
+                       f"of {request!r}.")
+                return False
+        return True
+
+    def __get_cached(self, realm: str, name: str,
+                     command: str | Iterable[str], stdin: Path | None,
+                     repo_url: str | None,
+                     working_dir: GitPath | None) -> Path:
+        """
+        Get the output of a command, executing the command only if needed.
+
+        The output is stored under the fingerprint of the request, which
+        covers everything that determines it. The name is only an alias of
+        this fingerprint. If anything changes, the command is executed again.
+        The same holds if any of the `(?name?)` argument files that the
+        command wrote are gone or were changed since.
+
+        :param realm: the realm, `output` or `postprocessed`
+        :param name: the name for the output
+        :param command: the command itself
+        :param stdin: the file attached to the standard input of the program,
+            or `None`
+        :param repo_url: the url of the repository the output belongs to,
+            or `None`
+        :param working_dir: the directory inside the repository in which the
+            command is executed, or `None`
+        :return: the path to the output
+        """
+        cmd_lst: Final[list[str]] = _normalize(command)
+        repo_key: Final[str | None] = None if repo_url is None \
+            else self._get_key(repo_url)
+        request: Final[str] = self.__fingerprint(
+            cmd_lst, repo_key, working_dir, stdin)
+        section: Final[str] = f"{realm}-aliases"
+        if self._get_record(section, name) != request:
+            self._set_record(section, name, request)
+
+        found: Final[Path | None] = self._find(realm, request)
+        if found is not None:
+            if self.__arguments_intact(realm, request, cmd_lst):
+                return found
+            self.delete(realm, request)
+        meta: Final[dict[str, Any]] = {"name": name}
+        if repo_key is not None:
+            meta["repo"] = repo_key
+        with self._claim(realm, request):
+            path, is_new = self.get_file(realm, request)
+            if is_new:
+                try:
+                    if not self.__fetch_shared_output(
+                            realm, request, cmd_lst):
+                        self._describe(realm, request, request, {
+                            **self.__produce(
+                                realm, request, path, cmd_lst, repo_key,
+                                working_dir, stdin), **meta})
+                        self.__describe_arguments(cmd_lst, request)
+                except BaseException:
+                    self.delete(realm, request)  # no incomplete output
+                    raise
+        return path
+
+    def get_usage(self) -> list[dict[str, Any]]:
+        """
+        Get the resources used by the commands executed by this manager.
+
+        Commands whose outputs were taken from a cache are not included.
+        Each record contains the `command` and the `seconds` it took, the
+        `user` and `system` CPU seconds and the peak memory `maxrss` in
+        bytes, see :func:`~texgit.repository.streams.add_usage`, as well as
+        the `size` of the output in bytes if the command succeeded or the
+        `error` message if it failed.
+
+        :return: the usage records, in the order in which the commands were
+            executed
+        """
+        return [dict(r) for r in self.__usage]
+
+    def get_alias(self, realm: str, name: str) -> str | None:
+        """
+        Get the fingerprint that the name of an output currently refers to.
+
+        :param realm: the realm, `output` or `postprocessed`
+        :param name: the name of the output
+        :return: the fingerprint, i.e., the name of the entry in the realm,
+            or `None` if the name was never used
+        """
+        return self._get_record(f"{str.strip(realm)}-aliases",
+                                str.strip(name))
 
     def get_output(
             self, name: str, command: str | Iterable[str],
@@ -171,15 +937,9 @@ class ProcessManager(GitManager):
         :param repo_url: the optional repository URL
         :param relative_dir: the optional directory inside the repository
             where the command should be executed
-        :return: the path to the output and, if `repo_url` and `relative_dir`
-            were not `None`, then a URL pointing to the directory in the
-            repository, else `None`
+        :return: the path to the output
         """
         self._check_open()
-        path, is_new = self.get_file("output", name)
-        if not is_new:
-            return path
-
         if isinstance(repo_url, str):
             repo_url = str.strip(repo_url) or None
         elif repo_url is not None:
@@ -193,12 +953,10 @@ class ProcessManager(GitManager):
             raise ValueError(f"repo_url and relative_dir must either both be "
                              f"None or neither, but they are {repo_url!r} "
                              f"and {relative_dir!r}.")
-        working_dir: Path | None = None
-        if repo_url is not None:
-            working_dir = self.get_git_dir(repo_url, relative_dir).path
-
-        self.__execute(dest=path, command=command, working_dir=working_dir)
-        return path
+        return self.__get_cached(
+            "output", str.strip(name), command, None, repo_url,
+            None if repo_url is None else self.get_git_dir(
+                repo_url, relative_dir))
 
     def get_git_file(
             self, repo_url: str, relative_file: str,
@@ -214,12 +972,17 @@ class ProcessManager(GitManager):
         :return: a tuple of file and URL
         """
         gf: Final[GitPath] = super().get_git_file(repo_url, relative_file)
+        path: Path = gf.path
         if command:
-            name = str.strip(name)
-            path, is_new = self.get_file("postprocessed", name)
-            if is_new:
-                self.__execute(dest=path, command=command,
-                               stdin=gf.path.read_all_str())
-        else:
-            path = gf.path
+            path = self.__get_cached(
+                "postprocessed", str.strip(name), command, gf.path,
+                repo_url, None)
         return GitPath(path, gf.repo, gf.repo.make_url(gf.path))
+
+    def close(self) -> None:
+        """Close the process manager and stop the fork server, if any."""
+        try:
+            super().close()
+        finally:
+            if self.__forkserver is not None:
+                self.__forkserver.close()
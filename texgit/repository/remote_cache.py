@@ -0,0 +1,231 @@
+"""
+Share the outputs of commands between machines via a remote cache.
+
+A :class:`CacheBackend` stores the outputs of commands under the fingerprints
+of the requests producing them, see
+:func:`~texgit.repository.file_manager.fingerprint`. If a
+:class:`~texgit.repository.process_manager.ProcessManager` has a backend, it
+first tries to download the output of a command before executing it. This
+way, fresh machines, e.g., ephemeral CI runners, do not need to execute
+commands whose outputs were already computed elsewhere.
+
+:class:`HttpCacheBackend` is a backend that needs nothing but an `http(s)`
+server that can serve files, e.g., a plain static file server. The output
+of a request with fingerprint `f` in realm `r` is described by the small
+JSON file `<url>/r/f.json`, which contains the SHA-256 hash of the
+content, its size, and the metadata of the output. The content itself is
+stored under its hash as `<url>/blobs/<hash[:2]>/<hash>`. Downloaded content
+is only used if its hash matches. Uploading new outputs via `PUT` requests
+is opt-in, so that only trusted machines can fill the cache.
+"""
+import json
+from contextlib import suppress
+from os import close as os_close
+from os import remove as os_remove
+from os.path import dirname, getsize
+from string import hexdigits
+from tempfile import mkstemp
+from typing import IO, Any, Final, Mapping
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from pycommons.io.console import logger
+from pycommons.io.path import Path
+from pycommons.net.url import URL
+
+from texgit.repository.file_manager import file_hash, replace_if_changed
+
+#: the default timeout for requests to a remote cache, in seconds
+REMOTE_TIMEOUT: Final[int] = 60
+#: the size of the chunks in which content is transferred
+_CHUNK: Final[int] = 1 << 20
+
+
+class CacheBackend:
+    """A remote cache for the outputs of requests."""
+
+    def get(self, realm: str, request: str,
+            dest: Path) -> Mapping[str, Any] | None:
+        """
+        Download the output of a request, if the cache has it.
+
+        :param realm: the realm of the output
+        :param request: the fingerprint of the request
+        :param dest: the file to which the output is written
+        :return: the metadata of the output, or `None` if the cache does not
+            have it, in which case `dest` is not changed
+        """
+        raise NotImplementedError
+
+    def put(self, realm: str, request: str, path: Path,
+            meta: Mapping[str, Any]) -> None:
+        """
+        Upload the output of a request, if uploading is enabled.
+
+        :param realm: the realm of the output
+        :param request: the fingerprint of the request
+        :param path: the file with the output
+        :param meta: the metadata of the output
+        """
+        raise NotImplementedError
+
+
+def _is_valid_info(info: Any) -> bool:
+    """
+    Check whether the description of an output is valid.
+
+    :param info: the parsed description
+    :return: `True` if the description is a map with the SHA-256 hash of the
+        content and optional metadata, `False` otherwise
+
+    >>> _is_valid_info({"sha256": "ab" * 32, "meta": {"name": "x"}})
+    True
+    >>> _is_valid_info({"sha256": "ab" * 32})
+    True
+    >>> _is_valid_info(["ab" * 32])
+    False
+    >>> _is_valid_info({"sha256": 12})
+    False
+    >>> _is_valid_info({"sha256": "../../etc/passwd"})
+    False
+    >>> _is_valid_info({"sha256": "ab" * 32, "meta": [1]})
+    False
+    """
+    if not isinstance(info, dict):
+        return False
+    digest: Final[Any] = info.get("sha256")
+    return isinstance(digest, str) and (str.__len__(digest) == 64) and all(
+        c in hexdigits for c in digest) and isinstance(
+        info.get("meta") or {}, dict)
+
+
+class HttpCacheBackend(CacheBackend):
+    """A remote cache on an `http(s)` server, using `GET` and `PUT`."""
+
+    def __init__(self, url: str, upload: bool = False,
+                 timeout: int = REMOTE_TIMEOUT) -> None:
+        """
+        Set up the remote cache.
+
+        :param url: the base url of the cache
+        :param upload: should new outputs be uploaded?
+        :param timeout: the timeout for each request, in seconds
+        """
+        #: the base url of the cache
+        self.url: Final[str] = URL(url)
+        #: should new outputs be uploaded?
+        self.upload: Final[bool] = upload
+        #: the timeout for each request, in seconds
+        self.__timeout: Final[int] = timeout
+
+    def __get_info(self, realm: str, request: str) -> Any:
+        """
+        Download the description of the output of a request.
+
+        :param realm: the realm of the output
+        :param request: the fingerprint of the request
+        :return: the parsed, but not yet validated description, or `None`
+            if there is none
+        """
+        try:
+            with urlopen(f"{self.url}/{realm}/{request}.json",  # nosec
+                         timeout=self.__timeout) as response:
+                return json.loads(response.read())
+        except HTTPError as he:
+            if he.code != 404:
+                logger(f"Remote cache {self.url!r} failed with {he}.")
+        except (URLError, OSError, ValueError) as ex:
+            logger(f"Remote cache {self.url!r} failed with {ex}.")
+        return None
+
+    def get(self, realm: str, request: str,
+            dest: Path) -> Mapping[str, Any] | None:
+        """
+        Download the output of a request, if the cache has it.
+
+        The content is written to a temporary file and only moved to `dest`
+        if its hash matches the hash in the description of the output and
+        it differs from the current content of `dest`.
+
+        :param realm: the realm of the output
+        :param request: the fingerprint of the request
+        :param dest: the file to which the output is written
+        :return: the metadata of the output, or `None` if the cache does not
+            have it, in which case `dest` is not changed
+        """
+        info: Final[Any] = self.__get_info(realm, request)
+        if info is None:
+            return None
+        if not _is_valid_info(info):
+            logger(f"Remote cache {self.url!r} has an invalid description of "
+                   f"{request!r} of realm {realm!r}.")
+            return None
+        digest: Final[str] = info["sha256"]
+        handle, temp = mkstemp(prefix=".", suffix=".tmp", dir=dirname(dest))
+        os_close(handle)
+        error: str | None = None
+        try:
+            with (urlopen(f"{self.url}/blobs/{digest[:2]}/{digest}",  # nosec
+                          timeout=self.__timeout) as response,
+                  open(temp, "wb") as output):
+                while chunk := response.read(_CHUNK):
+                    output.write(chunk)
+        except (URLError, OSError) as ex:
+            error = str(ex)
+        if (error is None) and (file_hash(temp) != digest):
+            error = f"content does not match hash {digest!r}"
+        if error is not None:
+            logger(f"Could not download {request!r} of realm {realm!r} from "
+                   f"remote cache {self.url!r}: {error}.")
+            with suppress(FileNotFoundError):
+                os_remove(temp)
+            return None
+        replace_if_changed(temp, dest)
+        logger(f"Downloaded {request!r} of realm {realm!r} from remote "
+               f"cache {self.url!r}.")
+        return info.get("meta") or {}
+
+    def __put(self, url: str, data: bytes | IO[bytes], size: int) -> None:
+        """
+        Upload data via a `PUT` request.
+
+        :param url: the url
+        :param data: the data, or a stream with the data
+        :param size: the number of bytes to upload
+        """
+        with urlopen(Request(url, data, {  # nosec
+                "Content-Length": str(size)}, method="PUT"),
+                timeout=self.__timeout):
+            pass
+
+    def put(self, realm: str, request: str, path: Path,
+            meta: Mapping[str, Any]) -> None:
+        """
+        Upload the output of a request, if uploading is enabled.
+
+        The content is uploaded before its description, so that no other
+        machine ever sees a description without content.
+
+        :param realm: the realm of the output
+        :param request: the fingerprint of the request
+        :param path: the file with the output
+        :param meta: the metadata of the output
+        """
+        if not self.upload:
+            return
+        digest: Final[str] = file_hash(path)
+        size: Final[int] = getsize(path)
+        info: Final[bytes] = json.dumps({
+            "sha256": digest, "size": size, "meta": dict(meta)}).encode()
+        try:
+            with open(path, "rb") as stream:
+                self.__put(f"{self.url}/blobs/{digest[:2]}/{digest}", stream,
+                           size)
+            self.__put(f"{self.url}/{realm}/{request}.json", info,
+                       bytes.__len__(info))
+        except (URLError, OSError) as ex:
+            logger(f"Could not upload {request!r} of realm {realm!r} to "
+                   f"remote cache {self.url!r}: {ex}.")
+            return
+        logger(f"Uploaded {request!r} of realm {realm!r} to remote cache "
+               f"{self.url!r}.")
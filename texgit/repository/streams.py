@@ -0,0 +1,343 @@
+"""
+Stream the output of processes in bounded memory.
+
+:func:`stream_pipeline` executes a pipeline of
+:class:`~pycommons.processes.shell.Command` instances and in-process
+functions and yields the `stdout` of its last stage as text in chunks while
+the processes are still running, instead of capturing the complete output
+as a single string. :func:`limit_chunks` aborts a stream of
+chunks that exceeds a maximum size and :func:`split_lines` turns a stream of
+chunks into a stream of lines. Together, they allow the output of a process
+to be post-processed line by line and written to a file without ever
+holding more than a single line in memory.
+
+The resources used by the stages of a pipeline, i.e., their CPU time and
+their peak memory, can be collected via :func:`add_usage`.
+"""
+import os
+from codecs import getincrementaldecoder
+from contextlib import suppress
+from signal import SIGKILL, SIGPIPE
+from subprocess import DEVNULL, PIPE, Popen  # nosec
+from threading import Thread, Timer
+from time import thread_time
+from typing import IO, Callable, Final, Generator, Iterable
+
+from pycommons.io.console import logger
+from pycommons.io.path import UTF8
+from pycommons.processes.shell import Command
+
+#: the number of bytes or characters processed at once
+CHUNK_SIZE: Final[int] = 1 << 16
+#: the default maximum number of characters that a command may output
+MAX_OUTPUT: Final[int] = 1 << 28
+
+
+def read_chunks(path: str) -> Generator[str, None, None]:
+    """
+    Read a text file in chunks.
+
+    :param path: the path to the file
+    :return: the generator of chunks
+    """
+    with open(path, encoding=UTF8, errors="strict") as stream:
+        while chunk := stream.read(CHUNK_SIZE):
+            yield chunk
+
+
+def limit_chunks(chunks: Iterable[str], max_output: int,
+                 what: object) -> Generator[str, None, None]:
+    """
+    Abort a stream of chunks if it exceeds a maximum size.
+
+    :param chunks: the chunks
+    :param max_output: the maximum number of characters
+    :param what: the producer of the chunks, for the error message
+    :return: the generator of chunks
+    :raises ValueError: if the chunks exceed `max_output` characters
+
+    >>> list(limit_chunks(["ab", "cd"], 4, "x"))
+    ['ab', 'cd']
+    >>> list(limit_chunks(["ab", "cd"], 3, "x"))
+    Traceback (most recent call last):
+    ...
+    ValueError: 'x' produced more than 3 characters of output.
+    """
+    total: int = 0
+    for chunk in chunks:
+        total += str.__len__(chunk)
+        if total > max_output:
+            raise ValueError(f"{str(what)!r} produced more than {max_output} "
+                             "characters of output.")
+        yield chunk
+
+
+def split_lines(chunks: Iterable[str]) -> Generator[str, None, None]:
+    r"""
+    Split a stream of chunks into lines, just like :meth:`str.splitlines`.
+
+    :param chunks: the chunks
+    :return: the generator of lines, without line terminators
+
+    >>> list(split_lines(["a\nb", "c\r", "\nd\n\n", "e"]))
+    ['a', 'bc', 'd', '', 'e']
+    >>> list(split_lines(["a\n"]))
+    ['a']
+    >>> list(split_lines([]))
+    []
+    """
+    rest: str = ""
+    for chunk in chunks:
+        lines: list[str] = str.splitlines(rest + chunk, True)
+        # The last line may continue in the next chunk, even if it ends
+        # with "\r" and the next chunk starts with "\n".
+        rest = lines.pop() if lines else ""
+        for line in lines:
+            yield str.splitlines(line)[0]
+    if rest:
+        yield str.splitlines(rest)[0]
+
+
+def add_usage(usage: dict[str, float], user: float, system: float,
+              maxrss: int) -> None:
+    """
+    Add the resources used by a process or function to a usage record.
+
+    The CPU times are summed up, the peak memory is the maximum, as the
+    stages of a pipeline run concurrently in separate processes.
+
+    :param usage: the usage record, with the keys `user` and `system` for
+        the CPU seconds and `maxrss` for the peak memory in bytes
+    :param user: the user CPU seconds
+    :param system: the system CPU seconds
+    :param maxrss: the peak resident set size in bytes
+
+    >>> u = {}
+    >>> add_usage(u, 1.0, 0.5, 100)
+    >>> add_usage(u, 2.0, 0.25, 50)
+    >>> u
+    {'user': 3.0, 'system': 0.75, 'maxrss': 100}
+    """
+    usage["user"] = usage.get("user", 0.0) + user
+    usage["system"] = usage.get("system", 0.0) + system
+    usage["maxrss"] = max(usage.get("maxrss", 0), maxrss)
+
+
+def _decode(stream: IO[bytes]) -> Generator[str, None, None]:
+    """
+    Decode a binary stream in chunks.
+
+    :param stream: the stream
+    :return: the generator of the chunks of text
+    """
+    decoder: Final = getincrementaldecoder(UTF8)(errors="strict")
+    while data := stream.read(CHUNK_SIZE):
+        yield decoder.decode(data)
+    yield decoder.decode(b"", True)
+
+
+def _feed(stream: IO[bytes], data: str) -> None:
+    """
+    Write the text for `stdin` to a process and close the stream.
+
+    :param stream: the `stdin` of the process
+    :param data: the text to write
+    """
+    with suppress(OSError, ValueError), stream:
+        stream.write(data.encode())
+
+
+def _collect(stream: IO[bytes] | None, stdin_file: str | None,
+             text: str | None, max_output: int, what: object) -> str | None:
+    """
+    Collect the input of a function in a pipeline.
+
+    :param stream: the `stdout` of the preceding process, or `None`
+    :param stdin_file: the file attached to `stdin`, or `None`
+    :param text: the text for `stdin` otherwise
+    :param max_output: the maximum number of characters read from `stream`
+    :param what: the function, for error messages
+    :return: the input text
+    """
+    if stream is not None:
+        return "".join(limit_chunks(_decode(stream), max_output, what))
+    if stdin_file is not None:
+        return "".join(read_chunks(stdin_file))
+    return text
+
+
+class _Process:
+    """A process running as a stage of a pipeline."""
+
+    def __init__(self, command: Command, stdin: int | IO[bytes] | None,
+                 text: str | None) -> None:
+        """
+        Start the process.
+
+        :param command: the command
+        :param stdin: the file descriptor or stream to attach to `stdin`, or
+            `None`
+        :param text: the text to write to `stdin` if `stdin` is `None`, or
+            `None` to let the process inherit our `stdin`
+        """
+        logger(f"Now invoking {command}.")
+        #: the command
+        self.command: Final[Command] = command
+        #: the user and system CPU seconds and the peak memory in bytes of
+        #: the process, once it has ended
+        self.usage: tuple[float, float, int] | None = None
+        #: the process
+        self.process: Final[Popen] = Popen(  # nosec # pylint: disable=R1732
+            command.command, cwd=command.working_dir, stderr=DEVNULL,
+            stdin=stdin if (stdin is not None) or (text is None) else PIPE,
+            stdout=PIPE,
+            env=None if command.env is None else dict(command.env))
+        #: the timer killing the process after the timeout
+        self.__timer: Final[Timer] = Timer(command.timeout, self.__kill)
+        self.__timer.daemon = True
+        self.__timer.start()
+        if (stdin is None) and (text is not None):
+            Thread(target=_feed, args=(self.process.stdin, text),
+                   daemon=True).start()
+
+    def __kill(self) -> None:
+        """
+        Kill the process.
+
+        Only :meth:`stop` reaps the process, so it cannot have been replaced
+        by another process with the same id before.
+        """
+        with suppress(ProcessLookupError):
+            os.kill(self.process.pid, SIGKILL)
+
+    def stop(self, kill: bool, last: bool) -> str | None:
+        """
+        Wait for the process to end.
+
+        :param kill: should the process be killed if it still runs?
+        :param last: is this the last stage of the pipeline?
+        :return: the error message if the process failed, or `None`
+        """
+        if kill:
+            self.__kill()
+        # We reap the process ourselves to get its resource usage.
+        _, status, rusage = os.wait4(self.process.pid, 0)
+        # ru_maxrss is in KiB on Linux
+        self.usage = rusage.ru_utime, rusage.ru_stime, rusage.ru_maxrss * 1024
+        returncode: Final[int] = os.waitstatus_to_exitcode(status)
+        self.process.returncode = returncode
+        timed_out: Final[bool] = not self.__timer.is_alive()
+        self.__timer.cancel()
+        if timed_out:
+            return f"{self.command} timed out after {self.command.timeout}s."
+        # A stage whose successor stopped reading early dies from SIGPIPE,
+        # just like in a shell pipeline, which is not an error.
+        if (returncode != 0) and (last or (returncode != -SIGPIPE)):
+            return f"{self.command} yields return code {returncode}."
+        return None
+
+
+def stream_pipeline(stages: list[Command | Callable[[str | None], str]],
+                    stdin_file: str | None = None,
+                    max_output: int = MAX_OUTPUT,
+                    usage: dict[str, float] | None = None) \
+        -> Generator[str, None, None]:
+    """
+    Execute a pipeline of commands and yield its `stdout` in chunks.
+
+    Each stage is either a command executed as a process or a function
+    executed in the current process, which receives the text from `stdin`
+    (or `None`) and returns the text for `stdout`. Consecutive processes are
+    connected via pipes and run concurrently. The output of a process that is
+    followed by a function is collected, which is why it may have at most
+    `max_output` characters.
+
+    The commands are executed just like
+    :meth:`~pycommons.processes.shell.Command.execute` would do, including
+    their timeouts, but the `stdout` of the last stage is decoded and yielded
+    while the processes are running. `stderr` is ignored. If the generator is
+    closed before the processes have finished, e.g., because the consumer of
+    the output raised an error, the processes are killed.
+
+    A file can be attached directly to the `stdin` of the first stage. Then,
+    a process reads the bytes of the file itself, without any copying or
+    decoding on our side. Otherwise, the `stdin` of the first command is
+    used.
+
+    If a `usage` record is given, the resources used by the processes are
+    added to it via :func:`add_usage`, as well as the CPU time spent in the
+    functions.
+
+    :param stages: the stages of the pipeline
+    :param stdin_file: the file to attach to `stdin`, or `None`
+    :param max_output: the maximum number of characters passed from a
+        process to a function
+    :param usage: the usage record to update, or `None`
+    :return: the generator of the chunks of the output
+    :raises ValueError: if any stage times out or fails
+    """
+    processes: Final[list[_Process]] = []
+    attach: int | None = None if stdin_file is None \
+        else os.open(stdin_file, os.O_RDONLY)
+    text: str | None = stages[0].stdin if (attach is None) and isinstance(
+        stages[0], Command) else None
+    stream: IO[bytes] | None = None
+    complete: bool = False
+    cpu: float = 0.0  # the CPU time spent in the functions
+    try:
+        for stage in stages:
+            if isinstance(stage, Command):
+                processes.append(_Process(stage, stream if stream is not None
+                                          else attach, text))
+            else:
+                cpu -= thread_time()
+                text = stage(_collect(stream, None if attach is None
+                                      else stdin_file, text, max_output,
+                                      stage))
+                cpu += thread_time()
+            if stream is not None:
+                stream.close()  # the next process has its own copy
+            if attach is not None:
+                os.close(attach)
+                attach = None
+            stream = processes[-1].process.stdout \
+                if isinstance(stage, Command) else None
+        if stream is None:
+            complete = True
+            yield text or ""
+        else:
+            yield from _decode(stream)
+            complete = True
+    finally:
+        if attach is not None:
+            os.close(attach)
+        if stream is not None:
+            stream.close()
+        errors: Final[list[str]] = [e for e in (p.stop(
+            not complete, p.command is stages[-1]) for p in processes)
+            if e is not None]
+    if usage is not None:
+        add_usage(usage, cpu, 0.0, 0)
+        for p in processes:
+            if p.usage is not None:
+                add_usage(usage, *p.usage)
+    if errors:
+        raise ValueError(errors[0])
+    logger(f"Finished executing pipeline of {list.__len__(stages)} "
+           "stage(s) with return code 0.")
+
+
+def stream_command(command: Command, stdin_file: str | None = None) \
+        -> Generator[str, None, None]:
+    """
+    Execute a command and yield its `stdout` in chunks.
+
+    This is a pipeline with a single stage, see :func:`stream_pipeline`.
+
+    :param command: the command
+    :param stdin_file: the file to attach to `stdin`, or `None` to use the
+        `stdin` of the command
+    :return: the generator of the chunks of the output
+    :raises ValueError: if the command times out or fails
+    """
+    return stream_pipeline([command], stdin_file)
@@ -0,0 +1,100 @@
+"""
+Virtual environments for executing the Python scripts of repositories.
+
+Scripts in a repository often need packages that are listed in the
+`requirements.txt` file at the root of the repository. Instead of
+installing all of them into the interpreter running `texgit`, a
+:class:`~texgit.repository.process_manager.ProcessManager` can create a
+virtual environment for each distinct requirements file and execute the
+`python3` commands of the repository with the interpreter of that
+environment.
+
+Creating an environment is expensive, so the environments are cached under
+a key derived from the contents of the requirements file, the Python
+version, and the source of the packages, see :func:`venv_key`. All
+repositories with the same requirements therefore share one environment.
+The packages can be installed from a local directory of wheels, the
+wheelhouse, without any network access, or from a package index.
+"""
+import sys
+from os.path import isdir, isfile, join
+from typing import Final
+
+from pycommons.io.console import logger
+from pycommons.io.path import Path
+from pycommons.processes.python import PYTHON_ENV, PYTHON_INTERPRETER
+from pycommons.processes.shell import Command
+
+from texgit.repository.file_manager import file_hash, fingerprint
+
+#: the name of the requirements file at the root of a repository
+REQUIREMENTS_FILE: Final[str] = "requirements.txt"
+
+
+def find_requirements(repo_dir: str) -> Path | None:
+    """
+    Find the requirements file of a repository.
+
+    :param repo_dir: the root directory of the repository
+    :return: the requirements file, or `None` if there is none
+
+    >>> from pycommons.io.temp import temp_dir
+    >>> with temp_dir() as td:
+    ...     print(find_requirements(td))
+    ...     td.resolve_inside("requirements.txt").write_all_str("numpy")
+    ...     print(find_requirements(td) == join(td, "requirements.txt"))
+    None
+    True
+    """
+    path: Final[str] = join(repo_dir, REQUIREMENTS_FILE)
+    return Path(path) if isfile(path) else None
+
+
+def venv_key(requirements: str, source: str | None) -> str:
+    """
+    Get the key of the environment for a requirements file.
+
+    :param requirements: the requirements file
+    :param source: the wheelhouse directory or the url of the package
+        index, or `None` for the default index
+    :return: the key
+    """
+    return fingerprint(("venv", file_hash(requirements), sys.version,
+                        source))
+
+
+def venv_python(venv_dir: str) -> Path:
+    """
+    Get the Python interpreter of a virtual environment.
+
+    :param venv_dir: the directory of the environment
+    :return: the interpreter
+    """
+    return Path(join(venv_dir, "bin", "python3"))
+
+
+def create_venv(dest: str, requirements: str, source: str | None) -> None:
+    """
+    Create a virtual environment and install the requirements into it.
+
+    :param dest: the directory of the environment, which must be empty
+    :param requirements: the requirements file
+    :param source: the wheelhouse directory, i.e., a directory with wheels
+        to install without accessing the network, or the url of a package
+        index, or `None` for the default index
+    :raises ValueError: if the environment cannot be created or the
+        requirements cannot be installed
+    """
+    logger(f"Creating virtual environment {dest!r} for {requirements!r}.")
+    # The interpreter is copied, as commands resolve symbolic links and
+    # would then execute the interpreter outside of the environment.
+    Command([PYTHON_INTERPRETER, "-m", "venv", "--copies", dest],
+            working_dir=dest).execute(True)
+    args: list[str] = [
+        venv_python(dest), "-m", "pip", "install", "--no-input",
+        "--disable-pip-version-check", "-r", requirements]
+    if source is not None:
+        args.extend(("--no-index", "--find-links", source) if isdir(
+            source) else ("--index-url", source))
+    Command(args, working_dir=dest, env=PYTHON_ENV).execute(True)
+    logger(f"Finished creating virtual environment {dest!r}.")
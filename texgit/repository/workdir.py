@@ -0,0 +1,192 @@
+"""
+Isolated working directories for executing commands inside repositories.
+
+Commands executed inside a repository may write scratch files into it. If
+two commands run concurrently in the same clone, they can clobber each
+other's files, and the clone itself no longer matches its commit. An
+isolated working directory is a lightweight view of the repository in which
+a command can do whatever it wants: Its directory tree is re-created, but
+the files are not copied if possible. Instead, each file is a reflink of
+the original, i.e., a copy-on-write clone that shares its data blocks, if
+the file system supports it (e.g., `btrfs` or `xfs`). Otherwise, the file
+is either copied (mode :data:`VIEW_COPY`, the default) or hard-linked
+(mode :data:`VIEW_LINK`).
+
+Creating, deleting, or replacing files in a view never affects the
+original. Hard-linked files share their contents with the original, though,
+so they must not be modified in place. Mode :data:`VIEW_LINK` thus saves
+space and time, but is only safe for commands that never overwrite existing
+files of the repository. The `.git` directory is part of the view, too, so
+that `git` commands changing the index or the references only change the
+view. `git` appends to some of its files in place, e.g., to the reflogs in
+`.git/logs`, and overwrites others, e.g., `FETCH_HEAD`. Therefore, only the
+immutable objects in `.git/objects` are hard-linked in mode
+:data:`VIEW_LINK`, all other files in `.git` are copied.
+"""
+from contextlib import contextmanager, suppress
+from fcntl import ioctl
+from functools import partial
+from os import O_CREAT, O_EXCL, O_RDONLY, O_WRONLY, link
+from os import close as os_close
+from os import open as os_open
+from os import remove as os_remove
+from os.path import join
+from shutil import copy2, copystat, copytree
+from typing import Final, Generator
+
+from pycommons.io.path import Path, delete_path
+
+#: the `ioctl` request for cloning a file on Linux
+_FICLONE: Final[int] = 0x40049409
+#: create views whose files are reflinks or hard links
+VIEW_LINK: Final[str] = "link"
+#: create views whose files are reflinks or copies
+VIEW_COPY: Final[str] = "copy"
+#: the modes for creating views
+VIEW_MODES: Final[tuple[str, ...]] = (VIEW_LINK, VIEW_COPY)
+
+
+def _reflink(src: str, dest: str) -> None:
+    """
+    Create a copy-on-write clone of a file.
+
+    :param src: the source file
+    :param dest: the destination file, which must not exist
+    :raises OSError: if the file system does not support reflinks
+    """
+    source: Final[int] = os_open(src, O_RDONLY)
+    try:
+        target: int = os_open(dest, O_WRONLY | O_CREAT | O_EXCL, 0o600)
+        try:
+            ioctl(target, _FICLONE, source)
+        except OSError:
+            os_close(target)
+            os_remove(dest)
+            raise
+        os_close(target)
+    finally:
+        os_close(source)
+    copystat(src, dest)
+
+
+def clone_file(src: str, dest: str, hard_link: bool = True) -> str:
+    """
+    Create a lightweight copy of a file.
+
+    The copy is a reflink if possible, otherwise a hard link if allowed,
+    otherwise a real copy.
+
+    :param src: the source file
+    :param dest: the destination file, which must not exist
+    :param hard_link: may the file be hard-linked?
+    :return: the destination file
+
+    >>> from os import stat
+    >>> from pycommons.io.temp import temp_dir
+    >>> with temp_dir() as td:
+    ...     td.resolve_inside("a").write_all_str("x")
+    ...     _ = clone_file(td.resolve_inside("a"), td.resolve_inside("b"),
+    ...                    False)
+    ...     print(td.resolve_inside("b").read_all_str())
+    ...     print(stat(td.resolve_inside("b")).st_nlink)
+    x
+    <BLANKLINE>
+    1
+    """
+    with suppress(OSError):
+        _reflink(src, dest)
+        return dest
+    if hard_link:
+        with suppress(OSError):
+            link(src, dest)
+            return dest
+    copy2(src, dest)
+    return dest
+
+
+def _clone_into_view(git_dir: str, src: str, dest: str,
+                     hard_link: bool = True) -> str:
+    """
+    Create a lightweight copy of a file of a view.
+
+    Of the files in the `.git` directory, only the objects may be
+    hard-linked.
+
+    :param git_dir: the `.git` directory of the source tree
+    :param src: the source file
+    :param dest: the destination file, which must not exist
+    :param hard_link: may files outside of the `.git` directory be
+        hard-linked?
+    :return: the destination file
+
+    >>> from os import stat
+    >>> from pycommons.io.temp import temp_dir
+    >>> with temp_dir() as td:
+    ...     logs = td.resolve_inside(".git/logs")
+    ...     logs.ensure_dir_exists()
+    ...     logs.resolve_inside("HEAD").write_all_str("x")
+    ...     _ = _clone_into_view(td.resolve_inside(".git"),
+    ...                          logs.resolve_inside("HEAD"),
+    ...                          td.resolve_inside("HEAD"))
+    ...     print(stat(td.resolve_inside("HEAD")).st_nlink)
+    1
+    """
+    return clone_file(src, dest, hard_link and (
+        (not src.startswith(f"{git_dir}/")) or src.startswith(
+            f"{git_dir}/objects/")))
+
+
+def make_view(src: str, dest: str, mode: str = VIEW_COPY) -> None:
+    """
+    Create a lightweight view of a directory tree.
+
+    :param src: the source directory
+    :param dest: the destination directory, which must not exist
+    :param mode: the mode, either :data:`VIEW_LINK` or :data:`VIEW_COPY`
+    """
+    if mode not in VIEW_MODES:
+        raise ValueError(f"Invalid view mode {mode!r}, must be one of "
+                         f"{VIEW_MODES!r}.")
+    copytree(src, dest, symlinks=True, copy_function=partial(
+        _clone_into_view, join(src, ".git"), hard_link=mode == VIEW_LINK))
+
+
+@contextmanager
+def isolated_dir(src: str, dest: str,
+                 mode: str = VIEW_COPY) -> Generator[Path, None, None]:
+    """
+    Provide a temporary, isolated view of a directory tree.
+
+    The view is deleted when the context is left.
+
+    :param src: the source directory
+    :param dest: the directory for the view, which is deleted first if it
+        already exists, e.g., after a crash
+    :param mode: the mode, either :data:`VIEW_LINK` or :data:`VIEW_COPY`
+    :return: the view
+
+    >>> from os import scandir
+    >>> from pycommons.io.temp import temp_dir
+    >>> with temp_dir() as td:
+    ...     src = td.resolve_inside("src")
+    ...     src.ensure_dir_exists()
+    ...     src.resolve_inside("a.txt").write_all_str("x")
+    ...     with isolated_dir(src, td.resolve_inside("view")) as view:
+    ...         os_remove(view.resolve_inside("a.txt"))
+    ...         view.resolve_inside("b.txt").write_all_str("y")
+    ...         print(sorted(p.name for p in scandir(view)))
+    ...     print(sorted(p.name for p in scandir(src)), view.exists())
+    ...     print(src.resolve_inside("a.txt").read_all_str())
+    ['b.txt']
+    ['a.txt'] False
+    x
+    <BLANKLINE>
+    """
+    view: Final[Path] = Path(dest)
+    if view.exists():
+        delete_path(view)
+    make_view(src, view, mode)
+    try:
+        yield view
+    finally:
+        delete_path(view)
@@ -1,15 +1,23 @@
 """Process a LaTeX aux file."""
 import argparse
 from os.path import dirname, getsize
-from typing import Final, Generator
+from typing import Any, Final, Generator, Iterable, Mapping
 
 from pycommons.io.arguments import make_argparser, make_epilog
 from pycommons.io.console import logger
 from pycommons.io.path import Path, directory_path, write_lines
 from pycommons.strings.string_tools import escape, unescape
 
+from texgit.repository.file_manager import (
+    FAILURE_TTL,
+    default_store_dir,
+    write_if_changed,
+)
 from texgit.repository.git_manager import GitPath
 from texgit.repository.process_manager import ProcessManager
+from texgit.repository.remote_cache import CacheBackend, HttpCacheBackend
+from texgit.repository.streams import MAX_OUTPUT
+from texgit.repository.workdir import VIEW_COPY, VIEW_MODES
 from texgit.version import __version__
 
 #: the header for git file requests
@@ -18,6 +26,8 @@ REQUEST_GIT_FILE: Final[str] = r"\@texgit@gitFile"
 REQUEST_ARG_FILE: Final[str] = r"\@texgit@argFile"
 #: the header for process result requests
 REQUEST_PROCESS: Final[str] = r"\@texgit@process"
+#: the default number of costliest commands listed after a run
+USAGE_TOP: Final[int] = 10
 #: the forbidden line marker that needs to be purged
 FORBIDDEN_LINE: Final[str] = r"\@texgit@needsTexgitPass"
 
@@ -202,7 +212,60 @@ def cmd_exec(base_dir: Path, pm: ProcessManager,
             name, cmd, repo_url, relative_dir).relative_to(base_dir))
 
 
-def run(aux_arg: str, repo_dir_arg: str = "__git__") -> None:
+def usage_summary(usage: Iterable[dict[str, Any]],
+                  top: int = USAGE_TOP) -> list[str]:
+    """
+    Summarize the resources used by the executed commands, costliest first.
+
+    The commands are sorted by the seconds they took. Each line contains
+    these seconds, the CPU seconds, the peak memory, the size of the
+    output, and the command, or its error message if it failed.
+
+    :param usage: the usage records, see
+        :meth:`~texgit.repository.process_manager.ProcessManager.get_usage`
+    :param top: the maximum number of commands to list
+    :return: the lines of the summary
+
+    >>> for s in usage_summary([
+    ...         {"command": "a", "seconds": 1.0, "user": 0.5, "system": 0.25,
+    ...          "maxrss": 2 << 20, "size": 1234},
+    ...         {"command": "b", "seconds": 2.0, "error": "b failed."},
+    ...         {"command": "c", "seconds": 0.1}], 2):
+    ...     print(s)
+    executed 3 commands in 3.100 s, peak memory 2.0 MiB, costliest first:
+      2.000 s wall    0.000 s cpu      0.0 MiB rss          - out  b failed.
+      1.000 s wall    0.750 s cpu      2.0 MiB rss     1234 B out  a
+    """
+    records: Final[list[dict[str, Any]]] = sorted(
+        usage, key=lambda r: -r.get("seconds", 0.0))
+    if list.__len__(records) <= 0:
+        return []
+    lines: Final[list[str]] = [(
+        f"executed {list.__len__(records)} commands in "
+        f"{sum(r.get('seconds', 0.0) for r in records):.3f} s, peak memory "
+        f"{max(r.get('maxrss', 0) for r in records) / 1048576:.1f} MiB, "
+        "costliest first:")]
+    lines.extend(
+        f"{r.get('seconds', 0.0):>7.3f} s wall "
+        f"{r.get('user', 0.0) + r.get('system', 0.0):>8.3f} s cpu "
+        f"{r.get('maxrss', 0) / 1048576:>8.1f} MiB rss "
+        f"{'-' if r.get('size') is None else str(r['size']) + ' B':>10} out  "
+        f"{r.get('error') or r['command']}" for r in records[:max(0, top)])
+    return lines
+
+
+def run(aux_arg: str, repo_dir_arg: str = "__git__",
+        failure_ttl: int = FAILURE_TTL, fetch_archives: bool = False,
+        store_dir: str | None = None,
+        backend: CacheBackend | None = None,
+        preload: Iterable[str] | None = None,
+        max_output: int = MAX_OUTPUT,
+        cache_stages: bool = False,
+        usage_top: int = USAGE_TOP,
+        isolate: str | None = None,
+        venvs: bool = False,
+        venv_source: str | None = None,
+        mirrors: Mapping[str, Iterable[str]] | None = None) -> None:
     """
     Execute the `texgit` tool.
 
@@ -211,6 +274,32 @@ def run(aux_arg: str, repo_dir_arg: str = "__git__") -> None:
 
     :param aux_arg: the `aux` file argument
     :param repo_dir_arg: the repository directory argument
+    :param failure_ttl: the number of seconds for which failed requests are
+        not retried, `0` to retry them in any case
+    :param fetch_archives: fetch snapshot archives of new repositories
+        instead of cloning them
+    :param store_dir: the directory of a store shared with other projects,
+        or `None` for no shared store
+    :param backend: the remote cache for the outputs of commands, or `None`
+    :param preload: the modules to preload in a fork server executing the
+        `python3` commands, or `None` to execute them as new processes
+    :param max_output: the maximum number of characters that a command may
+        output
+    :param cache_stages: should the outputs of the first stages of
+        pipelines be cached?
+    :param usage_top: the number of costliest commands to list in the
+        summary of the used resources, see :func:`usage_summary`
+    :param isolate: the mode of the isolated views of the repositories in
+        which commands are executed, or `None` to execute them directly in
+        the repositories
+    :param venvs: should `python3` commands be executed in virtual
+        environments with the requirements of their repositories?
+    :param venv_source: the wheelhouse directory or package index url from
+        which the requirements are installed, or `None` for the default
+        index
+    :param mirrors: a mapping of repository urls to alternative urls or
+        paths of the same repositories, which are tried if a clone makes no
+        progress, or `None` for no mirrors
     """
     aux_file: Path = Path(aux_arg)
     if not aux_file.is_file():
@@ -250,7 +339,14 @@ def run(aux_arg: str, repo_dir_arg: str = "__git__") -> None:
             if pm is None:
                 git_dir: Path = base_dir.resolve_inside(repo_dir_arg)
                 logger(f"The repository directory is {git_dir!r}.")
-                pm = ProcessManager(git_dir)
+                pm = ProcessManager(git_dir, failure_ttl,
+                                    fetch_archives=fetch_archives,
+                                    store_dir=store_dir, backend=backend,
+                                    preload=preload, max_output=max_output,
+                                    cache_stages=cache_stages,
+                                    isolate=isolate, venvs=venvs,
+                                    venv_source=venv_source,
+                                    mirrors=mirrors)
 
             func = str.strip(request[0])
             if func == REQUEST_GIT_FILE:
@@ -264,6 +360,8 @@ def run(aux_arg: str, repo_dir_arg: str = "__git__") -> None:
             resolved += 1
     finally:
         if pm is not None:
+            for usage_line in usage_summary(pm.get_usage(), usage_top):
+                logger(usage_line)
             pm.close()
             del pm
 
@@ -275,7 +373,7 @@ def run(aux_arg: str, repo_dir_arg: str = "__git__") -> None:
     for app in map(str.strip, append):  # make the texgit invocation idempotent
         if app and (app not in stripped_lines):
             lines.append(app)
-    with aux_file.open_for_write() as wd:
+    with write_if_changed(aux_file) as wd:
         write_lines(lines, wd)
     logger(f"Finished flushing {len(lines)} lines to aux file {aux_file!r}.")
 
@@ -296,7 +394,70 @@ if __name__ == "__main__":
     parser.add_argument(
         "--repoDir", help="the directory to use for caching output",
         type=str, default="__git__", nargs="?")
+    parser.add_argument(
+        "--failureTtl", help="the seconds for which failed clones and "
+        "commands are not retried", type=int, default=FAILURE_TTL)
+    parser.add_argument(
+        "--retryFailed", "--retry-failed", help="retry failed clones and "
+        "commands even if they failed recently", action="store_true")
+    parser.add_argument(
+        "--fetchArchives", help="download snapshot archives of new "
+        "repositories instead of cloning them", action="store_true")
+    parser.add_argument(
+        "--store", help="share clones and outputs with other projects via "
+        f"a store in this directory, by default {default_store_dir()!r}",
+        type=str, default=None, nargs="?", const=default_store_dir())
+    parser.add_argument(
+        "--remoteCache", help="the url of a remote cache from which the "
+        "outputs of commands are downloaded", type=str, default=None)
+    parser.add_argument(
+        "--remoteCacheUpload", help="upload the outputs of executed "
+        "commands to the remote cache", action="store_true")
+    parser.add_argument(
+        "--forkServer", help="execute python3 commands in forks of a "
+        "warm interpreter which has imported the given modules",
+        type=str, default=None, nargs="*", metavar="MODULE")
+    parser.add_argument(
+        "--maxOutput", help="the maximum number of characters that a "
+        "command may output", type=int, default=MAX_OUTPUT)
+    parser.add_argument(
+        "--usageTop", help="the number of costliest commands to list in the "
+        "summary of the used resources", type=int, default=USAGE_TOP)
+    parser.add_argument(
+        "--isolate", help="execute each command in its own view of the "
+        "repository, whose files are reflinks or copies ('copy', the "
+        "default) or reflinks or hard links ('link')", type=str,
+        default=None, nargs="?", const=VIEW_COPY, choices=VIEW_MODES)
+    parser.add_argument(
+        "--venvs", help="execute the python3 commands of repositories with a "
+        "requirements.txt in cached virtual environments",
+        action="store_true")
+    parser.add_argument(
+        "--venvSource", help="the wheelhouse directory or the package index "
+        "url from which the requirements are installed", type=str,
+        default=None)
+    parser.add_argument(
+        "--cacheStages", help="cache the outputs of the first stages of "
+        "pipelines, so that pipelines starting with them can share them",
+        action="store_true")
+    parser.add_argument(
+        "--mirror", help="an alternative url or path of a repository, which "
+        "is cloned if cloning the repository makes no progress",
+        type=str, nargs=2, action="append", default=[],
+        metavar=("URL", "MIRROR"))
     args: Final[argparse.Namespace] = parser.parse_args()
 
-    run(args.aux.strip(), args.repoDir.strip())
+    repo_mirrors: Final[dict[str, list[str]]] = {}
+    for url, mirror in args.mirror:
+        repo_mirrors.setdefault(url.strip(), []).append(mirror.strip())
+
+    run(args.aux.strip(), args.repoDir.strip(),
+        0 if args.retryFailed else args.failureTtl, args.fetchArchives,
+        None if args.store is None else args.store.strip(),
+        None if args.remoteCache is None else HttpCacheBackend(
+            args.remoteCache.strip(), args.remoteCacheUpload),
+        args.forkServer, args.maxOutput, args.cacheStages, args.usageTop,
+        args.isolate, args.venvs,
+        None if args.venvSource is None else args.venvSource.strip(),
+        repo_mirrors)
     logger("All done.")